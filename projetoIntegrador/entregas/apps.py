@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EntregasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'entregas'
+
+    def ready(self):
+        # registra os signals de invalidação do cache do dashboard
+        from . import signals  # noqa: F401
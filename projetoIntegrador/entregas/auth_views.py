@@ -4,6 +4,14 @@ from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 
+from .authentication import versao_tokens
+from .idempotencia import idempotente
+
+# repetições do login só cobrem novas tentativas logo em seguida; excluir o
+# token (ou alterar o usuário) troca a versão dos tokens e as descarta
+TTL_REPETICAO_LOGIN = 5 * 60
+
+
 class CustomAuthToken(ObtainAuthToken):
 
     @extend_schema(
@@ -29,6 +37,7 @@ class CustomAuthToken(ObtainAuthToken):
         },
         description="Autenticação de usuário e geração de token"
     )
+    @idempotente(ttl=TTL_REPETICAO_LOGIN, versao=versao_tokens)
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
@@ -0,0 +1,126 @@
+"""
+Autenticação por token com cache.
+
+O TokenAuthentication do DRF consulta Token + User a cada requisição, e as
+permissões/querysets ainda perguntam hasattr(user, "motorista") e
+hasattr(user, "cliente"), uma consulta cada. Aqui o token resolve, pelo
+cache, o usuário e o seu Papel já calculado; com o cache quente a
+autenticação não faz nenhuma consulta.
+
+As entradas ficam sob uma versão global, trocada pelos signals quando um
+token é excluído ou um usuário/motorista/cliente muda (signals.py). A
+versão fica em um backend compartilhado entre os processos ("arquivo" por
+padrão, em ENTREGAS_CACHE_TOKENS["VERSAO"]): a exclusão feita em um worker
+derruba o token em cache em todos, mesmo com as entradas em memória.
+"""
+import copy
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import criar_cache
+from .models import Cliente, Motorista
+
+
+# ============================
+# PAPEL DO USUÁRIO
+# ============================
+@dataclass(frozen=True)
+class Papel:
+    admin: bool = False
+    motorista_id: Optional[str] = None     # cpf do motorista vinculado
+    cliente_id: Optional[str] = None       # cpf_cliente do cliente vinculado
+
+    @property
+    def motorista(self):
+        return self.motorista_id is not None
+
+    @property
+    def cliente(self):
+        return self.cliente_id is not None
+
+
+def calcular_papel(user):
+    if not user.is_authenticated:
+        return Papel()
+    return Papel(
+        admin=user.is_staff,
+        motorista_id=Motorista.objects.filter(user=user).values_list("cpf", flat=True).first(),
+        cliente_id=Cliente.objects.filter(user=user).values_list("cpf_cliente", flat=True).first(),
+    )
+
+
+def papel_do_usuario(user):
+    """Papel do usuário: o do cache de tokens ou, em outras autenticações, calculado uma vez por requisição"""
+    papel = getattr(user, "papel", None)
+    if papel is None:
+        papel = calcular_papel(user)
+        if user.is_authenticated:
+            user.papel = papel
+    return papel
+
+
+# ============================
+# CACHE DE TOKENS
+# ============================
+_cache_tokens = None
+
+
+def cache_tokens():
+    global _cache_tokens
+    if _cache_tokens is None:
+        _cache_tokens = criar_cache(getattr(settings, "ENTREGAS_CACHE_TOKENS", {}))
+    return _cache_tokens
+
+
+_cache_versao_tokens = None
+
+
+def cache_versao_tokens():
+    global _cache_versao_tokens
+    if _cache_versao_tokens is None:
+        config = getattr(settings, "ENTREGAS_CACHE_TOKENS", {})
+        _cache_versao_tokens = criar_cache(config.get("VERSAO", {"BACKEND": "arquivo"}))
+    return _cache_versao_tokens
+
+
+def _chave_token(key, versao):
+    # o token em si não vai para a chave do cache
+    return f"token:{versao}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def versao_tokens():
+    cache = cache_versao_tokens()
+    versao = cache.get("token:versao")
+    if versao is None:
+        versao = time.time_ns()
+        cache.set("token:versao", versao, ttl=0)
+    return versao
+
+
+def invalidar_tokens():
+    """Descarta todos os tokens em cache (exclusões e mudanças de perfil são raras)"""
+    cache_versao_tokens().set("token:versao", time.time_ns(), ttl=0)
+
+
+class TokenAuthenticationCache(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        cache = cache_tokens()
+        chave = _chave_token(key, versao_tokens())
+        item = cache.get(chave)
+        if item is None:
+            # token inválido ou usuário inativo: levanta AuthenticationFailed e nada é guardado
+            user, token = super().authenticate_credentials(key)
+            item = (user, token, calcular_papel(user))
+            cache.set(chave, item)
+
+        user, token, papel = item
+        # cópias: a view pode alterar ou guardar relações no usuário da requisição
+        user = copy.copy(user)
+        user.papel = papel
+        return user, copy.copy(token)
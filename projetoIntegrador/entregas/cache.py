@@ -0,0 +1,293 @@
+"""
+Caches da API, com backends intercambiáveis:
+
+- "memoria": LRU na memória do processo, com TTL (só invalida no próprio processo)
+- "arquivo": um arquivo JSON por chave em um diretório compartilhado entre
+  processos (só valores que o JSON representa)
+- "django":  qualquer cache configurado em settings.CACHES
+
+O rastreio público usa um LRU em memória próprio (ver final do arquivo).
+
+Todos expõem get/set/add/delete; em set e add, ttl=None usa o TTL padrão do
+backend e ttl=0 grava sem expiração. add só grava se a chave não existe (ou
+expirou) e diz se gravou: é a trava entre requisições concorrentes. O dashboard das rotas é guardado sob uma
+chave que inclui a versão da rota; os signals trocam essa versão sempre
+que algo exibido no dashboard muda, então uma leitura nunca devolve dados
+anteriores à última gravação. As versões ficam em um backend próprio,
+compartilhado entre os processos ("arquivo" por padrão): os dashboards
+podem ficar na memória de cada worker, mas a troca de versão feita por
+um vale para todos.
+"""
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+
+_AUSENTE = object()
+
+
+# ============================
+# BACKEND: MEMÓRIA LOCAL (LRU + TTL)
+# ============================
+class CacheMemoriaLocal:
+
+    def __init__(self, tamanho_maximo=1024, ttl=None):
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self.acertos = 0
+        self.falhas = 0
+        self._itens = OrderedDict()     # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+
+    def get(self, chave, padrao=None):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or (item[0] is not None and item[0] < time.monotonic()):
+                if item is not None:
+                    del self._itens[chave]
+                self.falhas += 1
+                return padrao
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return item[1]
+
+    def set(self, chave, valor, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        expira_em = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._itens[chave] = (expira_em, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_maximo:
+                self._itens.popitem(last=False)
+
+    def add(self, chave, valor, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        expira_em = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None and (item[0] is None or item[0] >= time.monotonic()):
+                return False
+            self._itens[chave] = (expira_em, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_maximo:
+                self._itens.popitem(last=False)
+            return True
+
+    def delete(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def clear(self):
+        with self._lock:
+            self._itens.clear()
+
+
+# ============================
+# BACKEND: ARQUIVOS
+# ============================
+class CacheArquivo:
+
+    def __init__(self, diretorio=None, ttl=None):
+        self.diretorio = str(diretorio or os.path.join(settings.BASE_DIR, "cache"))
+        self.ttl = ttl
+        os.makedirs(self.diretorio, mode=0o700, exist_ok=True)
+        self._verificar_diretorio()
+
+    def _verificar_diretorio(self):
+        # outro usuário que crie ou possa gravar no diretório consegue plantar respostas
+        info = os.stat(self.diretorio)
+        if hasattr(os, "getuid") and info.st_uid != os.getuid():
+            raise ImproperlyConfigured(f"Diretório de cache {self.diretorio} pertence a outro usuário")
+        if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise ImproperlyConfigured(f"Diretório de cache {self.diretorio} aceita gravação de outros usuários")
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, hashlib.sha1(chave.encode()).hexdigest())
+
+    def get(self, chave, padrao=None):
+        try:
+            with open(self._caminho(chave), encoding="utf-8") as arquivo:
+                expira_em, valor = json.load(arquivo)
+        except (OSError, ValueError):
+            return padrao
+        if expira_em is not None and expira_em < time.time():
+            self.delete(chave)
+            return padrao
+        return valor
+
+    def _temporario(self, valor, ttl):
+        ttl = ttl if ttl is not None else self.ttl
+        expira_em = time.time() + ttl if ttl else None
+        descritor, temporario = tempfile.mkstemp(dir=self.diretorio)
+        try:
+            with os.fdopen(descritor, "w", encoding="utf-8") as arquivo:
+                json.dump([expira_em, valor], arquivo, cls=DjangoJSONEncoder)
+        except BaseException:
+            os.remove(temporario)
+            raise
+        return temporario
+
+    def set(self, chave, valor, ttl=None):
+        # grava em arquivo temporário e troca de uma vez: leitores nunca veem arquivo pela metade
+        os.replace(self._temporario(valor, ttl), self._caminho(chave))
+
+    def add(self, chave, valor, ttl=None):
+        # os.link falha se o arquivo já existe: só um processo consegue gravar
+        temporario = self._temporario(valor, ttl)
+        try:
+            for _ in range(2):
+                try:
+                    os.link(temporario, self._caminho(chave))
+                    return True
+                except FileExistsError:
+                    # get apaga a chave expirada; na segunda volta ela existe de fato
+                    if self.get(chave, _AUSENTE) is not _AUSENTE:
+                        return False
+            return False
+        finally:
+            os.remove(temporario)
+
+    def delete(self, chave):
+        try:
+            os.remove(self._caminho(chave))
+        except FileNotFoundError:
+            pass
+
+
+# ============================
+# BACKEND: CACHE DO DJANGO
+# ============================
+class CacheDjango:
+
+    def __init__(self, alias="default", ttl=None):
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, chave, padrao=None):
+        return self.cache.get(chave, padrao)
+
+    def set(self, chave, valor, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        # no cache do Django timeout=None é "sem expiração" e 0 expira na hora
+        self.cache.set(chave, valor, ttl or None)
+
+    def add(self, chave, valor, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        return self.cache.add(chave, valor, ttl or None)
+
+    def delete(self, chave):
+        self.cache.delete(chave)
+
+
+BACKENDS = {
+    "memoria": CacheMemoriaLocal,
+    "arquivo": CacheArquivo,
+    "django": CacheDjango,
+}
+
+
+def criar_cache(config):
+    """Cria o backend a partir de {"BACKEND": ..., "OPCOES": {...}}"""
+    return BACKENDS[config.get("BACKEND", "memoria")](**config.get("OPCOES", {}))
+
+
+# ============================
+# DASHBOARD DAS ROTAS
+# ============================
+_cache_dashboard = None
+
+
+def cache_dashboard():
+    global _cache_dashboard
+    if _cache_dashboard is None:
+        _cache_dashboard = criar_cache(getattr(settings, "ENTREGAS_CACHE_DASHBOARD", {}))
+    return _cache_dashboard
+
+
+_cache_versoes_dashboard = None
+
+
+def cache_versoes_dashboard():
+    global _cache_versoes_dashboard
+    if _cache_versoes_dashboard is None:
+        config = getattr(settings, "ENTREGAS_CACHE_DASHBOARD", {})
+        _cache_versoes_dashboard = criar_cache(config.get("VERSOES", {"BACKEND": "arquivo"}))
+    return _cache_versoes_dashboard
+
+
+def _chave_versao(rota_id):
+    return f"dashboard:versao:{rota_id}"
+
+
+def versao_dashboard(rota_id):
+    """Versão atual do dashboard da rota: time_ns da última invalidação"""
+    cache = cache_versoes_dashboard()
+    versao = cache.get(_chave_versao(rota_id))
+    if versao is None:
+        # versão nova e única: se o contador for descartado pelo backend,
+        # nunca volta a apontar para um dashboard antigo
+        versao = time.time_ns()
+        cache.set(_chave_versao(rota_id), versao, ttl=0)
+    return versao
+
+
+def chave_dashboard(rota_id, versao=None):
+    """Chave do dashboard na versão informada, ou na atual da rota"""
+    return f"dashboard:{rota_id}:{versao or versao_dashboard(rota_id)}"
+
+
+def invalidar_dashboard(*rota_ids):
+    cache = cache_versoes_dashboard()
+    for rota_id in set(rota_ids):
+        if rota_id is not None:
+            cache.set(_chave_versao(rota_id), time.time_ns(), ttl=0)
+
+
+# ============================
+# RASTREIO PÚBLICO
+# ============================
+# Corpo JSON já codificado de cada código (também dos inexistentes), em um
+# LRU do próprio processo: um acerto não toca em banco nem serializador.
+_cache_rastreio = None
+_geracao_rastreio = 0
+
+
+def cache_rastreio():
+    global _cache_rastreio
+    if _cache_rastreio is None:
+        opcoes = getattr(settings, "ENTREGAS_CACHE_RASTREIO", {})
+        _cache_rastreio = CacheMemoriaLocal(**opcoes)
+    return _cache_rastreio
+
+
+def buscar_rastreio(codigo, consultar):
+    """Resposta em cache do código, ou consultar(codigo) guardado no cache"""
+    cache = cache_rastreio()
+    resposta = cache.get(codigo, _AUSENTE)
+    if resposta is not _AUSENTE:
+        return resposta
+
+    # se uma invalidação chegar durante a consulta, o resultado pode já
+    # estar velho: devolve, mas não guarda
+    geracao = _geracao_rastreio
+    resposta = consultar(codigo)
+    if geracao == _geracao_rastreio:
+        cache.set(codigo, resposta)
+    return resposta
+
+
+def invalidar_rastreio(*codigos):
+    global _geracao_rastreio
+    _geracao_rastreio += 1
+    cache = cache_rastreio()
+    for codigo in codigos:
+        cache.delete(codigo)
@@ -0,0 +1,263 @@
+"""
+Campos esparsos (?fields=, ?expand=) e leitura rápida das listagens.
+
+- ?fields=codigo_rastreio,status: só esses campos na resposta, e o queryset
+  só busca as colunas deles (.only()); relações não pedidas não são
+  carregadas (os prefetches são montados a partir dos campos pedidos)
+- ?expand=cliente,motorista: troca a chave da relação pelo objeto
+  serializado (Serializer.expansoes), com select_related/prefetch_related;
+  só para administradores e motoristas
+
+As listagens que só têm colunas simples (sem expand e sem relações
+aninhadas ou muitos-para-muitos) não passam pelo ModelSerializer: as linhas
+vêm de values() e cada valor é convertido por uma função pronta por coluna,
+com a mesma saída do serializer (datas em ISO 8601, decimais como texto,
+data/hora no fuso atual). É o caminho padrão das listagens de entregas,
+veículos, motoristas e clientes.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.db import models
+from django.utils import timezone
+from django.utils.duration import duration_string
+from rest_framework.exceptions import ParseError, PermissionDenied
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+from .instrumentacao import medir_serializacao
+from .permissions import IsMotoristaOrAdmin
+
+PARAMETRO_CAMPOS = "fields"
+PARAMETRO_EXPANDIR = "expand"
+
+
+# ============================
+# SERIALIZERS
+# ============================
+class CamposDinamicosMixin:
+    """
+    Serializer que aceita campos= (só esses na saída) e expandir= (relações
+    trocadas pelo objeto serializado, conforme `expansoes`:
+    nome -> (classe do serializer, many)).
+    """
+    expansoes = {}
+
+    def __init__(self, *args, campos=None, expandir=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for nome in expandir:
+            serializer, many = self.expansoes[nome]
+            self.fields[nome] = serializer(many=many, read_only=True)
+        if campos is not None:
+            for nome in set(self.fields) - set(campos):
+                del self.fields[nome]
+
+
+# ============================
+# CONVERSÃO DIRETA DE values()
+# ============================
+def _data_hora(fuso):
+    # o fuso é lido uma vez por página: get_current_timezone custa mais que a conversão
+    def converter(valor):
+        if valor is None:
+            return None
+        valor = valor.astimezone(fuso).isoformat()
+        return valor[:-6] + "Z" if valor.endswith("+00:00") else valor
+    return converter
+
+
+def _data(valor):
+    return valor.isoformat() if valor else None
+
+
+def _duracao(valor):
+    return duration_string(valor) if valor is not None else None
+
+
+def _decimal(casas):
+    return lambda valor: f"{valor:.{casas}f}" if valor is not None else None
+
+
+def conversor(campo):
+    """Função valor do banco -> valor na resposta, igual à do ModelSerializer; None = sem conversão"""
+    if isinstance(campo, models.DateTimeField):
+        return None     # depende do fuso: ver LeituraRapida.linhas
+    if isinstance(campo, models.DateField):
+        return _data
+    if isinstance(campo, models.DurationField):
+        return _duracao
+    if isinstance(campo, models.DecimalField):
+        return _decimal(campo.decimal_places)
+    return None
+
+
+@dataclass(frozen=True)
+class LeituraRapida:
+    """
+    Colunas para values() e, na ordem do serializer, (nome na resposta, coluna,
+    conversor); data_hora: nomes dos campos de data/hora, convertidos no fuso atual.
+    """
+    colunas: tuple
+    saida: tuple
+    data_hora: frozenset = frozenset()
+
+    def linhas(self, registros):
+        """Dicts da resposta para os dicts de values()"""
+        para_fuso = _data_hora(timezone.get_current_timezone())
+        saida = [
+            (nome, coluna, para_fuso if nome in self.data_hora else converter)
+            for nome, coluna, converter in self.saida
+        ]
+        return [
+            {nome: converter(valores[coluna]) if converter else valores[coluna] for nome, coluna, converter in saida}
+            for valores in registros
+        ]
+
+
+@lru_cache(maxsize=256)
+def leitura_rapida(serializer_class, campos):
+    """
+    Plano de leitura por values() para os campos do serializer, ou None se
+    algum campo não é uma coluna do modelo exibida sem transformação
+    (relação aninhada, muitos-para-muitos, campo calculado).
+    """
+    serializer = serializer_class(campos=campos)
+    modelo = serializer.Meta.model
+    concretos = {campo.name: campo for campo in modelo._meta.concrete_fields}
+    saida, data_hora = [], set()
+    for nome, campo_serializer in serializer.fields.items():
+        campo = concretos.get(campo_serializer.source)
+        if campo is None or isinstance(campo_serializer, (BaseSerializer, ManyRelatedField)):
+            return None
+        if campo.is_relation and not isinstance(campo_serializer, PrimaryKeyRelatedField):
+            return None
+        saida.append((nome, campo.attname, conversor(campo)))
+        if isinstance(campo, models.DateTimeField):
+            data_hora.add(nome)
+    # a chave primária entra sempre: a paginação por cursor a usa
+    colunas = tuple(dict.fromkeys([modelo._meta.pk.attname, *(coluna for _, coluna, _ in saida)]))
+    return LeituraRapida(colunas=colunas, saida=tuple(saida), data_hora=frozenset(data_hora))
+
+
+@lru_cache(maxsize=64)
+def campos_disponiveis(serializer_class):
+    return tuple(serializer_class().fields)
+
+
+@dataclass(frozen=True)
+class PlanoQueryset:
+    colunas: tuple          # para only(); vazio = todas
+    prefetches: tuple
+    relacionados: tuple     # select_related das relações expandidas
+
+
+@lru_cache(maxsize=256)
+def plano_queryset(serializer_class, campos, expandir):
+    """Colunas e relações que o queryset precisa carregar para esses campos"""
+    serializer = serializer_class(campos=campos, expandir=expandir)
+    modelo = serializer.Meta.model
+    concretos = {campo.name: campo for campo in modelo._meta.concrete_fields}
+    fields = serializer.fields.values()
+
+    # relações muitos-para-muitos e reversas exibidas: um prefetch cada
+    prefetches = tuple(
+        campo.source for campo in fields if isinstance(campo, (ListSerializer, ManyRelatedField))
+    )
+    relacionados = tuple(nome for nome in expandir if nome in concretos)
+    colunas = ()
+    if campos is not None:
+        colunas = (
+            modelo._meta.pk.name,
+            *(campo.source for campo in fields if campo.source in concretos),
+            *(
+                f"{nome}__{campo.name}"
+                for nome in relacionados
+                for campo in concretos[nome].related_model._meta.concrete_fields
+            ),
+        )
+    return PlanoQueryset(colunas=colunas, prefetches=prefetches, relacionados=relacionados)
+
+
+# ============================
+# VIEWSETS
+# ============================
+class CamposEsparsosMixin:
+    """
+    ?fields= e ?expand= em list e retrieve, com o queryset reduzido às colunas
+    e relações pedidas e a leitura rápida nas listagens que permitem.
+    """
+    ACOES_ESPARSAS = ("list", "retrieve")
+
+    def _lista_parametro(self, nome):
+        texto = self.request.query_params.get(nome)
+        if texto is None:
+            return None
+        return tuple(dict.fromkeys(parte.strip() for parte in texto.split(",") if parte.strip()))
+
+    def campos_solicitados(self):
+        """(campos ou None = todos, expansões), validados contra o serializer"""
+        if hasattr(self, "_campos_solicitados"):
+            return self._campos_solicitados
+
+        campos, expandir = None, ()
+        if self.action in self.ACOES_ESPARSAS:
+            serializer_class = self.get_serializer_class()
+            campos = self._lista_parametro(PARAMETRO_CAMPOS)
+            expandir = self._lista_parametro(PARAMETRO_EXPANDIR) or ()
+            desconhecidos = [nome for nome in campos or () if nome not in campos_disponiveis(serializer_class)]
+            if desconhecidos:
+                raise ParseError({"erro": f"Campos inexistentes em fields: {', '.join(desconhecidos)}"})
+            if expandir and not IsMotoristaOrAdmin().has_permission(self.request, self):
+                # os objetos expandidos (cliente, motorista) têm dados pessoais
+                raise PermissionDenied({"erro": "Só administradores e motoristas podem usar expand."})
+            expansoes = getattr(serializer_class, "expansoes", {})
+            invalidas = [nome for nome in expandir if nome not in expansoes]
+            if invalidas:
+                raise ParseError({
+                    "erro": f"Não é possível expandir: {', '.join(invalidas)}. "
+                            f"Disponíveis: {', '.join(expansoes) or 'nenhuma'}"
+                })
+            if campos is not None:
+                # expandir uma relação implica exibi-la
+                campos = tuple(dict.fromkeys([*campos, *expandir]))
+        self._campos_solicitados = (campos, expandir)
+        return self._campos_solicitados
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.ACOES_ESPARSAS:
+            kwargs["campos"], kwargs["expandir"] = self.campos_solicitados()
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        # list e get_object passam por aqui, depois do get_queryset da view
+        queryset = super().filter_queryset(queryset)
+        if self.action not in self.ACOES_ESPARSAS:
+            return queryset
+        campos, expandir = self.campos_solicitados()
+        plano = plano_queryset(self.get_serializer_class(), campos, expandir)
+
+        queryset = queryset.prefetch_related(None)
+        if plano.prefetches:
+            queryset = queryset.prefetch_related(*plano.prefetches)
+        if plano.colunas:
+            # um select_related da view em relação não pedida impediria o only()
+            queryset = queryset.select_related(None).only(*plano.colunas)
+        if plano.relacionados:
+            queryset = queryset.select_related(*plano.relacionados)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        campos, expandir = self.campos_solicitados()
+        plano = None if expandir else leitura_rapida(self.get_serializer_class(), campos)
+        if plano is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = super().filter_queryset(self.get_queryset()).prefetch_related(None).values(*plano.colunas)
+        pagina = self.paginate_queryset(queryset)
+        registros = pagina if pagina is not None else list(queryset)
+        with medir_serializacao():
+            linhas = plano.linhas(registros)
+        if pagina is not None:
+            return self.get_paginated_response(linhas)
+        return Response(linhas)
@@ -0,0 +1,75 @@
+"""
+GET condicional (ETag / Last-Modified) sem montar a resposta.
+
+As views calculam validadores baratos antes de consultar os dados e de
+serializar: versões de linhas (atualizado_em da rota, o maior atualizado_em
+e a quantidade das entregas, e a capacidade do veículo na ação capacidade,
+em uma consulta agregada) ou a versão do dashboard no cache. Relações sem
+versão (motorista e clientes expandidos com ?expand=) não entram na ETag:
+essas respostas saem sem os validadores. Se If-None-Match / If-Modified-Since ainda
+valem, a resposta é um 304 sem corpo; senão a resposta normal sai com
+ETag, Last-Modified e Cache-Control: private, no-cache (o cliente guarda,
+mas sempre revalida).
+
+A ETag inclui a query string (página, filtros) e o formato negociado (JSON,
+API navegável), que mudam o corpo para os mesmos dados.
+"""
+import hashlib
+from dataclasses import dataclass
+from functools import wraps
+from typing import Optional
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+@dataclass(frozen=True)
+class Validadores:
+    etag: str
+    modificado_em: Optional[int] = None    # timestamp, em segundos
+
+
+def validadores(request, *versoes, modificado_em=None):
+    """ETag das versões informadas para esta requisição; modificado_em: datetime ou timestamp"""
+    bruto = repr((versoes, request.META.get("QUERY_STRING", ""), getattr(request, "accepted_media_type", "")))
+    if modificado_em is not None and not isinstance(modificado_em, (int, float)):
+        modificado_em = modificado_em.timestamp()
+    return Validadores(
+        etag=f'"{hashlib.blake2b(bruto.encode(), digest_size=16).hexdigest()}"',
+        modificado_em=int(modificado_em) if modificado_em is not None else None,
+    )
+
+
+def aplicar_validadores(resposta, atuais):
+    if resposta.status_code in (200, 304):
+        resposta["ETag"] = atuais.etag
+        if atuais.modificado_em is not None:
+            resposta["Last-Modified"] = http_date(atuais.modificado_em)
+        patch_cache_control(resposta, private=True, no_cache=True)
+    return resposta
+
+
+def responder_condicional(request, atuais, montar):
+    """304 se o cliente já tem a versão atual; senão montar(), com os validadores"""
+    resposta = get_conditional_response(request, etag=atuais.etag, last_modified=atuais.modificado_em)
+    if resposta is None:
+        resposta = montar()
+    return aplicar_validadores(resposta, atuais)
+
+
+def condicional(calcular):
+    """
+    Como django.views.decorators.http.condition, para ações de ViewSet:
+    calcular(view, request, *args, **kwargs) devolve os Validadores, ou None
+    quando o objeto não existe/não é visível (a ação responde normalmente).
+    Roda depois da autenticação e das permissões da view.
+    """
+    def decorador(metodo):
+        @wraps(metodo)
+        def envolvido(self, request, *args, **kwargs):
+            atuais = calcular(self, request, *args, **kwargs) if request.method in ("GET", "HEAD") else None
+            if atuais is None:
+                return metodo(self, request, *args, **kwargs)
+            return responder_condicional(request, atuais, lambda: metodo(self, request, *args, **kwargs))
+        return envolvido
+    return decorador
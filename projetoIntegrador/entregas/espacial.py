@@ -0,0 +1,318 @@
+"""
+Consultas espaciais: veículos mais próximos de um ponto e zonas de entregas.
+
+As últimas posições dos veículos ficam em uma grade uniforme em memória
+(GradeEspacial): células de TAMANHO_CELULA graus, cada uma com os veículos
+que caem nela. Mover, incluir ou excluir um veículo custa O(1), então os
+signals mantêm a grade atualizada a cada gravação (signals.py). A busca
+dos k mais próximos percorre anéis de células em volta do ponto e para
+quando nenhum veículo fora dos anéis já vistos pode estar mais perto que
+o k-ésimo encontrado: o custo depende de quantos veículos há em volta do
+ponto, não do tamanho da frota.
+
+Cada processo tem a sua grade; ela é recarregada do banco quando fica mais
+velha que IDADE_MAXIMA segundos (para enxergar gravações de outros
+processos) ou quando uma gravação em lote a invalida.
+
+As zonas agrupam as entregas pendentes por k-means sobre as coordenadas
+da geocodificação local (geocodificacao.py).
+"""
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .geocodificacao import geocodificar_entregas
+from .models import Veiculo
+
+KM_POR_GRAU = 111.19
+
+PADRAO = {
+    "TAMANHO_CELULA": 0.05,     # graus (~5,5 km de latitude)
+    "IDADE_MAXIMA": 60,         # segundos até recarregar a grade do banco
+}
+
+
+def configuracao():
+    return {**PADRAO, **getattr(settings, "ENTREGAS_INDICE_ESPACIAL", {})}
+
+
+def distancia_km(lat1, lon1, lat2, lon2):
+    """Haversine; aceita escalares ou arrays"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# ============================
+# GRADE
+# ============================
+class GradeEspacial:
+
+    def __init__(self, tamanho_celula=PADRAO["TAMANHO_CELULA"]):
+        self.tamanho = tamanho_celula
+        self._celulas = defaultdict(dict)   # (i, j) -> {chave: (lat, lon, dados)}
+        self._celula_de = {}                 # chave -> (i, j)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._celula_de)
+
+    def celula(self, lat, lon):
+        return math.floor(lat / self.tamanho), math.floor(lon / self.tamanho)
+
+    def inserir(self, chave, lat, lon, dados=None):
+        """Inclui ou move o item"""
+        with self._lock:
+            self.remover(chave)
+            celula = self.celula(lat, lon)
+            self._celulas[celula][chave] = (lat, lon, dados)
+            self._celula_de[chave] = celula
+
+    def dados(self, chave):
+        """Dados do item, ou None se ele não está na grade"""
+        with self._lock:
+            celula = self._celula_de.get(chave)
+            return None if celula is None else self._celulas[celula][chave][2]
+
+    def remover(self, chave):
+        with self._lock:
+            celula = self._celula_de.pop(chave, None)
+            if celula is not None:
+                itens = self._celulas[celula]
+                itens.pop(chave, None)
+                if not itens:
+                    del self._celulas[celula]
+
+    def _distancia_minima(self, lat, anel):
+        """
+        Menor distância (km) do ponto a qualquer célula do anel `anel` em diante:
+        o ponto está em algum lugar da célula central, então são anel - 1 células inteiras
+        """
+        graus = max(anel - 1, 0) * self.tamanho
+        # um grau de longitude encolhe com a latitude: usa a maior latitude possível
+        cosseno = math.cos(math.radians(min(89.0, abs(lat) + graus)))
+        return graus * KM_POR_GRAU * max(cosseno, 0.0)
+
+    def _anel(self, centro, anel):
+        i0, j0 = centro
+        if anel == 0:
+            yield centro
+            return
+        for j in range(j0 - anel, j0 + anel + 1):
+            yield i0 - anel, j
+            yield i0 + anel, j
+        for i in range(i0 - anel + 1, i0 + anel):
+            yield i, j0 - anel
+            yield i, j0 + anel
+
+    def proximos(self, lat, lon, k, filtro=None, raio_km=None):
+        """
+        Até k itens (distância em km, chave, dados) mais próximos do ponto, do
+        mais perto ao mais longe. filtro(dados) descarta itens; raio_km limita
+        a distância.
+        """
+        with self._lock:
+            melhores = []       # heap de (-distância, chave, dados)
+            centro = self.celula(lat, lon)
+            celulas_vistas = 0
+
+            def considerar(itens):
+                for chave, (lat_item, lon_item, dados) in itens.items():
+                    if filtro is not None and not filtro(dados):
+                        continue
+                    d = float(distancia_km(lat, lon, lat_item, lon_item))
+                    if raio_km is not None and d > raio_km:
+                        continue
+                    if len(melhores) < k:
+                        heapq.heappush(melhores, (-d, chave, dados))
+                    elif d < -melhores[0][0]:
+                        heapq.heapreplace(melhores, (-d, chave, dados))
+
+            anel = 0
+            while k > 0 and celulas_vistas < len(self._celulas):
+                fora = self._distancia_minima(lat, anel)
+                if raio_km is not None and fora > raio_km:
+                    break
+                if len(melhores) == k and -melhores[0][0] <= fora:
+                    break
+                if 8 * anel > len(self._celulas):
+                    # anel maior que a grade ocupada: varre de vez as células restantes
+                    for celula, itens in self._celulas.items():
+                        if max(abs(celula[0] - centro[0]), abs(celula[1] - centro[1])) >= anel:
+                            considerar(itens)
+                    break
+                for celula in self._anel(centro, anel):
+                    itens = self._celulas.get(celula)
+                    if itens:
+                        celulas_vistas += 1
+                        considerar(itens)
+                anel += 1
+
+            return [(-d, chave, dados) for d, chave, dados in sorted(melhores, reverse=True)]
+
+
+# ============================
+# ÍNDICE DE VEÍCULOS
+# ============================
+_indice_veiculos = None
+_carregado_em = 0.0
+_lock_indice = threading.Lock()
+
+
+def dados_veiculo(veiculo):
+    return {
+        "tipo": veiculo.tipo,
+        "status_veiculo": veiculo.status_veiculo,
+        "capacidade_maxima": veiculo.capacidade_maxima,
+        "motorista_ativo": veiculo.motorista_ativo_id,
+        "posicao_atualizada_em": veiculo.posicao_atualizada_em,
+    }
+
+
+def indice_veiculos():
+    """A grade de veículos do processo, recarregada do banco quando velha ou invalidada"""
+    global _indice_veiculos, _carregado_em
+    config = configuracao()
+    with _lock_indice:
+        if _indice_veiculos is None or time.monotonic() - _carregado_em > config["IDADE_MAXIMA"]:
+            grade = GradeEspacial(config["TAMANHO_CELULA"])
+            for veiculo in Veiculo.objects.filter(latitude__isnull=False, longitude__isnull=False).only(
+                "placa", "latitude", "longitude", "tipo", "status_veiculo", "capacidade_maxima",
+                "motorista_ativo", "posicao_atualizada_em",
+            ):
+                grade.inserir(veiculo.pk, veiculo.latitude, veiculo.longitude, dados_veiculo(veiculo))
+            _indice_veiculos, _carregado_em = grade, time.monotonic()
+        return _indice_veiculos
+
+
+def atualizar_veiculo_no_indice(veiculo, excluido=False):
+    """Aplica a gravação de um veículo na grade já carregada (se não houver, nada a fazer)"""
+    grade = _indice_veiculos
+    if grade is None:
+        return
+    if excluido or veiculo.latitude is None or veiculo.longitude is None:
+        grade.remover(veiculo.pk)
+    else:
+        grade.inserir(veiculo.pk, veiculo.latitude, veiculo.longitude, dados_veiculo(veiculo))
+
+
+def mover_veiculos_no_indice(posicoes):
+    """
+    Aplica novas posições {placa: (latitude, longitude, posicao_atualizada_em)}
+    gravadas em lote (telemetria.py) na grade já carregada.
+    """
+    global _indice_veiculos
+    grade = _indice_veiculos
+    if grade is None:
+        return
+    for placa, (lat, lon, atualizada_em) in posicoes.items():
+        dados = grade.dados(placa)
+        if dados is None:
+            # veículo que ainda não tinha posição: sem tipo/status à mão, recarrega a grade
+            _indice_veiculos = None
+            return
+        grade.inserir(placa, lat, lon, {**dados, "posicao_atualizada_em": atualizada_em})
+
+
+def invalidar_indice_veiculos():
+    """Para gravações em lote: a grade é recarregada na próxima consulta, depois do commit"""
+    def descartar():
+        global _indice_veiculos
+        _indice_veiculos = None
+    transaction.on_commit(descartar)
+
+
+def veiculos_proximos(lat, lon, k=5, tipos=None, capacidade_minima=0, raio_km=None):
+    """k veículos disponíveis (status D) mais próximos, opcionalmente só dos tipos informados"""
+    def filtro(dados):
+        return (
+            dados["status_veiculo"] == Veiculo.Status_veiculo.DISPONIVEL
+            and (tipos is None or dados["tipo"] in tipos)
+            and dados["capacidade_maxima"] >= capacidade_minima
+        )
+    return indice_veiculos().proximos(lat, lon, k, filtro, raio_km)
+
+
+# ============================
+# ZONAS (K-MEANS)
+# ============================
+def projetar_km(lat, lon):
+    """Projeção equirretangular em km, boa o bastante para agrupar pontos de uma região"""
+    lat0 = math.radians(float(np.mean(lat)))
+    return np.column_stack([lon * KM_POR_GRAU * math.cos(lat0), lat * KM_POR_GRAU])
+
+
+def kmeans(pontos, k, iteracoes=50, tolerancia=0.01, semente=0):
+    """
+    Rótulo (0..k-1) de cada ponto e centros, por Lloyd com inicialização
+    k-means++; distâncias de todos os pontos a todos os centros de uma vez.
+    Para quando nenhum centro se move mais que `tolerancia` (km).
+    """
+    n = len(pontos)
+    k = min(k, n)
+    rng = np.random.default_rng(semente)
+    centros = np.empty((k, pontos.shape[1]))
+    centros[0] = pontos[rng.integers(n)]
+    d2 = ((pontos - centros[0]) ** 2).sum(axis=1)
+    for c in range(1, k):
+        total = d2.sum()
+        escolhido = rng.choice(n, p=d2 / total) if total > 0 else rng.integers(n)
+        centros[c] = pontos[escolhido]
+        d2 = np.minimum(d2, ((pontos - centros[c]) ** 2).sum(axis=1))
+
+    rotulos = np.full(n, -1)
+    for _ in range(iteracoes):
+        # |p - c|² sem o |p|², constante por ponto: uma matriz n x k
+        distancias = (centros ** 2).sum(axis=1)[None, :] - 2 * pontos @ centros.T
+        novos = distancias.argmin(axis=1)
+        if np.array_equal(novos, rotulos):
+            break
+        rotulos = novos
+        anteriores = centros.copy()
+        contagem = np.bincount(rotulos, minlength=k)
+        for eixo in range(pontos.shape[1]):
+            soma = np.bincount(rotulos, weights=pontos[:, eixo], minlength=k)
+            # centro sem pontos fica onde estava
+            centros[:, eixo] = np.where(contagem > 0, soma / np.maximum(contagem, 1), centros[:, eixo])
+        if ((centros - anteriores) ** 2).sum(axis=1).max() <= tolerancia ** 2:
+            break
+    return rotulos, centros
+
+
+def zonas_de_entregas(entregas, k):
+    """
+    Agrupa um queryset de entregas em até k zonas pelo destino. Devolve
+    (zonas, códigos sem coordenadas), cada zona com centro, raio e entregas.
+    """
+    capacidades = dict(entregas.values_list("codigo_rastreio", "capacidade_necessaria"))
+    codigos, lat, lon = geocodificar_entregas(entregas.order_by("codigo_rastreio"))
+    conhecidas = ~np.isnan(lat)
+    codigos = np.array(codigos, dtype=object)
+    sem_coordenadas = codigos[~conhecidas].tolist()
+    if not conhecidas.any():
+        return [], sem_coordenadas
+
+    codigos, lat, lon = codigos[conhecidas], lat[conhecidas], lon[conhecidas]
+    rotulos, _ = kmeans(projetar_km(lat, lon), k)
+
+    zonas = []
+    for zona in np.unique(rotulos).tolist():
+        membros = rotulos == zona
+        centro_lat, centro_lon = float(lat[membros].mean()), float(lon[membros].mean())
+        zona_codigos = codigos[membros].tolist()
+        zonas.append({
+            "latitude": round(centro_lat, 6),
+            "longitude": round(centro_lon, 6),
+            "raio_km": round(float(distancia_km(centro_lat, centro_lon, lat[membros], lon[membros]).max()), 3),
+            "entregas": len(zona_codigos),
+            "capacidade_necessaria": sum(capacidades[codigo] for codigo in zona_codigos),
+            "codigos": zona_codigos,
+        })
+    zonas.sort(key=lambda zona: -zona["entregas"])
+    return zonas, sem_coordenadas
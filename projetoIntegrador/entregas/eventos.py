@@ -0,0 +1,111 @@
+"""
+Histórico de status das entregas (EntregaEvento), só de inclusão.
+
+Cada mudança de status (e a criação da entrega) vira um evento com o
+status anterior e o novo, a rota do momento, o usuário e a hora. Os
+eventos são gravados na mesma transação da mudança: se ela for desfeita,
+o evento também é. Gravações em lote (importação, mudanças de status em
+massa) montam os eventos de todas as entregas e gravam com um único
+bulk_create; a gravação de uma entrega pelo save() grava o seu evento
+pelo signal (signals.py).
+
+O autor vem de autor_eventos(), usado pelas views em volta das gravações.
+
+Consultas:
+- linha_do_tempo(codigo): eventos da entrega, com o tempo em cada status
+  (índice entrega + ocorrido_em)
+- eventos_desde(cursor): feed em ordem de id para sincronização
+  incremental; o cursor é o id do último evento recebido
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.utils import timezone
+
+from .models import EntregaEvento
+
+_autor = ContextVar("autor_eventos", default=None)
+
+CAMPOS_EVENTO = ("id", "entrega_id", "ocorrido_em", "status_anterior", "status_novo", "rota_id", "usuario_id")
+
+
+@contextmanager
+def autor_eventos(usuario):
+    """Atribui ao usuário os eventos gravados dentro do bloco"""
+    token = _autor.set(usuario.pk if usuario is not None and usuario.is_authenticated else None)
+    try:
+        yield
+    finally:
+        _autor.reset(token)
+
+
+def novo_evento(entrega_id, status_anterior, status_novo, rota_id, ocorrido_em=None):
+    return EntregaEvento(
+        entrega_id=entrega_id,
+        ocorrido_em=ocorrido_em or timezone.now(),
+        status_anterior=status_anterior,
+        status_novo=status_novo,
+        rota_id=rota_id,
+        usuario_id=_autor.get(),
+    )
+
+
+def registrar_eventos(eventos):
+    """Grava os eventos na transação atual, em um único INSERT por lote de 1000"""
+    if eventos:
+        EntregaEvento.objects.bulk_create(eventos, batch_size=1000)
+
+
+def eventos_de_mudancas(mudancas):
+    """
+    Eventos para as mudanças [(codigo, status anterior ou None, status novo,
+    rota_id)] em que o status de fato mudou, todos com a mesma hora.
+    """
+    agora = timezone.now()
+    return [
+        novo_evento(codigo, anterior, novo, rota_id, agora)
+        for codigo, anterior, novo, rota_id in mudancas
+        if anterior != novo
+    ]
+
+
+# ============================
+# CONSULTAS
+# ============================
+def linha_do_tempo(codigo):
+    """
+    Eventos da entrega em ordem, cada um com quanto tempo a entrega ficou no
+    status novo (até o evento seguinte; o último ainda está em aberto).
+    """
+    eventos = list(
+        EntregaEvento.objects.filter(entrega_id=codigo)
+        .order_by("ocorrido_em", "id")
+        .values(*CAMPOS_EVENTO)
+    )
+    agora = timezone.now()
+    for evento, seguinte in zip(eventos, eventos[1:] + [None]):
+        fim = seguinte["ocorrido_em"] if seguinte else agora
+        evento["segundos_no_status"] = round((fim - evento["ocorrido_em"]).total_seconds(), 3)
+        evento["status_atual"] = seguinte is None
+    return eventos
+
+
+def eventos_desde(cursor=0, limite=1000, inicio=None, fim=None):
+    """
+    Até `limite` eventos com id maior que o cursor, em ordem de id, opcionalmente
+    só os ocorridos em [inicio, fim). Devolve (eventos, próximo cursor).
+
+    Com o SQLite as gravações são serializadas e os ids aparecem em ordem de
+    commit. Em bancos com escritas concorrentes um id menor pode confirmar
+    depois de um maior: quem sincroniza deve reler uma pequena margem.
+    """
+    inicio, fim = (
+        timezone.make_aware(data) if data and timezone.is_naive(data) else data for data in (inicio, fim)
+    )
+    eventos = EntregaEvento.objects.filter(id__gt=cursor)
+    if inicio:
+        eventos = eventos.filter(ocorrido_em__gte=inicio)
+    if fim:
+        eventos = eventos.filter(ocorrido_em__lt=fim)
+    eventos = list(eventos.order_by("id").values(*CAMPOS_EVENTO)[:limite])
+    return eventos, (eventos[-1]["id"] if eventos else cursor)
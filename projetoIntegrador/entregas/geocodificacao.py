@@ -0,0 +1,276 @@
+"""
+Geocodificação local por CEP e por localidade.
+
+Duas tabelas em CSV, sem serviço externo:
+
+- faixas de CEP (prefixo,latitude,longitude,localidade): um CEP resolve
+  para a linha de prefixo mais longo com que começa. A tabela distribuída
+  (dados/ceps.csv) cobre as capitais e as dez regiões postais; uma mais
+  detalhada pode ser indicada em settings.ENTREGAS_TABELA_CEP.
+- centroides de localidade (uf,cidade,bairro,latitude,longitude; bairro
+  vazio = centroide da cidade), em dados/localidades.csv ou
+  settings.ENTREGAS_TABELA_LOCALIDADES.
+
+As faixas viram um índice em arrays (IndiceCep): intervalos disjuntos de
+CEPs numéricos, consultados com searchsorted, um CEP ou um array inteiro
+de uma vez. Um CEP que só resolve até a cidade (prefixo com menos de
+PRECISAO_CEP dígitos) perde para o centroide do bairro, se houver.
+
+Os textos livres (Entrega.endereco_destino) são normalizados uma vez por
+texto distinto (lru_cache). As coordenadas do cliente ficam gravadas em
+Cliente.latitude/longitude; geocodificar_clientes e geocodificar_entregas
+resolvem um queryset inteiro de uma vez.
+"""
+import csv
+import math
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+DADOS = Path(__file__).resolve().parent / "dados"
+TABELA_PADRAO = DADOS / "ceps.csv"
+LOCALIDADES_PADRAO = DADOS / "localidades.csv"
+
+# prefixos de CEP com ao menos 5 dígitos (setor/subsetor) valem mais que o bairro
+PRECISAO_CEP = 5
+
+# CEP dentro de um endereço livre: 70000-000 ou 70000000
+CEP_NO_TEXTO = re.compile(r"(?<!\d)(\d{5})-?(\d{3})(?!\d)")
+
+
+# ============================
+# NORMALIZAÇÃO
+# ============================
+def normalizar_cep(cep):
+    """CEP com 8 dígitos, ou None"""
+    if cep and len(cep) == 8 and cep.isdigit():
+        return cep
+    digitos = re.sub(r"\D", "", cep or "")
+    return digitos if len(digitos) == 8 else None
+
+
+def extrair_cep(texto):
+    """Primeiro CEP encontrado em um texto livre (ex.: endereco_destino)"""
+    achado = CEP_NO_TEXTO.search(texto or "")
+    return achado.group(1) + achado.group(2) if achado else None
+
+
+@lru_cache(maxsize=65536)
+def normalizar_texto(texto):
+    """Sem acentos, em minúsculas, só letras/dígitos separados por um espaço"""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).casefold()
+    return " ".join(re.findall(r"[a-z0-9]+", texto))
+
+
+@lru_cache(maxsize=65536)
+def interpretar_endereco(texto):
+    """(CEP escrito no texto ou None, texto normalizado)"""
+    return extrair_cep(texto), normalizar_texto(texto)
+
+
+# ============================
+# ÍNDICE DE FAIXAS DE CEP
+# ============================
+@dataclass(frozen=True)
+class IndiceCep:
+    """
+    Faixas de CEP como intervalos disjuntos [inicios[i], inicios[i + 1]) de
+    CEPs numéricos, cada um com a linha da tabela que o cobre (-1 = nenhuma).
+    """
+    inicios: np.ndarray         # int64, crescente, começa em 0
+    linhas: np.ndarray          # int32
+    latitudes: np.ndarray       # por linha da tabela
+    longitudes: np.ndarray
+    precisoes: np.ndarray       # dígitos do prefixo da linha
+
+    @classmethod
+    def montar(cls, faixas):
+        """faixas: sequência de (prefixo, latitude, longitude)"""
+        faixas = sorted(faixas, key=lambda faixa: len(faixa[0]))
+        escala = np.array([10 ** (8 - len(prefixo)) for prefixo, _, _ in faixas], dtype=np.int64)
+        ini = np.array([int(prefixo) for prefixo, _, _ in faixas], dtype=np.int64) * escala
+        fim = ini + escala
+
+        # pinta os intervalos elementares dos prefixos mais curtos aos mais longos:
+        # cada um fica com o prefixo mais longo que o cobre
+        limites = np.unique(np.concatenate([[0, 10 ** 8], ini, fim]))
+        dono = np.full(len(limites) - 1, -1, dtype=np.int32)
+        de, ate = np.searchsorted(limites, ini), np.searchsorted(limites, fim)
+        for linha in range(len(faixas)):
+            dono[de[linha]:ate[linha]] = linha
+
+        # junta intervalos vizinhos com o mesmo dono
+        novo = np.concatenate([[True], dono[1:] != dono[:-1]])
+        return cls(
+            inicios=limites[:-1][novo],
+            linhas=dono[novo],
+            latitudes=np.array([lat for _, lat, _ in faixas], dtype=float),
+            longitudes=np.array([lon for _, _, lon in faixas], dtype=float),
+            precisoes=np.array([len(prefixo) for prefixo, _, _ in faixas], dtype=np.int8),
+        )
+
+    def buscar(self, ceps):
+        """Linha da tabela de cada CEP (array de inteiros; negativo = CEP inválido)"""
+        ceps = np.asarray(ceps, dtype=np.int64)
+        posicao = np.searchsorted(self.inicios, ceps, side="right") - 1
+        linhas = self.linhas[np.clip(posicao, 0, None)]
+        return np.where(ceps >= 0, linhas, -1)
+
+    def coordenadas(self, ceps):
+        """Arrays de latitude, longitude (NaN quando desconhecidas) e precisão (0 idem)"""
+        linhas = self.buscar(ceps)
+        achou = linhas >= 0
+        linhas = np.where(achou, linhas, 0)
+        lat = np.where(achou, self.latitudes[linhas], math.nan)
+        lon = np.where(achou, self.longitudes[linhas], math.nan)
+        return lat, lon, np.where(achou, self.precisoes[linhas], 0)
+
+
+def ler_csv(caminho):
+    with open(caminho, newline="", encoding="utf-8") as arquivo:
+        return list(csv.DictReader(arquivo))
+
+
+@lru_cache(maxsize=1)
+def indice_ceps():
+    caminho = getattr(settings, "ENTREGAS_TABELA_CEP", None) or TABELA_PADRAO
+    return IndiceCep.montar([
+        (row["prefixo"], float(row["latitude"]), float(row["longitude"]))
+        for row in ler_csv(caminho)
+    ])
+
+
+def ceps_numericos(ceps):
+    """Array int64 dos CEPs (-1 para os inválidos)"""
+    return np.fromiter(
+        (int(cep) if cep else -1 for cep in map(normalizar_cep, ceps)),
+        dtype=np.int64, count=len(ceps),
+    )
+
+
+def coordenadas_cep(cep):
+    """(latitude, longitude) do CEP, ou None se nenhuma faixa o cobre"""
+    lat, lon, _ = indice_ceps().coordenadas(ceps_numericos([cep]))
+    return None if math.isnan(lat[0]) else (float(lat[0]), float(lon[0]))
+
+
+# ============================
+# CENTROIDES DE LOCALIDADE
+# ============================
+@lru_cache(maxsize=1)
+def tabela_localidades():
+    """(uf, cidade, bairro) normalizados -> (latitude, longitude); bairro "" = a cidade"""
+    caminho = getattr(settings, "ENTREGAS_TABELA_LOCALIDADES", None) or LOCALIDADES_PADRAO
+    return {
+        (normalizar_texto(row["uf"]), normalizar_texto(row["cidade"]), normalizar_texto(row["bairro"])):
+            (float(row["latitude"]), float(row["longitude"]))
+        for row in ler_csv(caminho)
+    }
+
+
+@lru_cache(maxsize=1)
+def bairros_por_cidade():
+    """(uf, cidade) -> nomes normalizados dos bairros, os mais longos primeiro"""
+    bairros = {}
+    for uf, cidade, bairro in tabela_localidades():
+        if bairro:
+            bairros.setdefault((uf, cidade), []).append(bairro)
+    return {chave: sorted(nomes, key=len, reverse=True) for chave, nomes in bairros.items()}
+
+
+def centroide(uf, cidade, bairro=""):
+    """Centroide do bairro, ou da cidade com bairro vazio; None se desconhecido"""
+    return tabela_localidades().get(
+        (normalizar_texto(uf), normalizar_texto(cidade), normalizar_texto(bairro))
+    )
+
+
+@lru_cache(maxsize=65536)
+def bairro_no_texto(texto, uf, cidade):
+    """Centroide do bairro da cidade citado no texto livre (o nome mais longo), ou None"""
+    _, normalizado = interpretar_endereco(texto)
+    uf, cidade = normalizar_texto(uf), normalizar_texto(cidade)
+    for bairro in bairros_por_cidade().get((uf, cidade), ()):
+        if f" {bairro} " in f" {normalizado} ":
+            return tabela_localidades()[(uf, cidade, bairro)]
+    return None
+
+
+# ============================
+# RESOLUÇÃO
+# ============================
+def escolher(por_cep, precisao, *alternativas):
+    """
+    CEP preciso (PRECISAO_CEP dígitos ou mais); senão a primeira alternativa
+    conhecida (bairro, cidade...); senão o CEP, por grosseiro que seja.
+    """
+    if por_cep is not None and precisao >= PRECISAO_CEP:
+        return por_cep
+    for alternativa in alternativas:
+        if alternativa is not None:
+            return alternativa
+    return por_cep
+
+
+def _par(lat, lon):
+    return None if math.isnan(lat) else (float(lat), float(lon))
+
+
+def coordenadas_cliente(cep, uf, cidade, bairro):
+    """(latitude, longitude) do endereço de um cliente, ou None"""
+    lat, lon, precisao = indice_ceps().coordenadas(ceps_numericos([cep]))
+    return escolher(
+        _par(lat[0], lon[0]), precisao[0],
+        centroide(uf, cidade, bairro), centroide(uf, cidade),
+    )
+
+
+def geocodificar_clientes(clientes):
+    """
+    Coordenadas de um queryset de clientes, calculadas do endereço (sem usar
+    as gravadas): dict cpf_cliente -> (latitude, longitude) ou None.
+    """
+    linhas = list(clientes.values_list("cpf_cliente", "cep", "estado", "cidade", "bairro"))
+    lat, lon, precisao = indice_ceps().coordenadas(ceps_numericos([linha[1] for linha in linhas]))
+    return {
+        cpf: escolher(
+            _par(lat[i], lon[i]), precisao[i],
+            centroide(uf, cidade, bairro), centroide(uf, cidade),
+        )
+        for i, (cpf, _, uf, cidade, bairro) in enumerate(linhas)
+    }
+
+
+def geocodificar_entregas(entregas):
+    """
+    Destinos de um queryset de entregas, na ordem do queryset: (códigos,
+    latitudes, longitudes), NaN quando desconhecidos.
+
+    Vale, nesta ordem: o CEP escrito em endereco_destino, se preciso; um
+    bairro da cidade do cliente citado no destino; o CEP do destino, mesmo
+    grosseiro; as coordenadas gravadas do cliente.
+    """
+    linhas = list(entregas.values_list(
+        "codigo_rastreio", "endereco_destino", "cliente__estado", "cliente__cidade",
+        "cliente__latitude", "cliente__longitude",
+    ))
+    ceps = [interpretar_endereco(linha[1])[0] for linha in linhas]
+    lat, lon, precisao = indice_ceps().coordenadas(ceps_numericos(ceps))
+
+    for i, (_, destino, uf, cidade, lat_cliente, lon_cliente) in enumerate(linhas):
+        if precisao[i] >= PRECISAO_CEP:
+            continue
+        por_cep = _par(lat[i], lon[i])
+        cliente = (lat_cliente, lon_cliente) if lat_cliente is not None else None
+        lat[i], lon[i] = escolher(
+            por_cep, precisao[i],
+            bairro_no_texto(destino, uf, cidade), por_cep, cliente,
+        ) or (math.nan, math.nan)
+
+    return [linha[0] for linha in linhas], lat, lon
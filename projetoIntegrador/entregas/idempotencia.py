@@ -0,0 +1,200 @@
+"""
+Idempotency-Key nas gravações da API.
+
+Os aplicativos repetem POST/PUT/PATCH quando a rede falha sem saber se a
+primeira tentativa chegou. Com o cabeçalho Idempotency-Key, a primeira
+requisição com a chave é executada e a resposta fica guardada; as
+repetições recebem a mesma resposta (com Idempotent-Replayed: true) sem
+executar a view de novo, então nada é gravado duas vezes (nem a
+capacidade da rota somada duas vezes).
+
+- a chave vale por usuário (ou para os anônimos, como no login) e fica
+  presa ao conteúdo da requisição: a mesma chave com método, caminho ou
+  corpo diferentes é recusada com 422
+- repetições concorrentes esperam a primeira terminar (a chave fica
+  travada com add no cache) e recebem a resposta dela; se ela demorar mais
+  que ESPERA_SEGUNDOS, 409
+- respostas 5xx e exceções não são guardadas: a repetição executa de novo
+
+As respostas ficam em um cache com TTL (ENTREGAS_IDEMPOTENCIA, mesmos
+backends de ENTREGAS_CACHE_DASHBOARD), guardadas como dicionários JSON
+(status, dados e cabeçalhos). O padrão é "arquivo", compartilhado
+pelos processos da máquina: no "memoria" cada processo tem as suas chaves,
+e uma repetição atendida por outro worker seria gravada de novo. Com
+vários servidores use "django" com um cache compartilhado.
+
+Uma view pode pedir um TTL próprio e uma versão que entra na chave
+(idempotente(ttl=..., versao=...)): o login guarda o token por pouco tempo
+e sob a versão dos tokens, então excluir o token descarta as repetições.
+"""
+import hashlib
+import json
+import time
+from dataclasses import asdict, dataclass
+from functools import wraps
+
+from django.conf import settings
+from django.http import QueryDict
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache import criar_cache
+
+CABECALHO = "HTTP_IDEMPOTENCY_KEY"
+TAMANHO_MAXIMO_CHAVE = 255
+
+PADRAO = {
+    "BACKEND": "arquivo",
+    "OPCOES": {"ttl": 24 * 3600},
+    "TRAVA_SEGUNDOS": 60,       # a trava expira se o processo morrer no meio
+    "ESPERA_SEGUNDOS": 10,
+    "INTERVALO_ESPERA_MS": 50,
+}
+
+_cache = None
+
+
+def configuracao():
+    return {**PADRAO, **getattr(settings, "ENTREGAS_IDEMPOTENCIA", {})}
+
+
+def cache_idempotencia():
+    global _cache
+    if _cache is None:
+        _cache = criar_cache(configuracao())
+    return _cache
+
+
+# ============================
+# RESPOSTAS GUARDADAS
+# ============================
+@dataclass(frozen=True)
+class EmAndamento:
+    impressao: str
+
+
+@dataclass(frozen=True)
+class RespostaGuardada:
+    impressao: str
+    status: int
+    dados: object
+    cabecalhos: dict
+
+    def resposta(self):
+        resposta = Response(self.dados, status=self.status, headers=self.cabecalhos)
+        resposta["Idempotent-Replayed"] = "true"
+        return resposta
+
+
+def _guardar(item):
+    """EmAndamento/RespostaGuardada como dicionário JSON: o cache nunca guarda objetos"""
+    return asdict(item)
+
+
+def _ler(valor):
+    if valor is None:
+        return None
+    return RespostaGuardada(**valor) if "status" in valor else EmAndamento(**valor)
+
+
+def impressao_digital(request):
+    """Hash do método, caminho e corpo: a chave só repete a mesma requisição"""
+    dados = request.data
+    if isinstance(dados, QueryDict):
+        corpo = repr(sorted(dados.lists()))
+    else:
+        corpo = json.dumps(dados, sort_keys=True, default=str)
+    bruto = f"{request.method} {request.get_full_path()} {corpo}"
+    return hashlib.blake2b(bruto.encode(), digest_size=16).hexdigest()
+
+
+def _chave_cache(request, chave, versao=None):
+    usuario = request.user.pk if request.user.is_authenticated else "anonimo"
+    if versao is not None:
+        usuario = f"{usuario}:{versao}"
+    # a chave enviada pelo cliente não vai crua para o cache (tamanho, caracteres)
+    return f"idempotencia:{usuario}:{hashlib.sha1(chave.encode()).hexdigest()}"
+
+
+def _aguardar(cache, chave_cache, config):
+    """Espera a requisição que está com a chave terminar; devolve o que ficou no cache"""
+    limite = time.monotonic() + config["ESPERA_SEGUNDOS"]
+    while time.monotonic() < limite:
+        time.sleep(config["INTERVALO_ESPERA_MS"] / 1000)
+        guardado = _ler(cache.get(chave_cache))
+        if not isinstance(guardado, EmAndamento):
+            return guardado
+    return _ler(cache.get(chave_cache))
+
+
+# ============================
+# DECORADOR
+# ============================
+def idempotente(metodo=None, *, ttl=None, versao=None):
+    """
+    Idempotency-Key para um método de view (create, update, ação POST...).
+    ttl substitui o do backend para as respostas da view; versao() entra na
+    chave, e trocar a versão descarta as respostas guardadas.
+    """
+    if metodo is None:
+        return lambda metodo: idempotente(metodo, ttl=ttl, versao=versao)
+
+    @wraps(metodo)
+    def envolvido(self, request, *args, **kwargs):
+        chave = request.META.get(CABECALHO)
+        # partial_update chama update: só o método de fora trata a chave
+        if not chave or getattr(request, "_idempotencia", False):
+            return metodo(self, request, *args, **kwargs)
+        if len(chave) > TAMANHO_MAXIMO_CHAVE:
+            return Response(
+                {"erro": f"Idempotency-Key deve ter até {TAMANHO_MAXIMO_CHAVE} caracteres"}, status=400
+            )
+
+        config = configuracao()
+        cache = cache_idempotencia()
+        chave_cache = _chave_cache(request, chave, versao() if versao else None)
+        impressao = impressao_digital(request)
+
+        guardado = None
+        while not cache.add(chave_cache, _guardar(EmAndamento(impressao)), ttl=config["TRAVA_SEGUNDOS"]):
+            guardado = _ler(cache.get(chave_cache))
+            if isinstance(guardado, EmAndamento) and guardado.impressao == impressao:
+                guardado = _aguardar(cache, chave_cache, config)
+            if guardado is not None:
+                break
+            # a outra requisição falhou (ou a trava expirou): tenta ficar com a chave
+
+        if guardado is not None:
+            if guardado.impressao != impressao:
+                return Response(
+                    {"erro": "Idempotency-Key já usada em outra requisição (método, caminho ou corpo diferentes)"},
+                    status=422,
+                )
+            if isinstance(guardado, EmAndamento):
+                return Response(
+                    {"erro": "Requisição com esta Idempotency-Key ainda em processamento; tente de novo"},
+                    status=409,
+                )
+            return guardado.resposta()
+
+        request._idempotencia = True
+        try:
+            resposta = metodo(self, request, *args, **kwargs)
+        except BaseException:
+            cache.delete(chave_cache)
+            raise
+        finally:
+            request._idempotencia = False
+
+        if resposta.status_code >= 500 or not isinstance(resposta, Response):
+            cache.delete(chave_cache)
+        else:
+            cache.set(chave_cache, _guardar(RespostaGuardada(
+                impressao=impressao,
+                status=resposta.status_code,
+                # como o JSONRenderer codifica: Decimal, datas... viram tipos do JSON
+                dados=json.loads(json.dumps(resposta.data, cls=JSONEncoder)),
+                cabecalhos=dict(resposta.items()),
+            )), ttl=ttl)
+        return resposta
+    return envolvido
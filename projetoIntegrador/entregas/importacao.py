@@ -0,0 +1,721 @@
+"""
+Motor de importação em lote dos CSVs (usado por `importar_csv --lote`).
+
+Em vez de um update_or_create por linha, as chaves referenciadas pelos
+arquivos são carregadas uma única vez em mapas na memória, as linhas são
+separadas em inserções e atualizações pela chave primária e gravadas com
+bulk_create e um UPDATE em executemany, em blocos, cada bloco dentro de
+uma transação.
+
+Os arquivos são lidos em fluxo (um bloco por vez), então o uso de memória
+não depende do tamanho do arquivo, e a posição do último bloco gravado
+fica registrada em CheckpointImportacao para retomar uma importação
+interrompida.
+
+No modo incremental, cada linha gravada tem o hash do seu conteúdo
+normalizado guardado em ImpressaoLinha; linhas cujo hash não mudou desde
+a última importação são puladas.
+
+A ordem de importação vem do grafo de chaves estrangeiras dos modelos:
+arquivos independentes entre si podem ser importados em paralelo, em
+processos separados (importar_em_paralelo).
+"""
+import csv
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from datetime import timedelta, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Callable
+
+import django
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from .models import (
+    Cliente, Motorista, Veiculo, Rota, Entrega, CheckpointImportacao, ImpressaoLinha
+)
+from .espacial import invalidar_indice_veiculos
+from .eventos import eventos_de_mudancas, registrar_eventos
+from .roteirizacao import agendar_roteirizacao
+from .signals import invalidar_objetos, invalidar_rastreios, invalidar_rotas, rotas_afetadas
+from .sincronizacao import SINCRONIZADOS, campo_motorista, registrar_desvinculos
+
+
+def converter_tempo(texto):
+    """Converte string hh:mm:ss em timedelta"""
+    if not texto:
+        return None
+    try:
+        h, m, s = map(int, texto.split(":"))
+        return timedelta(hours=h, minutes=m, seconds=s)
+    except Exception:
+        return None
+
+
+def converter_data(texto):
+    """Converte string YYYY-MM-DD em date"""
+    if not texto:
+        return None
+    try:
+        return datetime.strptime(texto, "%Y-%m-%d").date()
+    except Exception:
+        return None
+
+
+class LinhaInvalida(Exception):
+    """Linha do CSV que não pode ser gravada (a mensagem explica o motivo)."""
+
+
+# ============================
+# MAPAS DE CHAVES
+# Chaves já existentes no banco, carregadas uma única vez e
+# atualizadas conforme os arquivos vão sendo importados
+# ============================
+@dataclass
+class Mapas:
+    clientes: set = field(default_factory=set)
+    motoristas: dict = field(default_factory=dict)   # cpf -> (cnh, nome)
+    veiculos: set = field(default_factory=set)
+    rotas: set = field(default_factory=set)
+
+    @classmethod
+    def carregar(cls):
+        return cls(
+            clientes=set(Cliente.objects.values_list("cpf_cliente", flat=True)),
+            motoristas={
+                cpf: (cnh, nome)
+                for cpf, cnh, nome in Motorista.objects.values_list("cpf", "cnh", "nome_motorista")
+            },
+            veiculos=set(Veiculo.objects.values_list("placa", flat=True)),
+            rotas=set(Rota.objects.values_list("id", flat=True)),
+        )
+
+    def registrar(self, objetos):
+        """Inclui nos mapas as chaves recém-gravadas"""
+        for obj in objetos:
+            if isinstance(obj, Cliente):
+                self.clientes.add(obj.pk)
+            elif isinstance(obj, Motorista):
+                self.motoristas[obj.pk] = (obj.cnh, obj.nome_motorista)
+            elif isinstance(obj, Veiculo):
+                self.veiculos.add(obj.pk)
+            elif isinstance(obj, Rota):
+                self.rotas.add(obj.pk)
+
+
+def _inteiro(valor):
+    try:
+        return int(valor or 0)
+    except ValueError:
+        raise LinhaInvalida(f"valor inteiro inválido: {valor!r}")
+
+
+def _decimal(valor):
+    try:
+        return Decimal(valor or 0)
+    except InvalidOperation:
+        raise LinhaInvalida(f"valor decimal inválido: {valor!r}")
+
+
+# ============================
+# CONVERSÃO LINHA -> OBJETO
+# ============================
+def montar_cliente(row, mapas):
+    cliente = Cliente(
+        cpf_cliente=row["cpf_cliente"],
+        nome_cliente=row["nome_cliente"],
+        endereco=row["endereco"],
+        cidade=row["cidade"],
+        estado=row["estado"],
+        bairro=row["bairro"],
+        cep=row["cep"],
+        telefone=row["telefone"],
+        email=row["email"],
+    )
+    # bulk_create e o UPDATE em executemany não passam por Cliente.save
+    cliente.geocodificar()
+    return cliente
+
+
+def montar_motorista(row, mapas):
+    return Motorista(
+        cpf=row["cpf"],
+        nome_motorista=row["nome_motorista"],
+        telefone=row["telefone"],
+        data_cadastro=converter_data(row["data_cadastro"]),
+        cnh=row["cnh"],
+        status_motorista=row["status_motorista"],
+    )
+
+
+def montar_veiculo(row, mapas):
+    cpf = row.get("motorista_cpf")
+    motorista = mapas.motoristas.get(cpf) if cpf else None
+
+    veiculo = Veiculo(
+        placa=row["placa"],
+        modelo=row["modelo"],
+        capacidade_maxima=_inteiro(row["capacidade_maxima"]),
+        km_atual=_inteiro(row["km_atual"]),
+        tipo=row["tipo"],
+        status_veiculo=row["status_veiculo"],
+        motorista_ativo_id=cpf if motorista else None,
+    )
+
+    # mesma regra de Veiculo.clean, sem consultar o motorista no banco
+    if motorista:
+        cnh, nome = motorista
+        tipos_validos = Veiculo.COMPATIBILIDADE_CNH.get(veiculo.tipo, [])
+        if cnh not in tipos_validos:
+            raise LinhaInvalida(
+                f"Erro no veículo {veiculo.placa}: o motorista {nome} possui CNH {cnh}, "
+                f"mas o veículo {veiculo.get_tipo_display()} exige: {', '.join(tipos_validos)}."
+            )
+
+    return veiculo
+
+
+def montar_rota(row, mapas):
+    if row.get("motorista_cpf") not in mapas.motoristas or row.get("veiculo_placa") not in mapas.veiculos:
+        raise LinhaInvalida(f"Pular rota {row.get('id')}: motorista ou veículo não encontrado")
+
+    rota = Rota(
+        id=_inteiro(row["id"]),
+        nome_rota=row["nome_rota"],
+        descricao=row["descricao"],
+        motorista_id=row["motorista_cpf"],
+        veiculo_id=row["veiculo_placa"],
+        data_rota=converter_data(row["data_rota"]),
+        capacidade_total_utilizada=_inteiro(row.get("capacidade_total_utilizada")),
+        km_total_estimado=_inteiro(row.get("km_total_estimado")),
+        tempo_estimado=converter_tempo(row.get("tempo_estimado")),
+        status_rota=row["status_rota"],
+    )
+    # vínculos N:N gravados à parte, depois da própria rota
+    rota.clientes_csv = [
+        cpf for cpf in (row.get("clientes_cpfs") or "").split(";")
+        if cpf in mapas.clientes
+    ]
+    return rota
+
+
+def montar_entrega(row, mapas):
+    codigo = row.get("codigo_rastreio")
+
+    if row.get("cliente_cpf") not in mapas.clientes:
+        raise LinhaInvalida(f"Pular entrega {codigo}: cliente não encontrado")
+
+    rota_id = _inteiro(row.get("rota_id")) or None
+    if rota_id and rota_id not in mapas.rotas:
+        raise LinhaInvalida(f"Pular entrega {codigo}: rota não encontrada")
+
+    return Entrega(
+        codigo_rastreio=row["codigo_rastreio"],
+        data_entrega_real=converter_data(row.get("data_entrega_real")),
+        capacidade_necessaria=_inteiro(row.get("capacidade_necessaria")),
+        endereco_origem=row["endereco_origem"],
+        observacoes=row.get("observacoes"),
+        endereco_destino=row["endereco_destino"],
+        valor_frete=_decimal(row.get("valor_frete")),
+        data_entrega_prevista=converter_data(row.get("data_entrega_prevista")),
+        data_solicitacao=converter_data(row.get("data_solicitacao")),
+        cliente_id=row["cliente_cpf"],
+        rota_id=rota_id,
+        status=row["status"],
+    )
+
+
+def atualizar_objetos(modelo, objetos, campos):
+    """
+    Um UPDATE parametrizado em executemany pela chave primária: o
+    bulk_update monta um CASE com um When por objeto e campo, e compilar
+    isso custa mais do que gravar as linhas uma a uma.
+    """
+    ops = connection.ops
+    meta = modelo._meta
+    campos = [meta.get_field(nome) for nome in campos]
+    atribuicoes = ", ".join(f"{ops.quote_name(campo.column)} = %s" for campo in campos)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {ops.quote_name(meta.db_table)} SET {atribuicoes} "
+            f"WHERE {ops.quote_name(meta.pk.column)} = %s",
+            [
+                (
+                    *(campo.get_db_prep_save(getattr(obj, campo.attname), connection) for campo in campos),
+                    meta.pk.get_db_prep_save(obj.pk, connection),
+                )
+                for obj in objetos
+            ],
+        )
+
+
+# ============================
+# TABELAS IMPORTÁVEIS
+# ============================
+@dataclass(frozen=True)
+class Tabela:
+    arquivo: str
+    modelo: type
+    montar: Callable
+    campos: tuple   # campos gravados nas atualizações
+
+    def impressao(self, obj):
+        """Hash dos valores já convertidos (normalizados) da linha"""
+        valores = [obj.pk] + [
+            getattr(obj, self.modelo._meta.get_field(campo).attname) for campo in self.campos
+        ]
+        if self.modelo is Rota:
+            valores.append(sorted(set(obj.clientes_csv)))
+        return hashlib.blake2b(repr(valores).encode(), digest_size=16).hexdigest()
+
+
+TABELAS = {
+    tabela.arquivo: tabela for tabela in [
+        Tabela("clientes.csv", Cliente, montar_cliente, (
+            "nome_cliente", "endereco", "cidade", "estado", "bairro", "cep", "telefone", "email",
+            "latitude", "longitude",
+        )),
+        Tabela("motoristas.csv", Motorista, montar_motorista, (
+            "nome_motorista", "telefone", "data_cadastro", "cnh", "status_motorista",
+        )),
+        Tabela("veiculos.csv", Veiculo, montar_veiculo, (
+            "modelo", "capacidade_maxima", "km_atual", "tipo", "status_veiculo", "motorista_ativo",
+        )),
+        Tabela("rotas.csv", Rota, montar_rota, (
+            "nome_rota", "descricao", "motorista", "veiculo", "data_rota",
+            "capacidade_total_utilizada", "km_total_estimado", "tempo_estimado", "status_rota",
+        )),
+        Tabela("entregas.csv", Entrega, montar_entrega, (
+            "data_entrega_real", "capacidade_necessaria", "endereco_origem", "observacoes",
+            "endereco_destino", "valor_frete", "data_entrega_prevista", "data_solicitacao",
+            "cliente", "rota", "status",
+        )),
+    ]
+}
+
+
+@dataclass
+class Resultado:
+    arquivo: str
+    inseridas: int = 0
+    atualizadas: int = 0
+    ignoradas: int = 0
+    rejeitadas: int = 0
+    segundos: float = 0.0
+
+    @property
+    def linhas(self):
+        return self.inseridas + self.atualizadas + self.ignoradas + self.rejeitadas
+
+    @property
+    def linhas_por_segundo(self):
+        return self.linhas / self.segundos if self.segundos else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.linhas} linhas ({self.inseridas} inseridas, {self.atualizadas} atualizadas, "
+            f"{self.ignoradas} sem alteração, {self.rejeitadas} rejeitadas) em {self.segundos:.2f}s "
+            f"- {self.linhas_por_segundo:.0f} linhas/s"
+        )
+
+
+# ============================
+# LEITURA EM BLOCOS
+# ============================
+@dataclass
+class Bloco:
+    linhas: list
+    offset: int = 0         # posição (em bytes) logo após a última linha do bloco
+    ultima_linha: int = 0   # número da última linha de dados do bloco
+
+
+def em_blocos(linhas, tamanho):
+    """Agrupa um iterável de linhas em blocos de até `tamanho` itens"""
+    bloco = []
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) >= tamanho:
+            yield Bloco(bloco)
+            bloco = []
+    if bloco:
+        yield Bloco(bloco)
+
+
+class _LinhasComOffset:
+    """Itera as linhas de um arquivo binário contando os bytes já lidos"""
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.offset = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        linha = self.arquivo.readline()
+        if not linha:
+            raise StopIteration
+        self.offset += len(linha)
+        return linha.decode("utf-8-sig" if self.offset == len(linha) else "utf-8")
+
+
+def ler_em_blocos(arquivo, tamanho, offset=0, linha=0):
+    """
+    Lê um CSV (aberto em modo binário) em blocos de dicts, como o DictReader.
+    Com offset/linha de um checkpoint, o cabeçalho é lido do início e a
+    leitura continua a partir do offset.
+    """
+    fonte = _LinhasComOffset(arquivo)
+    leitor = csv.reader(fonte)
+
+    cabecalho = next(leitor, None)
+    if cabecalho is None:
+        return
+
+    if offset:
+        arquivo.seek(offset)
+        fonte.offset = offset
+
+    bloco = []
+    for valores in leitor:
+        if not valores:
+            continue
+        linha += 1
+        bloco.append(dict(zip(cabecalho, valores)))
+        if len(bloco) >= tamanho:
+            yield Bloco(bloco, fonte.offset, linha)
+            bloco = []
+    if bloco:
+        yield Bloco(bloco, fonte.offset, linha)
+
+
+def hash_arquivo(caminho):
+    """SHA-256 do arquivo, lido em pedaços de 1 MB"""
+    digest = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for pedaco in iter(lambda: arquivo.read(1024 * 1024), b""):
+            digest.update(pedaco)
+    return digest.hexdigest()
+
+
+# ============================
+# IMPORTADOR
+# ============================
+class ImportadorLote:
+
+    def __init__(self, tamanho_lote=500, saida=print, incremental=False):
+        self.tamanho_lote = tamanho_lote
+        self.saida = saida
+        self.incremental = incremental
+        self.mapas = Mapas.carregar()
+
+    def importar(self, tabela, linhas):
+        """Importa as linhas (dicts do csv.DictReader) de uma tabela"""
+        return self.importar_blocos(tabela, em_blocos(linhas, self.tamanho_lote))
+
+    def importar_blocos(self, tabela, blocos, ao_confirmar=None):
+        """
+        Grava os blocos um a um. `ao_confirmar(bloco)` é chamado dentro da
+        transação de cada bloco (ex.: para avançar o checkpoint).
+        """
+        resultado = Resultado(tabela.arquivo)
+        inicio = time.perf_counter()
+
+        for bloco in blocos:
+            self.gravar_bloco(tabela, bloco, resultado, ao_confirmar)
+
+        resultado.segundos = time.perf_counter() - inicio
+        return resultado
+
+    def importar_arquivo(self, tabela, caminho, reiniciar=False):
+        """
+        Importa um arquivo em fluxo, retomando do último checkpoint.
+        Retorna None se o mesmo conteúdo já foi importado por completo.
+        """
+        checkpoint, _ = CheckpointImportacao.objects.get_or_create(
+            hash_arquivo=hash_arquivo(caminho),
+            arquivo=tabela.arquivo,
+            defaults={"caminho": str(caminho)},
+        )
+        if reiniciar:
+            checkpoint.reiniciar()
+        elif checkpoint.concluido:
+            return None
+        elif checkpoint.linha:
+            self.saida(f"Retomando {tabela.arquivo} a partir da linha {checkpoint.linha + 1}")
+
+        with open(caminho, "rb") as arquivo:
+            blocos = ler_em_blocos(arquivo, self.tamanho_lote, checkpoint.offset, checkpoint.linha)
+            resultado = self.importar_blocos(tabela, blocos, ao_confirmar=checkpoint.avancar)
+
+        checkpoint.concluir()
+        return resultado
+
+    def gravar_bloco(self, tabela, bloco, resultado, ao_confirmar=None):
+        objetos = {}
+        for row in bloco.linhas:
+            try:
+                obj = tabela.montar(row, self.mapas)
+            except LinhaInvalida as e:
+                self.saida(str(e))
+                resultado.rejeitadas += 1
+                continue
+            except (KeyError, ValueError) as e:
+                self.saida(f"Linha inválida em {tabela.arquivo}: {e!r}")
+                resultado.rejeitadas += 1
+                continue
+            # chave repetida no mesmo bloco: vale a última ocorrência
+            objetos[obj.pk] = obj
+
+        modelo = tabela.modelo
+        if modelo is Entrega:
+            # status e rota gravados de cada entrega, para registrar as mudanças
+            # (eventos.py) e atualizar as rotas que perdem entregas
+            gravadas = {
+                pk: (status, rota_id)
+                for pk, status, rota_id in Entrega.objects.filter(pk__in=list(objetos))
+                .values_list("pk", "status", "rota_id")
+            } if objetos else {}
+            status_atual = {pk: status for pk, (status, _) in gravadas.items()}
+            existentes = set(gravadas)
+        else:
+            existentes = set(
+                modelo.objects.filter(pk__in=list(objetos)).values_list("pk", flat=True)
+            ) if objetos else set()
+        impressoes = {str(pk): tabela.impressao(obj) for pk, obj in objetos.items()}
+
+        if self.incremental and existentes:
+            anteriores = dict(
+                ImpressaoLinha.objects
+                .filter(tabela=tabela.arquivo, chave__in=[str(pk) for pk in existentes])
+                .values_list("chave", "hash")
+            )
+            # só pula linhas que ainda existem no banco com o mesmo conteúdo
+            iguais = {pk for pk in existentes if anteriores.get(str(pk)) == impressoes[str(pk)]}
+            resultado.ignoradas += len(iguais)
+            for pk in iguais:
+                del objetos[pk]
+                del impressoes[str(pk)]
+
+        novos = [obj for pk, obj in objetos.items() if pk not in existentes]
+        alterados = [obj for pk, obj in objetos.items() if pk in existentes]
+
+        with transaction.atomic():
+            # bulk_create e o UPDATE não disparam signals: invalida o dashboard
+            # das rotas afetadas (para entregas, a rota anterior e a nova, que
+            # também são roteirizadas de novo) e o rastreio
+            if modelo is Entrega:
+                rotas = [
+                    *rotas_afetadas(modelo, [obj.pk for obj in alterados]),
+                    *(obj.rota_id for obj in objetos.values()),
+                ]
+                invalidar_rotas(*rotas)
+                agendar_roteirizacao(*rotas)
+                invalidar_rastreios(*objetos)
+            else:
+                invalidar_objetos(modelo, [obj.pk for obj in alterados])
+            if modelo is Veiculo:
+                invalidar_indice_veiculos()
+            campos = tabela.campos
+            if modelo in SINCRONIZADOS and alterados:
+                # o UPDATE não preenche auto_now; atualizado_em fica fora da impressão
+                agora = timezone.now()
+                for obj in alterados:
+                    obj.atualizado_em = agora
+                campos += ("atualizado_em",)
+                if SINCRONIZADOS[modelo][1] in tabela.campos:
+                    attname = campo_motorista(modelo)
+                    registrar_desvinculos(modelo, {obj.pk: getattr(obj, attname) for obj in alterados})
+            if novos:
+                modelo.objects.bulk_create(novos, batch_size=self.tamanho_lote)
+            if alterados:
+                atualizar_objetos(modelo, alterados, campos)
+            if modelo is Rota:
+                self.gravar_clientes_rotas(objetos.values())
+            if modelo is Entrega:
+                origens = {
+                    rota_id for pk, (_, rota_id) in gravadas.items()
+                    if pk in objetos and rota_id is not None and rota_id != objetos[pk].rota_id
+                }
+                if origens:
+                    Rota.objects.filter(pk__in=origens).update(atualizado_em=timezone.now())
+                registrar_eventos(eventos_de_mudancas(
+                    (obj.pk, status_atual.get(obj.pk), obj.status, obj.rota_id) for obj in objetos.values()
+                ))
+            # mantidas também fora do modo incremental, para não ficarem defasadas
+            ImpressaoLinha.objects.bulk_create(
+                [ImpressaoLinha(tabela=tabela.arquivo, chave=chave, hash=h) for chave, h in impressoes.items()],
+                batch_size=self.tamanho_lote,
+                update_conflicts=True,
+                unique_fields=["tabela", "chave"],
+                update_fields=["hash"],
+            )
+            if ao_confirmar:
+                ao_confirmar(bloco)
+
+        self.mapas.registrar(objetos.values())
+        resultado.inseridas += len(novos)
+        resultado.atualizadas += len(alterados)
+
+    def gravar_clientes_rotas(self, rotas):
+        """Substitui os vínculos rota <-> cliente das rotas do bloco"""
+        through = Rota.clientes.through
+        rotas = [rota for rota in rotas if rota.clientes_csv]
+
+        through.objects.filter(rota_id__in=[rota.pk for rota in rotas]).delete()
+        through.objects.bulk_create(
+            [
+                through(rota_id=rota.pk, cliente_id=cpf)
+                for rota in rotas
+                for cpf in dict.fromkeys(rota.clientes_csv)
+            ],
+            batch_size=self.tamanho_lote,
+        )
+
+
+# ============================
+# GRAFO DE DEPENDÊNCIAS
+# ============================
+def grafo_dependencias(tabelas=None):
+    """
+    Para cada arquivo, os arquivos dos quais ele depende: os que importam
+    os modelos referenciados pelas suas FKs/OneToOne/ManyToMany.
+    """
+    tabelas = list(tabelas or TABELAS.values())
+    arquivo_do_modelo = {tabela.modelo: tabela.arquivo for tabela in tabelas}
+
+    grafo = {}
+    for tabela in tabelas:
+        grafo[tabela.arquivo] = {
+            arquivo_do_modelo[campo.related_model]
+            for campo in tabela.modelo._meta.get_fields()
+            if campo.is_relation
+            and not campo.auto_created
+            and campo.related_model in arquivo_do_modelo
+            and campo.related_model is not tabela.modelo
+        }
+    return grafo
+
+
+def ordem_de_importacao(grafo=None):
+    """Ordenação topológica do grafo (empates na ordem de TABELAS)"""
+    grafo = grafo or grafo_dependencias()
+    ordem = []
+    restantes = list(grafo)
+    while restantes:
+        prontos = [arquivo for arquivo in restantes if grafo[arquivo] <= set(ordem)]
+        if not prontos:
+            raise ValueError(f"Dependência circular entre {', '.join(restantes)}")
+        ordem.extend(prontos)
+        restantes = [arquivo for arquivo in restantes if arquivo not in prontos]
+    return ordem
+
+
+# ============================
+# IMPORTAÇÃO EM PARALELO
+# ============================
+# No SQLite os processos gravam um de cada vez no mesmo arquivo: cada um
+# espera a trava de escrita até este tempo em vez de falhar com
+# "database is locked" (o padrão do sqlite3 é 5 s, menos que um bloco grande)
+ESPERA_SQLITE_SEGUNDOS = 300
+
+
+def preparar_sqlite(conexao):
+    """
+    WAL no arquivo do banco (fica gravado nele): as leituras dos outros
+    processos não esperam quem está gravando e vice-versa.
+    """
+    with conexao.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+
+
+def opcoes_sqlite_em_paralelo(opcoes):
+    """
+    OPTIONS da conexão SQLite de cada processo: espera longa pela trava e
+    transações IMMEDIATE, que pegam a trava de escrita já no início do
+    bloco. Com as DEFERRED padrão, duas transações que leram e depois
+    tentam gravar ficam em impasse e uma falha sem esperar o timeout.
+    """
+    return {
+        **opcoes,
+        "timeout": max(opcoes.get("timeout", 0), ESPERA_SQLITE_SEGUNDOS),
+        "transaction_mode": "IMMEDIATE",
+    }
+
+
+def _inicializar_processo():
+    # com "spawn" o Django precisa ser configurado de novo; com "fork" as
+    # conexões herdadas do processo pai não podem ser reaproveitadas
+    django.setup()
+    connections.close_all()
+    conexao = connections["default"]
+    if conexao.vendor == "sqlite":
+        conexao.settings_dict["OPTIONS"] = opcoes_sqlite_em_paralelo(conexao.settings_dict["OPTIONS"])
+
+
+def _importar_em_processo(arquivo, caminho, tamanho_lote, incremental, reiniciar):
+    mensagens = []
+    try:
+        importador = ImportadorLote(tamanho_lote, saida=mensagens.append, incremental=incremental)
+        resultado = importador.importar_arquivo(TABELAS[arquivo], caminho, reiniciar)
+    finally:
+        connections.close_all()
+    return resultado, mensagens
+
+
+def importar_em_paralelo(arquivos, processos, tamanho_lote=500, incremental=False, reiniciar=False):
+    """
+    Importa os arquivos [(tabela, caminho)] em até `processos` processos.
+    Um arquivo só começa depois que os arquivos dos quais ele depende
+    (entre os informados) terminaram. Gera (tabela, resultado, mensagens,
+    erro) conforme cada arquivo termina.
+
+    No SQLite as gravações continuam uma de cada vez (WAL, espera pela
+    trava e transações IMMEDIATE); o ganho vem da leitura e conversão dos
+    arquivos em paralelo.
+    """
+    caminhos = {tabela.arquivo: caminho for tabela, caminho in arquivos}
+    grafo = {
+        arquivo: dependencias & caminhos.keys()
+        for arquivo, dependencias in grafo_dependencias().items()
+        if arquivo in caminhos
+    }
+    pendentes = [arquivo for arquivo in ordem_de_importacao(grafo)]
+    concluidos, falhas = set(), set()
+    em_andamento = {}
+
+    if connection.vendor == "sqlite":
+        preparar_sqlite(connection)
+
+    with ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_processo) as executor:
+        while pendentes or em_andamento:
+            for arquivo in list(pendentes):
+                if grafo[arquivo] & falhas:
+                    pendentes.remove(arquivo)
+                    falhas.add(arquivo)
+                    erro = f"não importado: depende de {', '.join(sorted(grafo[arquivo] & falhas))}"
+                    yield TABELAS[arquivo], None, [], erro
+                elif grafo[arquivo] <= concluidos:
+                    pendentes.remove(arquivo)
+                    futuro = executor.submit(
+                        _importar_em_processo, arquivo, caminhos[arquivo],
+                        tamanho_lote, incremental, reiniciar,
+                    )
+                    em_andamento[futuro] = arquivo
+
+            if not em_andamento:
+                continue
+
+            terminados, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                arquivo = em_andamento.pop(futuro)
+                try:
+                    resultado, mensagens = futuro.result()
+                except Exception as e:
+                    falhas.add(arquivo)
+                    yield TABELAS[arquivo], None, [], repr(e)
+                else:
+                    concluidos.add(arquivo)
+                    yield TABELAS[arquivo], resultado, mensagens, None
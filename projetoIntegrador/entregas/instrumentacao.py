@@ -0,0 +1,175 @@
+"""
+Instrumentação das requisições: onde o tempo de cada requisição foi gasto.
+
+Para cada requisição amostrada (ENTREGAS_INSTRUMENTACAO['AMOSTRAGEM'],
+fração de 0 a 1) o middleware mede:
+- tempo total
+- consultas SQL: quantidade e tempo, por um execute_wrapper nas conexões
+- consultas repetidas: o mesmo SQL (com os parâmetros à parte) executado
+  LIMITE_REPETICOES vezes ou mais, o sinal de um N+1
+- serialização: o tempo do .data do serializer de fora (os aninhados já
+  estão dentro dele) e o das leituras rápidas de campos.py
+
+e devolve as medidas no cabeçalho Server-Timing (visível nas ferramentas
+de desenvolvedor do navegador) e em uma linha JSON no logger
+"entregas.instrumentacao": WARNING para requisições lentas ou com
+consultas repetidas, INFO para as demais.
+
+Requisições fora da amostra custam um random() no middleware e, em cada
+serializer, a leitura de uma ContextVar.
+"""
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PADRAO = {
+    "AMOSTRAGEM": 0.0,
+    "CABECALHO": True,              # Server-Timing na resposta
+    "LIMITE_REPETICOES": 3,
+    "LENTA_MS": 1000,
+}
+
+_medicao = ContextVar("medicao", default=None)
+
+
+def configuracao():
+    return {**PADRAO, **getattr(settings, "ENTREGAS_INSTRUMENTACAO", {})}
+
+
+# ============================
+# MEDIÇÃO
+# ============================
+@dataclass
+class Medicao:
+    inicio: float = field(default_factory=time.perf_counter)
+    consultas: int = 0
+    sql_s: float = 0.0
+    serializacao_s: float = 0.0
+    por_sql: Counter = field(default_factory=Counter)
+    serializando: bool = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper das conexões"""
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_s += time.perf_counter() - inicio
+            self.consultas += 1
+            self.por_sql[sql] += 1
+
+    def repetidas(self, limite):
+        """{sql: vezes} das consultas executadas limite vezes ou mais"""
+        return {
+            sql: vezes for sql, vezes in self.por_sql.most_common()
+            if vezes >= limite and sql.lstrip()[:6].upper() == "SELECT"
+        }
+
+
+@contextmanager
+def medir_serializacao():
+    """Soma o tempo do bloco à serialização da requisição (só o bloco de fora conta)"""
+    medicao = _medicao.get()
+    if medicao is None or medicao.serializando:
+        yield
+        return
+    medicao.serializando = True
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicao.serializacao_s += time.perf_counter() - inicio
+        medicao.serializando = False
+
+
+def instalar_medicao_serializers():
+    """
+    Mede o .data dos serializers do DRF. Serializer.data e ListSerializer.data
+    chamam BaseSerializer.data, então basta trocar essa propriedade.
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    original = BaseSerializer.data
+    if getattr(original.fget, "instrumentado", False):
+        return
+
+    def data(self):
+        if _medicao.get() is None:
+            return original.fget(self)
+        with medir_serializacao():
+            return original.fget(self)
+    data.instrumentado = True
+    BaseSerializer.data = property(data)
+
+
+# ============================
+# MIDDLEWARE
+# ============================
+def server_timing(medicao, total_s, repetidas):
+    ms = lambda segundos: f"{segundos * 1000:.1f}"
+    metricas = [
+        f"total;dur={ms(total_s)}",
+        f'db;dur={ms(medicao.sql_s)};desc="{medicao.consultas} consultas"',
+        f"serializacao;dur={ms(medicao.serializacao_s)}",
+        f"app;dur={ms(max(total_s - medicao.sql_s - medicao.serializacao_s, 0))}",
+    ]
+    if repetidas:
+        metricas.append(f'repetidas;desc="{sum(repetidas.values())} consultas em {len(repetidas)} SQL"')
+    return ", ".join(metricas)
+
+
+class InstrumentacaoMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = configuracao()
+        if self.config["AMOSTRAGEM"] > 0:
+            instalar_medicao_serializers()
+
+    def __call__(self, request):
+        if random.random() >= self.config["AMOSTRAGEM"]:
+            return self.get_response(request)
+
+        medicao = Medicao()
+        token = _medicao.set(medicao)
+        try:
+            with ExitStack() as pilha:
+                for conexao in connections.all():
+                    pilha.enter_context(conexao.execute_wrapper(medicao))
+                resposta = self.get_response(request)
+        finally:
+            _medicao.reset(token)
+        total_s = time.perf_counter() - medicao.inicio
+
+        repetidas = medicao.repetidas(self.config["LIMITE_REPETICOES"])
+        if self.config["CABECALHO"]:
+            resposta["Server-Timing"] = server_timing(medicao, total_s, repetidas)
+        self.registrar(request, resposta, medicao, total_s, repetidas)
+        return resposta
+
+    def registrar(self, request, resposta, medicao, total_s, repetidas):
+        rota = getattr(request.resolver_match, "route", None)
+        registro = {
+            "metodo": request.method,
+            "caminho": request.path,
+            "rota": rota,
+            "status": resposta.status_code,
+            "total_ms": round(total_s * 1000, 1),
+            "consultas": medicao.consultas,
+            "sql_ms": round(medicao.sql_s * 1000, 1),
+            "serializacao_ms": round(medicao.serializacao_s * 1000, 1),
+            "repetidas": [{"sql": sql[:300], "vezes": vezes} for sql, vezes in repetidas.items()],
+        }
+        lenta = total_s * 1000 >= self.config["LENTA_MS"]
+        nivel = logging.WARNING if lenta or repetidas else logging.INFO
+        logger.log(nivel, json.dumps(registro, ensure_ascii=False))
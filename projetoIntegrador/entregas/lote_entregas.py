@@ -0,0 +1,457 @@
+"""
+Criação e atualização de entregas em lote (POST /entregas/lote/).
+
+A lista inteira é validada em uma passada, sem um serializer por item:
+- tipo, tamanho, opções, brancos e obrigatoriedade de cada campo, pelo
+  run_validation dos campos do EntregaSerializer, montados uma vez (sem a
+  consulta de unicidade e a busca do relacionado, feitas em lote)
+- códigos repetidos no próprio lote
+- clientes, motoristas e rotas existentes: um in_bulk cada
+- capacidade das rotas: as rotas ficam travadas e a carga atual vem de uma
+  soma agrupada por rota; os itens que acrescentam carga a uma rota são
+  aceitos na ordem enviada enquanto couberem no veículo
+
+Os aceitos são gravados em uma transação: um INSERT em executemany para as
+novas e, com atualizar=True, um UPDATE em executemany para as existentes
+(só os campos enviados). bulk_create gastava mais preparando os modelos do
+que o banco gravando, e bulk_update monta um CASE por campo com um When por
+entrega. Como as gravações não disparam signals, o lote faz o que eles fariam:
+eventos de status, caches do dashboard e do rastreio, remoções da
+sincronização, capacidade utilizada das rotas e roteirização.
+
+Cada item recebe um resultado: criada, atualizada ou rejeitada (com os
+erros por campo).
+
+gravar_status (POST /entregas/status/) é o fechamento da rota pelo
+motorista: só status e data_entrega_real, a posse das entregas conferida
+em uma consulta, um UPDATE por status de destino, e a rota concluída
+quando todas as suas entregas estão entregues ou canceladas.
+"""
+from dataclasses import dataclass, field
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+
+from .eventos import eventos_de_mudancas, registrar_eventos
+from .models import Cliente, Entrega, Motorista, Rota
+from .roteirizacao import agendar_roteirizacao
+from .serializers import EntregaSerializer
+from .signals import invalidar_rastreios, invalidar_rotas
+from .sincronizacao import nova_remocao, registrar_remocoes
+
+OBRIGATORIO = "Este campo é obrigatório."
+
+STATUS_INICIAL = Entrega._meta.get_field("status").get_default()
+# o que o lote precisa das entregas que já existem
+LIDOS_EXISTENTES = ("codigo_rastreio", "status", "cliente", "motorista", "rota", "capacidade_necessaria")
+
+# campos aceitos no lote (os do EntregaSerializer que não são só de leitura)
+CAMPOS = (
+    "codigo_rastreio", "cliente", "motorista", "rota", "status", "capacidade_necessaria",
+    "endereco_origem", "endereco_destino", "observacoes", "valor_frete",
+    "data_entrega_prevista", "data_solicitacao", "data_entrega_real",
+)
+
+
+# ============================
+# VALIDADORES POR CAMPO
+# ============================
+def _sem_unicidade(campo):
+    # o código repetido é conferido em lote (no próprio lote e um in_bulk no banco)
+    campo.validators = [v for v in campo.validators if not isinstance(v, UniqueValidator)]
+    return campo
+
+
+def _chave(nome, campo):
+    """
+    FK: o valor é a chave primária do relacionado, validada por um campo do tipo
+    dela; a existência é conferida depois, em lote, e não um get() por item
+    """
+    destino = Entrega._meta.get_field(nome).target_field
+    opcoes = {"required": campo.required, "allow_null": campo.allow_null}
+    if destino.get_internal_type().endswith("AutoField"):
+        chave = serializers.IntegerField(**opcoes)
+    else:
+        chave = serializers.CharField(max_length=destino.max_length, **opcoes)
+    chave.bind(nome, campo.parent)
+    return chave
+
+
+def montar_validadores():
+    """
+    nome -> (attname, obrigatório na criação, validar): os campos do
+    EntregaSerializer, montados uma vez; validar é o run_validation deles,
+    com as mesmas regras e mensagens do POST /entregas/
+    """
+    campos = EntregaSerializer().fields
+    validadores = {}
+    for nome in CAMPOS:
+        campo = campos[nome]
+        if isinstance(campo, serializers.RelatedField):
+            campo = _chave(nome, campo)
+        else:
+            campo = _sem_unicidade(campo)
+        validadores[nome] = (Entrega._meta.get_field(nome).attname, campo.required, campo.run_validation)
+    return validadores
+
+
+VALIDADORES = montar_validadores()
+
+
+# ============================
+# ITENS
+# ============================
+@dataclass
+class Item:
+    indice: int
+    codigo: object
+    valores: dict = field(default_factory=dict)     # attname -> valor convertido
+    erros: dict = field(default_factory=dict)
+    resultado: str = ""
+
+    def rejeitar(self, campo, mensagem):
+        self.erros.setdefault(campo, mensagem)
+
+    def como_dict(self):
+        resposta = {"indice": self.indice, "codigo_rastreio": self.codigo, "resultado": self.resultado}
+        if self.erros:
+            resposta["erros"] = self.erros
+        return resposta
+
+
+def ler_item(indice, dados, campos=CAMPOS):
+    """Converte e valida os campos enviados; o que falta é conferido em gravar_lote"""
+    if not isinstance(dados, dict):
+        item = Item(indice, None)
+        item.rejeitar("item", "Cada item deve ser um objeto com os campos da entrega.")
+        return item
+    item = Item(indice, dados.get("codigo_rastreio"))
+    for nome in campos:
+        if nome not in dados:
+            continue
+        attname, _, validar = VALIDADORES[nome]
+        try:
+            item.valores[attname] = validar(dados[nome])
+        except serializers.ValidationError as erro:
+            item.rejeitar(nome, str(erro.detail[0]))
+    if "codigo_rastreio" not in dados:
+        item.rejeitar("codigo_rastreio", OBRIGATORIO)
+    return item
+
+
+@dataclass
+class ResultadoLote:
+    itens: list
+    totais: tuple = (("criadas", "criada"), ("atualizadas", "atualizada"), ("rejeitadas", "rejeitada"))
+    extras: dict = field(default_factory=dict)
+
+    def contar(self, resultado):
+        return sum(1 for item in self.itens if item.resultado == resultado)
+
+    def resumo(self):
+        return {
+            **{chave: self.contar(resultado) for chave, resultado in self.totais},
+            **self.extras,
+            "resultados": [item.como_dict() for item in self.itens],
+        }
+
+
+# ============================
+# GRAVAÇÃO
+# ============================
+def inserir_entregas(novas, agora):
+    """
+    Um INSERT parametrizado em executemany com todas as entregas novas
+    (dicts attname -> valor; o que falta recebe o padrão do campo).
+    """
+    if not novas:
+        return
+    ops = connection.ops
+    campos = [campo for campo in Entrega._meta.concrete_fields if campo.attname != "atualizado_em"]
+    padroes = {campo.attname: campo.get_default() for campo in campos}
+    colunas = ", ".join(ops.quote_name(campo.column) for campo in [*campos, Entrega._meta.get_field("atualizado_em")])
+    marcadores = ", ".join(["%s"] * (len(campos) + 1))
+    agora = ops.adapt_datetimefield_value(agora)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {ops.quote_name(Entrega._meta.db_table)} ({colunas}) VALUES ({marcadores})",
+            [
+                (
+                    *(
+                        campo.get_db_prep_save(valores.get(campo.attname, padroes[campo.attname]), connection)
+                        for campo in campos
+                    ),
+                    agora,
+                )
+                for valores in novas
+            ],
+        )
+
+
+def atualizar_entregas(atualizadas, agora):
+    """
+    Um UPDATE parametrizado em executemany por conjunto de campos enviados
+    (normalmente um só para o lote inteiro), com atualizado_em = agora.
+    """
+    grupos = {}
+    for valores in atualizadas:
+        campos = tuple(attname for attname in valores if attname != "codigo_rastreio")
+        grupos.setdefault(campos, []).append(valores)
+
+    ops = connection.ops
+    meta = Entrega._meta
+    por_attname = {campo.attname: campo for campo in meta.concrete_fields}
+    agora = ops.adapt_datetimefield_value(agora)
+    with connection.cursor() as cursor:
+        for campos, grupo in grupos.items():
+            atribuicoes = "".join(f"{ops.quote_name(por_attname[attname].column)} = %s, " for attname in campos)
+            cursor.executemany(
+                f"UPDATE {ops.quote_name(meta.db_table)} SET {atribuicoes}"
+                f"{ops.quote_name(meta.get_field('atualizado_em').column)} = %s "
+                f"WHERE {ops.quote_name(meta.pk.column)} = %s",
+                [
+                    (
+                        *(por_attname[attname].get_db_prep_save(valores[attname], connection) for attname in campos),
+                        agora,
+                        valores["codigo_rastreio"],
+                    )
+                    for valores in grupo
+                ],
+            )
+
+
+# ============================
+# LOTE
+# ============================
+def valor_final(item, atual, attname):
+    """Valor enviado no item ou, se não veio, o atual da entrega existente"""
+    if attname in item.valores:
+        return item.valores[attname]
+    return getattr(atual, attname) if atual is not None else None
+
+
+def gravar_lote(lista, atualizar=False):
+    """
+    Valida e grava a lista de entregas (dicts com os campos do EntregaSerializer).
+    atualizar=True: códigos existentes são atualizados com os campos enviados;
+    senão são rejeitados.
+    """
+    itens = [ler_item(indice, dados) for indice, dados in enumerate(lista)]
+
+    vistos = set()
+    for item in itens:
+        codigo = item.valores.get("codigo_rastreio")
+        if codigo is not None:
+            if codigo in vistos:
+                item.rejeitar("codigo_rastreio", "Código repetido no lote.")
+            vistos.add(codigo)
+    validos = [item for item in itens if not item.erros]
+
+    with transaction.atomic():
+        existentes = Entrega.objects.only(*LIDOS_EXISTENTES).in_bulk([item.valores["codigo_rastreio"] for item in validos])
+        clientes = Cliente.objects.only("pk").in_bulk(
+            list({item.valores["cliente_id"] for item in validos if item.valores.get("cliente_id")})
+        )
+        motoristas = Motorista.objects.only("pk").in_bulk(
+            list({item.valores["motorista_id"] for item in validos if item.valores.get("motorista_id")})
+        )
+        rota_ids = {item.valores.get("rota_id") for item in validos} | {e.rota_id for e in existentes.values()}
+        rota_ids.discard(None)
+        # rotas travadas: lotes concorrentes nas mesmas rotas esperam a vez
+        capacidades = dict(
+            Rota.objects.select_for_update().filter(pk__in=rota_ids)
+            .values_list("pk", "veiculo__capacidade_maxima")
+        )
+        ocupadas = dict(
+            Entrega.objects.filter(rota__in=list(capacidades))
+            .values("rota").annotate(total=Sum("capacidade_necessaria"))
+            .values_list("rota", "total")
+        )
+
+        novas, atualizadas, mudancas, desvinculos = [], [], [], []
+        afetadas = set()
+        for item in validos:
+            valores = item.valores
+            atual = existentes.get(valores["codigo_rastreio"])
+            if atual is not None and not atualizar:
+                item.rejeitar("codigo_rastreio", "Já existe uma entrega com este código.")
+                continue
+            if atual is None:
+                faltando = [
+                    nome for nome, (attname, obrigatorio, _) in VALIDADORES.items()
+                    if obrigatorio and attname not in valores
+                ]
+                for nome in faltando:
+                    item.rejeitar(nome, OBRIGATORIO)
+                if faltando:
+                    continue
+
+            cliente_id, motorista_id, rota_id = (
+                valor_final(item, atual, attname) for attname in ("cliente_id", "motorista_id", "rota_id")
+            )
+            if "cliente_id" in valores and cliente_id not in clientes:
+                item.rejeitar("cliente", "Cliente não encontrado.")
+            if "motorista_id" in valores and motorista_id is not None and motorista_id not in motoristas:
+                item.rejeitar("motorista", "Motorista não encontrado.")
+            if "rota_id" in valores and rota_id is not None and rota_id not in capacidades:
+                item.rejeitar("rota", "Rota não encontrada.")
+            if item.erros:
+                continue
+
+            # capacidade: só conta o que a entrega acrescenta à rota
+            carga = valor_final(item, atual, "capacidade_necessaria")
+            rota_anterior = atual.rota_id if atual is not None else None
+            carga_anterior = atual.capacidade_necessaria if atual is not None else 0
+            if rota_id is not None:
+                acrescimo = carga - (carga_anterior if rota_id == rota_anterior else 0)
+                if acrescimo > 0 and ocupadas.get(rota_id, 0) + acrescimo > capacidades[rota_id]:
+                    item.rejeitar("rota", "Capacidade do veículo excedida.")
+                    continue
+            if rota_anterior is not None:
+                ocupadas[rota_anterior] = ocupadas.get(rota_anterior, 0) - carga_anterior
+            if rota_id is not None:
+                ocupadas[rota_id] = ocupadas.get(rota_id, 0) + carga
+
+            if atual is None:
+                novas.append(valores)
+                mudancas.append((valores["codigo_rastreio"], None, valores.get("status", STATUS_INICIAL), rota_id))
+                item.resultado = "criada"
+            else:
+                atualizadas.append(valores)
+                mudancas.append((atual.pk, atual.status, valor_final(item, atual, "status"), rota_id))
+                if "motorista_id" in valores and atual.motorista_id not in (None, motorista_id):
+                    desvinculos.append(nova_remocao(Entrega, atual.pk, atual.motorista_id, excluido=False))
+                item.resultado = "atualizada"
+            afetadas.update({rota_id, rota_anterior})
+        afetadas.discard(None)
+
+        agora = timezone.now()
+        inserir_entregas(novas, agora)
+        # o motorista anterior já está em memória (registrar_desvinculos consultaria de novo)
+        registrar_remocoes(desvinculos)
+        atualizar_entregas(atualizadas, agora)
+        if afetadas:
+            # capacidade utilizada = soma das entregas, como no planejamento
+            soma = (
+                Entrega.objects.filter(rota=OuterRef("pk")).values("rota")
+                .annotate(total=Sum("capacidade_necessaria")).values("total")
+            )
+            Rota.objects.filter(pk__in=afetadas).update(
+                capacidade_total_utilizada=Coalesce(Subquery(soma), 0), atualizado_em=agora
+            )
+        registrar_eventos(eventos_de_mudancas(mudancas))
+
+        # as gravações em executemany não disparam signals
+        invalidar_rotas(*afetadas)
+        invalidar_rastreios(*(valores["codigo_rastreio"] for valores in [*novas, *atualizadas]))
+        agendar_roteirizacao(*afetadas)
+
+    for item in itens:
+        if item.erros:
+            item.resultado = "rejeitada"
+    return ResultadoLote(itens)
+
+
+# ============================
+# STATUS EM LOTE
+# ============================
+# Status em que a entrega está encerrada; a rota com todas as entregas
+# encerradas é concluída
+ENCERRADAS = (Entrega.Status_entrega.ENTREGUE, Entrega.Status_entrega.CANCELADA)
+CAMPOS_STATUS = ("codigo_rastreio", "status", "data_entrega_real")
+
+
+def concluir_rotas(rota_ids, agora):
+    """Marca como concluídas as rotas sem entregas em aberto; devolve os ids"""
+    if not rota_ids:
+        return []
+    em_aberto = Entrega.objects.filter(rota=OuterRef("pk")).exclude(status__in=ENCERRADAS)
+    concluidas = list(
+        Rota.objects.filter(pk__in=rota_ids)
+        .exclude(status_rota=Rota.Status_rota.CONCLUIDA)
+        .exclude(Exists(em_aberto))
+        .values_list("pk", flat=True)
+    )
+    if concluidas:
+        Rota.objects.filter(pk__in=concluidas).update(status_rota=Rota.Status_rota.CONCLUIDA, atualizado_em=agora)
+    return concluidas
+
+
+def gravar_status(lista, motorista_id=None):
+    """
+    Aplica [{codigo_rastreio, status, data_entrega_real}] de uma vez.
+    motorista_id: só as entregas desse motorista podem ser alteradas (None =
+    administrador, qualquer entrega). Entregas marcadas como entregues sem
+    data_entrega_real recebem a data de hoje.
+    """
+    itens = [ler_item(indice, dados, CAMPOS_STATUS) for indice, dados in enumerate(lista)]
+    vistos = set()
+    for item in itens:
+        if "status" not in item.valores and "status" not in item.erros:
+            item.rejeitar("status", OBRIGATORIO)
+        codigo = item.valores.get("codigo_rastreio")
+        if codigo in vistos:
+            item.rejeitar("codigo_rastreio", "Código repetido no lote.")
+        vistos.add(codigo)
+    validos = [item for item in itens if not item.erros]
+
+    with transaction.atomic():
+        # uma consulta, com as entregas travadas: o status anterior dos eventos é o gravado
+        atuais = {
+            codigo: (status, data, dono, rota_id)
+            for codigo, status, data, dono, rota_id in Entrega.objects.select_for_update()
+            .filter(pk__in=[item.valores["codigo_rastreio"] for item in validos])
+            .values_list("pk", "status", "data_entrega_real", "motorista_id", "rota_id")
+        }
+
+        hoje = timezone.localdate()
+        grupos, mudancas, afetadas = {}, [], set()
+        for item in validos:
+            codigo, status = item.valores["codigo_rastreio"], item.valores["status"]
+            atual = atuais.get(codigo)
+            if atual is None:
+                item.rejeitar("codigo_rastreio", "Entrega não encontrada.")
+                continue
+            status_anterior, data_anterior, dono, rota_id = atual
+            if motorista_id is not None and dono != motorista_id:
+                item.rejeitar("codigo_rastreio", "Você não tem permissão para alterar esta entrega.")
+                continue
+            data = item.valores.get("data_entrega_real", data_anterior)
+            if status == Entrega.Status_entrega.ENTREGUE and data is None:
+                data = hoje
+            if (status, data) == (status_anterior, data_anterior):
+                item.resultado = "inalterada"
+                continue
+            grupos.setdefault((status, data), []).append(codigo)
+            mudancas.append((codigo, status_anterior, status, rota_id))
+            afetadas.add(rota_id)
+            item.resultado = "atualizada"
+        afetadas.discard(None)
+
+        # um UPDATE por status (e data) de destino
+        agora = timezone.now()
+        for (status, data), codigos in grupos.items():
+            Entrega.objects.filter(pk__in=codigos).update(
+                status=status, data_entrega_real=data, atualizado_em=agora
+            )
+        if afetadas:
+            # as entregas da rota mudaram: nova versão para o GET condicional e a sincronização
+            Rota.objects.filter(pk__in=afetadas).update(atualizado_em=agora)
+        concluidas = concluir_rotas(afetadas, agora)
+        registrar_eventos(eventos_de_mudancas(mudancas))
+
+        invalidar_rotas(*afetadas)
+        invalidar_rastreios(*(codigo for codigo, *_ in mudancas))
+
+    for item in itens:
+        if item.erros:
+            item.resultado = "rejeitada"
+    return ResultadoLote(
+        itens,
+        totais=(("atualizadas", "atualizada"), ("inalteradas", "inalterada"), ("rejeitadas", "rejeitada")),
+        extras={"rotas_concluidas": concluidas},
+    )
@@ -0,0 +1,68 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from entregas.cache import cache_rastreio
+from entregas.models import Entrega
+from entregas.views import EntregaViewSet, rastreio
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a latência do rastreio público (/rastreio/<codigo>/) com e sem cache, "
+        "comparada à consulta pelo EntregaViewSet (?codigo_rastreio=)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--codigo", help="Código de rastreio consultado (padrão: a primeira entrega)")
+        parser.add_argument("--repeticoes", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        codigo = options["codigo"] or Entrega.objects.values_list("codigo_rastreio", flat=True).first()
+        if not codigo:
+            raise CommandError("Nenhuma entrega cadastrada para consultar.")
+        repeticoes = options["repeticoes"]
+
+        # chama as views direto: mede a view, sem o custo dos middlewares
+        fabrica = RequestFactory(HTTP_HOST="localhost")
+        requisicao = fabrica.get(f"/rastreio/{codigo}/")
+        lista = EntregaViewSet.as_view({"get": "list"})
+        requisicao_drf = fabrica.get("/entregas/", {"codigo_rastreio": codigo})
+        cache = cache_rastreio()
+
+        def sem_cache():
+            cache.delete(codigo)
+            return rastreio(requisicao, codigo=codigo)
+
+        def com_cache():
+            return rastreio(requisicao, codigo=codigo)
+
+        def drf():
+            return lista(requisicao_drf).render()
+
+        self.stdout.write(f"Código {codigo}, {repeticoes} consultas por cenário (latência em ms)")
+        for nome, consulta, vezes in (
+            ("rastreio sem cache", sem_cache, repeticoes),
+            ("rastreio com cache", com_cache, repeticoes),
+            # o caminho antigo é bem mais lento: uma amostra menor basta
+            ("EntregaViewSet", drf, max(1, repeticoes // 10)),
+        ):
+            resposta = consulta()
+            if resposta.status_code != 200:
+                raise CommandError(f"{nome}: resposta {resposta.status_code}")
+            self.stdout.write(self.medir(nome, consulta, vezes))
+
+    def medir(self, nome, consulta, vezes):
+        tempos = []
+        for _ in range(vezes):
+            inicio = time.perf_counter()
+            consulta()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        tempos.sort()
+        p99 = tempos[min(len(tempos) - 1, int(len(tempos) * 0.99))]
+        return (
+            f"  {nome:<20} média {statistics.fmean(tempos):.4f}  "
+            f"p50 {statistics.median(tempos):.4f}  p99 {p99:.4f}"
+        )
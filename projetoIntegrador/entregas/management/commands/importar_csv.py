@@ -1,37 +1,86 @@
 import os
+import sys
 import csv
-from datetime import timedelta, datetime
-from django.core.management.base import BaseCommand
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from entregas.models import Cliente, Motorista, Veiculo, Rota, Entrega
-
-
-def converter_tempo(texto):
-    """Converte string hh:mm:ss em timedelta"""
-    if not texto:
-        return None
-    try:
-        h, m, s = map(int, texto.split(":"))
-        return timedelta(hours=h, minutes=m, seconds=s)
-    except Exception:
-        return None
-
-
-def converter_data(texto):
-    """Converte string YYYY-MM-DD em date"""
-    if not texto:
-        return None
-    try:
-        return datetime.strptime(texto, "%Y-%m-%d").date()
-    except Exception:
-        return None
+from entregas.importacao import (
+    converter_tempo, converter_data, ImportadorLote, TABELAS, ler_em_blocos,
+    ordem_de_importacao, importar_em_paralelo
+)
+from entregas.metricas import registrar_importacao
+from entregas.validacao_csv import validar
 
 
 class Command(BaseCommand):
-    help = "Importa automaticamente todos os CSVs da pasta /csv"
+    help = (
+        "Importa automaticamente todos os CSVs da pasta /csv, "
+        "ou os arquivos informados (use '-' para ler da entrada padrão)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "arquivos",
+            nargs="*",
+            help="Arquivos CSV a importar em lote; o nome define a tabela (ex.: entregas.csv)",
+        )
+        parser.add_argument(
+            "--tabela",
+            choices=[nome.removesuffix(".csv") for nome in TABELAS],
+            help="Tabela do arquivo informado, quando o nome não a identifica (obrigatório para '-')",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Modo lote que só grava linhas novas ou alteradas desde a última importação",
+        )
+        parser.add_argument(
+            "--processos",
+            type=int,
+            default=1,
+            help="Importa arquivos independentes em paralelo, em até N processos (modo lote)",
+        )
+        parser.add_argument(
+            "--reiniciar",
+            action="store_true",
+            help="Ignora os checkpoints e importa os arquivos desde o início",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Apenas valida os arquivos e gera o relatório de erros, sem gravar nada",
+        )
+        parser.add_argument(
+            "--relatorio",
+            help="Arquivo .json ou .csv onde salvar o relatório do --dry-run",
+        )
+        parser.add_argument(
+            "--lote",
+            action="store_true",
+            help="Importa em lote (bulk_create e UPDATE em executemany) em vez de linha a linha",
+        )
+        parser.add_argument(
+            "--tamanho-lote",
+            type=int,
+            default=500,
+            help="Quantidade de linhas gravadas por transação no modo --lote (padrão: 500)",
+        )
 
     def handle(self, *args, **kwargs):
+        if kwargs["arquivos"]:
+            arquivos = self.resolver_arquivos(kwargs["arquivos"], kwargs["tabela"])
+            if kwargs["dry_run"]:
+                self.validar(arquivos, kwargs["relatorio"])
+                return
+            self.importar_em_lote(
+                arquivos, kwargs["tamanho_lote"], kwargs["reiniciar"],
+                kwargs["incremental"], kwargs["processos"]
+            )
+            return
+
         base_dir = settings.BASE_DIR
         csv_folder = os.path.join(base_dir, "csv")
 
@@ -42,13 +91,28 @@ class Command(BaseCommand):
             self.stdout.write("ERRO: pasta CSV não encontrada")
             return
 
-        order = [
-            "clientes.csv",
-            "motoristas.csv",
-            "veiculos.csv",
-            "rotas.csv",
-            "entregas.csv",
-        ]
+        # clientes → motoristas → veiculos → rotas → entregas, conforme as FKs dos modelos
+        order = ordem_de_importacao()
+
+        if kwargs["dry_run"]:
+            arquivos = [
+                (TABELAS[file_name], os.path.join(csv_folder, file_name))
+                for file_name in order
+                if os.path.exists(os.path.join(csv_folder, file_name))
+            ]
+            self.validar(arquivos, kwargs["relatorio"])
+            return
+
+        if kwargs["lote"] or kwargs["incremental"] or kwargs["processos"] > 1:
+            arquivos = [
+                (TABELAS[file_name], os.path.join(csv_folder, file_name))
+                for file_name in order
+            ]
+            self.importar_em_lote(
+                arquivos, kwargs["tamanho_lote"], kwargs["reiniciar"],
+                kwargs["incremental"], kwargs["processos"]
+            )
+            return
 
         for file_name in order:
             file_path = os.path.join(csv_folder, file_name)
@@ -179,3 +243,124 @@ class Command(BaseCommand):
             self.stdout.write(f"Finalizado: {file_name}")
 
         self.stdout.write("\nIMPORTAÇÃO CONCLUÍDA COM SUCESSO!")
+
+    def validar(self, arquivos, relatorio_path):
+        if any(caminho == "-" for _, caminho in arquivos):
+            raise CommandError("--dry-run não aceita a entrada padrão")
+
+        relatorio, segundos = validar(arquivos)
+        resumo = relatorio.resumo()
+
+        for tabela, _ in arquivos:
+            self.stdout.write(
+                f"{tabela.arquivo}: {relatorio.linhas.get(tabela.arquivo, 0)} linhas, "
+                f"{resumo[(tabela.arquivo, 'erro')]} erros, {resumo[(tabela.arquivo, 'aviso')]} avisos"
+            )
+        for ocorrencia in relatorio.ocorrencias[:20]:
+            self.stdout.write(
+                f"  [{ocorrencia['nivel']}] {ocorrencia['arquivo']} linha {ocorrencia['linha']}, "
+                f"{ocorrencia['coluna']}={ocorrencia['valor']!r}: {ocorrencia['mensagem']}"
+            )
+        if len(relatorio.ocorrencias) > 20:
+            self.stdout.write(f"  ... e mais {len(relatorio.ocorrencias) - 20} ocorrências")
+
+        if relatorio_path:
+            relatorio.salvar(relatorio_path)
+            self.stdout.write(f"Relatório salvo em: {relatorio_path}")
+
+        self.stdout.write(f"Validação concluída em {segundos:.2f}s")
+        if relatorio.erros:
+            raise CommandError(f"{relatorio.erros} erros encontrados; nada foi importado")
+
+    def resolver_arquivos(self, caminhos, tabela):
+        """Associa cada caminho à sua tabela, na ordem de dependência"""
+        if tabela and len(caminhos) > 1:
+            raise CommandError("--tabela só pode ser usado com um único arquivo")
+
+        ordem = ordem_de_importacao()
+        arquivos = []
+        for caminho in caminhos:
+            nome = f"{tabela}.csv" if tabela else Path(caminho).name
+            if nome not in TABELAS:
+                raise CommandError(f"Não foi possível identificar a tabela de '{caminho}'; use --tabela")
+            if caminho != "-" and not os.path.exists(caminho):
+                raise CommandError(f"Arquivo não encontrado: {caminho}")
+            arquivos.append((TABELAS[nome], caminho))
+
+        return sorted(arquivos, key=lambda item: ordem.index(item[0].arquivo))
+
+    def importar_em_lote(self, arquivos, tamanho_lote, reiniciar, incremental, processos):
+        encontrados = []
+        for tabela, caminho in arquivos:
+            if caminho != "-" and not os.path.exists(caminho):
+                self.stdout.write(f"Arquivo não encontrado: {tabela.arquivo}")
+                continue
+            encontrados.append((tabela, caminho))
+
+        inicio = time.perf_counter()
+        if processos > 1 and all(caminho != "-" for _, caminho in encontrados):
+            total_linhas = self.importar_em_paralelo(
+                encontrados, processos, tamanho_lote, reiniciar, incremental
+            )
+        else:
+            total_linhas = self.importar_em_sequencia(
+                encontrados, tamanho_lote, reiniciar, incremental
+            )
+
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(
+            f"\nIMPORTAÇÃO CONCLUÍDA COM SUCESSO! {total_linhas} linhas em {segundos:.2f}s "
+            f"({total_linhas / segundos if segundos else 0:.0f} linhas/s)"
+        )
+
+    def importar_em_sequencia(self, arquivos, tamanho_lote, reiniciar, incremental):
+        importador = ImportadorLote(
+            tamanho_lote=tamanho_lote, saida=self.stdout.write, incremental=incremental
+        )
+        total_linhas = 0
+
+        for tabela, caminho in arquivos:
+            self.stdout.write(f"\nImportando em lote: {caminho}")
+
+            if caminho == "-":
+                # entrada padrão não permite retomar: é lida em fluxo, sem checkpoint
+                blocos = ler_em_blocos(sys.stdin.buffer, tamanho_lote)
+                resultado = importador.importar_blocos(tabela, blocos)
+            else:
+                resultado = importador.importar_arquivo(tabela, caminho, reiniciar)
+
+            if resultado is None:
+                self.stdout.write(f"{tabela.arquivo} já foi importado por completo (use --reiniciar)")
+                continue
+
+            total_linhas += resultado.linhas
+            self.stdout.write(f"Finalizado: {tabela.arquivo} - {resultado}")
+            registrar_importacao(resultado)
+
+        return total_linhas
+
+    def importar_em_paralelo(self, arquivos, processos, tamanho_lote, reiniciar, incremental):
+        self.stdout.write(f"\nImportando em lote com {processos} processos: {len(arquivos)} arquivos")
+        total_linhas = 0
+        falhas = []
+
+        resultados = importar_em_paralelo(
+            arquivos, processos, tamanho_lote, incremental=incremental, reiniciar=reiniciar
+        )
+        for tabela, resultado, mensagens, erro in resultados:
+            for mensagem in mensagens:
+                self.stdout.write(mensagem)
+
+            if erro:
+                falhas.append(tabela.arquivo)
+                self.stdout.write(f"ERRO em {tabela.arquivo}: {erro}")
+            elif resultado is None:
+                self.stdout.write(f"{tabela.arquivo} já foi importado por completo (use --reiniciar)")
+            else:
+                total_linhas += resultado.linhas
+                self.stdout.write(f"Finalizado: {tabela.arquivo} - {resultado}")
+                registrar_importacao(resultado)
+
+        if falhas:
+            raise CommandError(f"Falha na importação de: {', '.join(falhas)}")
+        return total_linhas
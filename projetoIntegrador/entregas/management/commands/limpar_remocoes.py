@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from entregas.sincronizacao import configuracao, limpar_remocoes
+
+
+class Command(BaseCommand):
+    help = (
+        "Exclui as remoções da sincronização incremental mais antigas que "
+        "ENTREGAS_SINCRONIZACAO['RETENCAO_DIAS'] (aplicativos com cursor mais antigo recebem tudo de novo)"
+    )
+
+    def handle(self, *args, **options):
+        excluidas = limpar_remocoes()
+        self.stdout.write(
+            f"{excluidas} remoções com mais de {configuracao()['RETENCAO_DIAS']} dias excluídas."
+        )
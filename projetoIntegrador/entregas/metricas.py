@@ -0,0 +1,378 @@
+"""
+Métricas da API no formato texto do Prometheus (GET /metricas/).
+
+- latência das requisições (histograma) por view e ação do ViewSet
+  (list, retrieve, adicionar_entrega, capacidade, rota-dashboard...)
+- consultas SQL por requisição (histograma), com as mesmas etiquetas
+- erros (status >= 400) por view, ação e status
+- acertos e falhas dos caches em memória (dashboard, rastreio, tokens):
+  a taxa de acerto é acertos / (acertos + falhas)
+- linhas e segundos das importações em lote do importar_csv
+
+Cada processo (workers do servidor, o importar_csv) acumula as suas
+séries em memória e grava um retrato delas em um arquivo próprio no
+DIRETORIO a cada INTERVALO_GRAVACAO segundos e ao terminar. O endpoint
+soma os arquivos de todos os processos: os histogramas têm os mesmos
+limites em todos, então p50/p99 saem da soma (histogram_quantile) como se
+houvesse um só processo.
+
+Os arquivos de processos encerrados, sem gravação há mais de
+RETENCAO_HORAS, são somados a um arquivo acumulado (ACUMULADO) em vez de
+apagados: os contadores nunca diminuem, o que o Prometheus leria como um
+reinício (e um pico no rate()). O acumulado lista os arquivos que já
+contém, que o endpoint deixa de somar; eles só são apagados na acumulação
+seguinte, então quem leu o acumulado anterior ainda os encontra.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+PADRAO = {
+    "DIRETORIO": None,              # padrão: <tmp>/entregas-metricas
+    "INTERVALO_GRAVACAO": 5,        # segundos
+    "RETENCAO_HORAS": 24,
+    "IPS_PERMITIDOS": ("127.0.0.1", "::1"),
+    "TOKEN": None,                  # exige Authorization: Bearer <TOKEN> em vez dos IPs
+}
+
+ACUMULADO = "acumulado.json"
+TRAVA_ACUMULADO = "acumulado.lock"
+TRAVA_EXPIRA_SEGUNDOS = 60      # trava de um processo que morreu acumulando
+
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_CONSULTAS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+# nome -> (tipo, descrição, limites dos histogramas)
+METRICAS = {
+    "entregas_requisicao_segundos": (
+        "histogram", "Latência das requisições por view e ação", LIMITES_LATENCIA,
+    ),
+    "entregas_requisicao_consultas_sql": (
+        "histogram", "Consultas SQL por requisição, por view e ação", LIMITES_CONSULTAS,
+    ),
+    "entregas_requisicao_erros_total": ("counter", "Respostas com status >= 400 por view, ação e status", None),
+    "entregas_cache_acertos_total": ("counter", "Acertos dos caches em memória", None),
+    "entregas_cache_falhas_total": ("counter", "Falhas dos caches em memória", None),
+    "entregas_importacao_linhas_total": ("counter", "Linhas processadas pelo importar_csv em lote", None),
+    "entregas_importacao_segundos_total": ("counter", "Tempo gasto pelo importar_csv em lote", None),
+}
+
+
+def configuracao():
+    config = {**PADRAO, **getattr(settings, "ENTREGAS_METRICAS", {})}
+    config["DIRETORIO"] = config["DIRETORIO"] or os.path.join(tempfile.gettempdir(), "entregas-metricas")
+    return config
+
+
+# ============================
+# REGISTRO DO PROCESSO
+# ============================
+class Registro:
+    """Séries do processo: (nome, etiquetas) -> valor, ou contagens por faixa + soma nos histogramas"""
+
+    def __init__(self):
+        self._valores = {}
+        self._coletores = []
+        self._lock = threading.Lock()
+        self._arquivo = None
+        self._gravado_em = time.monotonic()
+
+    def incrementar(self, nome, valor=1, **etiquetas):
+        chave = (nome, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def observar(self, nome, valor, **etiquetas):
+        limites = METRICAS[nome][2]
+        chave = (nome, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            serie = self._valores.get(chave)
+            if serie is None:
+                # uma contagem por faixa (a última é +Inf) e a soma
+                serie = self._valores[chave] = [0] * (len(limites) + 2)
+            serie[bisect_left(limites, valor)] += 1
+            serie[-1] += valor
+
+    def coletor(self, funcao):
+        """funcao() -> [(nome, etiquetas, valor)] com valores lidos na hora de gravar"""
+        self._coletores.append(funcao)
+        return funcao
+
+    def retrato(self):
+        with self._lock:
+            valores = {chave: list(valor) if isinstance(valor, list) else valor for chave, valor in self._valores.items()}
+        for coletar in self._coletores:
+            for nome, etiquetas, valor in coletar():
+                valores[(nome, tuple(sorted(etiquetas.items())))] = valor
+        return valores
+
+    def gravar(self):
+        """Grava o retrato no arquivo do processo (troca atômica)"""
+        config = configuracao()
+        os.makedirs(config["DIRETORIO"], exist_ok=True)
+        if self._arquivo is None:
+            # o pid pode ser reutilizado: a hora de início separa os processos
+            self._arquivo = os.path.join(config["DIRETORIO"], f"{os.getpid()}-{time.time_ns()}.json")
+        series = [[nome, list(etiquetas), valor] for (nome, etiquetas), valor in self.retrato().items()]
+        descritor, temporario = tempfile.mkstemp(dir=config["DIRETORIO"], suffix=".tmp")
+        with os.fdopen(descritor, "w") as arquivo:
+            json.dump(series, arquivo)
+        os.replace(temporario, self._arquivo)
+        self._gravado_em = time.monotonic()
+
+    def gravar_periodicamente(self, intervalo):
+        if time.monotonic() - self._gravado_em >= intervalo:
+            self.gravar()
+
+
+registro = Registro()
+
+
+def _gravar_ao_sair():
+    if registro._valores:
+        registro.gravar()
+
+
+atexit.register(_gravar_ao_sair)
+
+
+@registro.coletor
+def coletar_caches():
+    from .authentication import cache_tokens
+    from .cache import cache_dashboard, cache_rastreio
+
+    for nome, cache in (("dashboard", cache_dashboard()), ("rastreio", cache_rastreio()), ("tokens", cache_tokens())):
+        # só o backend "memoria" conta acertos e falhas
+        if hasattr(cache, "acertos"):
+            yield "entregas_cache_acertos_total", {"cache": nome}, cache.acertos
+            yield "entregas_cache_falhas_total", {"cache": nome}, cache.falhas
+
+
+def registrar_importacao(resultado):
+    """Linhas e tempo de um Resultado do ImportadorLote; gravado na hora (o comando termina logo)"""
+    for situacao in ("inseridas", "atualizadas", "ignoradas", "rejeitadas"):
+        registro.incrementar(
+            "entregas_importacao_linhas_total", getattr(resultado, situacao),
+            arquivo=resultado.arquivo, situacao=situacao,
+        )
+    registro.incrementar("entregas_importacao_segundos_total", resultado.segundos, arquivo=resultado.arquivo)
+    registro.gravar()
+
+
+# ============================
+# AGREGAÇÃO E FORMATO TEXTO
+# ============================
+def _somar(totais, series):
+    for nome, etiquetas, valor in series:
+        if nome not in METRICAS:
+            continue
+        chave = (nome, tuple(tuple(par) for par in etiquetas))
+        atual = totais.get(chave)
+        if atual is None:
+            totais[chave] = valor
+        elif isinstance(valor, list):
+            totais[chave] = [a + b for a, b in zip(atual, valor)]
+        else:
+            totais[chave] = atual + valor
+
+
+def _ler(caminho):
+    with open(caminho) as arquivo:
+        return json.load(arquivo)
+
+
+def _ler_acumulado(diretorio):
+    try:
+        return _ler(os.path.join(diretorio, ACUMULADO))
+    except (OSError, ValueError):
+        return {"arquivos": [], "series": []}
+
+
+def _processo_encerrado(nome_arquivo):
+    """O arquivo é de um processo que já terminou? (o nome começa pelo pid)"""
+    try:
+        pid = int(nome_arquivo.split("-", 1)[0])
+    except ValueError:
+        return True
+    if os.name != "posix":
+        return True     # sem os.kill(pid, 0): vale só a idade do arquivo
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass            # existe, de outro usuário
+    return False
+
+
+def agregar():
+    """Soma das séries gravadas por todos os processos (inclusive este, gravado agora)"""
+    config = configuracao()
+    diretorio = config["DIRETORIO"]
+    registro.gravar()
+    limite = time.time() - config["RETENCAO_HORAS"] * 3600
+    acumulado = _ler_acumulado(diretorio)
+    ja_acumulados = set(acumulado["arquivos"])
+    totais = {}
+    _somar(totais, acumulado["series"])
+    expirados = []
+    for nome_arquivo in os.listdir(diretorio):
+        if not nome_arquivo.endswith(".json") or nome_arquivo == ACUMULADO or nome_arquivo in ja_acumulados:
+            continue
+        caminho = os.path.join(diretorio, nome_arquivo)
+        try:
+            expirado = os.path.getmtime(caminho) < limite
+            series = _ler(caminho)
+        except (OSError, ValueError):
+            continue
+        _somar(totais, series)
+        if expirado and _processo_encerrado(nome_arquivo):
+            expirados.append(nome_arquivo)
+    if expirados or ja_acumulados:
+        acumular(diretorio, expirados)
+    return totais
+
+
+def acumular(diretorio, expirados):
+    """
+    Soma os arquivos expirados ao acumulado e apaga os que a acumulação
+    anterior já somou. Um processo por vez (trava com O_EXCL); se outro
+    estiver acumulando, fica para a próxima leitura.
+    """
+    trava = os.path.join(diretorio, TRAVA_ACUMULADO)
+    try:
+        os.close(os.open(trava, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        try:
+            if os.path.getmtime(trava) < time.time() - TRAVA_EXPIRA_SEGUNDOS:
+                os.remove(trava)
+        except OSError:
+            pass
+        return
+
+    try:
+        acumulado = _ler_acumulado(diretorio)
+        somados = set(acumulado["arquivos"])
+        for nome_arquivo in somados:
+            try:
+                os.remove(os.path.join(diretorio, nome_arquivo))
+            except FileNotFoundError:
+                pass
+
+        totais = {}
+        _somar(totais, acumulado["series"])
+        arquivos = []
+        for nome_arquivo in expirados:
+            if nome_arquivo in somados:
+                continue
+            try:
+                _somar(totais, _ler(os.path.join(diretorio, nome_arquivo)))
+            except (OSError, ValueError):
+                continue
+            arquivos.append(nome_arquivo)
+
+        conteudo = {
+            "arquivos": arquivos,
+            "series": [[nome, list(etiquetas), valor] for (nome, etiquetas), valor in totais.items()],
+        }
+        descritor, temporario = tempfile.mkstemp(dir=diretorio, suffix=".tmp")
+        with os.fdopen(descritor, "w") as arquivo:
+            json.dump(conteudo, arquivo)
+        os.replace(temporario, os.path.join(diretorio, ACUMULADO))
+    finally:
+        os.remove(trava)
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ""
+    escapar = lambda texto: str(texto).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{nome}="{escapar(valor)}"' for nome, valor in pares) + "}"
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def formato_texto(totais):
+    """Séries no formato de exposição texto do Prometheus (0.0.4)"""
+    por_nome = {}
+    for (nome, etiquetas), valor in sorted(totais.items()):
+        por_nome.setdefault(nome, []).append((etiquetas, valor))
+
+    linhas = []
+    for nome, (tipo, descricao, limites) in METRICAS.items():
+        linhas += [f"# HELP {nome} {descricao}", f"# TYPE {nome} {tipo}"]
+        for etiquetas, valor in por_nome.get(nome, ()):
+            if tipo != "histogram":
+                linhas.append(f"{nome}{_etiquetas(etiquetas)} {_numero(valor)}")
+                continue
+            acumulado = 0
+            for limite, contagem in zip([*map(str, limites), "+Inf"], valor[:-1]):
+                acumulado += contagem
+                linhas.append(f"{nome}_bucket{_etiquetas([*etiquetas, ('le', limite)])} {acumulado}")
+            linhas.append(f"{nome}_sum{_etiquetas(etiquetas)} {_numero(valor[-1])}")
+            linhas.append(f"{nome}_count{_etiquetas(etiquetas)} {acumulado}")
+    return "\n".join(linhas) + "\n"
+
+
+# ============================
+# MIDDLEWARE
+# ============================
+class ContadorConsultas:
+    """execute_wrapper que só conta as consultas"""
+
+    def __init__(self):
+        self.consultas = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas += 1
+        return execute(sql, params, many, context)
+
+
+def identificar(request):
+    """(view, ação) da requisição: a classe e a ação do ViewSet, ou a view e o nome da URL"""
+    rota = request.resolver_match
+    if rota is None:
+        return "nenhuma", "nenhuma"
+    metodo = request.method.lower()
+    classe = getattr(rota.func, "cls", None)
+    acoes = getattr(rota.func, "actions", None)
+    view = classe.__name__ if classe is not None else rota.func.__name__
+    if acoes:
+        return view, acoes.get(metodo, metodo)
+    return view, rota.url_name or metodo
+
+
+class MetricasMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.intervalo = configuracao()["INTERVALO_GRAVACAO"]
+
+    def __call__(self, request):
+        contador = ContadorConsultas()
+        inicio = time.perf_counter()
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(contador))
+            resposta = self.get_response(request)
+        duracao = time.perf_counter() - inicio
+
+        view, acao = identificar(request)
+        registro.observar("entregas_requisicao_segundos", duracao, view=view, acao=acao)
+        registro.observar("entregas_requisicao_consultas_sql", contador.consultas, view=view, acao=acao)
+        if resposta.status_code >= 400:
+            registro.incrementar(
+                "entregas_requisicao_erros_total", view=view, acao=acao, status=str(resposta.status_code)
+            )
+        registro.gravar_periodicamente(self.intervalo)
+        return resposta
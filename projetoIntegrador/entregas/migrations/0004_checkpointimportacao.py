@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0003_entrega_motorista'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckpointImportacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash_arquivo', models.CharField(max_length=64)),
+                ('arquivo', models.CharField(max_length=100)),
+                ('caminho', models.CharField(max_length=500)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('linha', models.PositiveBigIntegerField(default=0)),
+                ('concluido', models.BooleanField(default=False)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hash_arquivo', 'arquivo'), name='checkpoint_arquivo_unico')],
+            },
+        ),
+    ]
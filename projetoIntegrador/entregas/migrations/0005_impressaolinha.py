@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0004_checkpointimportacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImpressaoLinha',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabela', models.CharField(max_length=30)),
+                ('chave', models.CharField(max_length=64)),
+                ('hash', models.CharField(max_length=32)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tabela', 'chave'), name='impressao_linha_unica')],
+            },
+        ),
+    ]
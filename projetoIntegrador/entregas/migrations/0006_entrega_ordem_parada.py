@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0005_impressaolinha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entrega',
+            name='ordem_parada',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:31
+
+from django.db import migrations, models
+
+from entregas.geocodificacao import geocodificar_clientes
+
+
+def geocodificar_existentes(apps, schema_editor):
+    Cliente = apps.get_model('entregas', 'Cliente')
+    coordenadas = geocodificar_clientes(Cliente.objects.all())
+    clientes = []
+    for cliente in Cliente.objects.filter(pk__in=[pk for pk, par in coordenadas.items() if par]).only('pk'):
+        cliente.latitude, cliente.longitude = coordenadas[cliente.pk]
+        clientes.append(cliente)
+    Cliente.objects.bulk_update(clientes, ['latitude', 'longitude'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0006_entrega_ordem_parada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(geocodificar_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:34
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0007_cliente_coordenadas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='veiculo',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='veiculo',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.AddField(
+            model_name='veiculo',
+            name='posicao_atualizada_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0008_veiculo_posicao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Telemetria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('registrada_em', models.DateTimeField()),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('km', models.PositiveIntegerField(blank=True, null=True)),
+                ('velocidade_kmh', models.FloatField(blank=True, null=True)),
+                ('veiculo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='entregas.veiculo')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['veiculo', 'registrada_em'], name='entregas_te_veiculo_0afd9b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0009_telemetria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntregaEvento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ocorrido_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('status_anterior', models.CharField(blank=True, choices=[('P', 'Pendente'), ('T', 'Em trânsito'), ('E', 'Entregue'), ('C', 'Cancelada'), ('R', 'Remarcada')], max_length=1, null=True)),
+                ('status_novo', models.CharField(choices=[('P', 'Pendente'), ('T', 'Em trânsito'), ('E', 'Entregue'), ('C', 'Cancelada'), ('R', 'Remarcada')], max_length=1)),
+                ('entrega', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='eventos', to='entregas.entrega')),
+                ('rota', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='entregas.rota')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['entrega', 'ocorrido_em'], name='entregas_en_entrega_f14d4d_idx'), models.Index(fields=['ocorrido_em'], name='entregas_en_ocorrid_74332b_idx')],
+            },
+        ),
+    ]
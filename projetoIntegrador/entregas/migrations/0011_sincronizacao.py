@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entregas', '0010_entrega_evento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Remocao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('entrega', 'Entrega'), ('rota', 'Rota'), ('veiculo', 'Veículo')], max_length=10)),
+                ('chave', models.CharField(max_length=20)),
+                ('excluido', models.BooleanField(default=True)),
+                ('removido_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='entrega',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='rota',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='veiculo',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='entrega',
+            index=models.Index(fields=['motorista', 'atualizado_em'], name='entregas_en_motoris_509c08_idx'),
+        ),
+        migrations.AddField(
+            model_name='remocao',
+            name='motorista',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='entregas.motorista'),
+        ),
+        migrations.AddIndex(
+            model_name='remocao',
+            index=models.Index(fields=['motorista', 'removido_em'], name='entregas_re_motoris_467581_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='remocao',
+            index=models.Index(fields=['removido_em'], name='entregas_re_removid_d4e01e_idx'),
+        ),
+    ]
@@ -1,6 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
+
+from .geocodificacao import coordenadas_cliente
 
 
 
@@ -74,19 +78,33 @@ class Veiculo(models.Model):
         choices=Status_veiculo.choices,
         default=Status_veiculo.DISPONIVEL
     )
+    # Última posição conhecida (espacial.py)
+    latitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
+    posicao_atualizada_em = models.DateTimeField(null=True, blank=True)
+    # Última gravação, para a sincronização incremental (sincronizacao.py)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    # CNHs aceitas para cada tipo de veículo
+    COMPATIBILIDADE_CNH = {
+        "1": ["B","C","D","E"],
+        "2": ["D","E"],
+        "3": ["C","E"]
+    }
 
     # Valida compatibilidade entre CNH e tipo de veículo
     def clean(self):
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValidationError("Informe latitude e longitude juntas.")
+
         if self.motorista_ativo:
             cnh = self.motorista_ativo.cnh
-            
-            compatibilidade = {
-                "1": ["B","C","D","E"],
-                "2": ["D","E"],
-                "3": ["C","E"]
-            }
 
-            tipos_validos = compatibilidade.get(self.tipo, [])
+            tipos_validos = self.COMPATIBILIDADE_CNH.get(self.tipo, [])
 
             if cnh not in tipos_validos:
                 raise ValidationError(
@@ -94,9 +112,23 @@ class Veiculo(models.Model):
                     f"mas o veículo {self.get_tipo_display()} exige: {', '.join(tipos_validos)}."
                 )
 
+    # Guarda a posição carregada do banco para saber quando ela muda
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        veiculo = super().from_db(db, field_names, values)
+        veiculo._posicao_original = (veiculo.__dict__.get("latitude"), veiculo.__dict__.get("longitude"))
+        return veiculo
+
     # Garante validação antes de salvar
     def save(self, *args, **kwargs):
         self.full_clean() 
+        posicao = (self.latitude, self.longitude)
+        if posicao != getattr(self, "_posicao_original", (None, None)):
+            self.posicao_atualizada_em = timezone.now()
+            self._posicao_original = posicao
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "posicao_atualizada_em"}
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -116,6 +148,25 @@ class Cliente(models.Model):
     telefone = models.CharField(max_length=15, null=False)
     email = models.EmailField(max_length=100, null=False)
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True) 
+    # Coordenadas derivadas do endereço (geocodificacao.py), gravadas para não resolver de novo
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    CAMPOS_ENDERECO = {"cep", "estado", "cidade", "bairro"}
+
+    def geocodificar(self):
+        self.latitude, self.longitude = (
+            coordenadas_cliente(self.cep, self.estado, self.cidade, self.bairro) or (None, None)
+        )
+
+    # Atualiza as coordenadas antes de salvar
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or self.CAMPOS_ENDERECO & set(update_fields):
+            self.geocodificar()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "latitude", "longitude"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.nome_cliente
@@ -144,6 +195,7 @@ class Rota(models.Model):
         choices=Status_rota.choices,
         default=Status_rota.PLANEJADA
     )
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.nome_rota
@@ -177,7 +229,140 @@ class Entrega(models.Model):
          choices=Status_entrega.choices,
          default=Status_entrega.PENDENTE
     )
+    # Posição da entrega na sequência de paradas da rota (roteirizacao.py)
+    ordem_parada = models.PositiveIntegerField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["motorista", "atualizado_em"])]
+
+    def __str__(self):
+        return self.codigo_rastreio
+
+
+# ---------- EVENTOS DA ENTREGA ----------
+# Histórico das mudanças de status, só de inclusão (eventos.py). Os eventos
+# continuam existindo mesmo depois que a entrega ou a rota são excluídas.
+class EntregaEvento(models.Model):
+    entrega = models.ForeignKey(
+        Entrega, on_delete=models.DO_NOTHING, db_constraint=False, related_name="eventos"
+    )
+    ocorrido_em = models.DateTimeField(default=timezone.now)
+    status_anterior = models.CharField(
+        max_length=1, choices=Entrega.Status_entrega.choices, null=True, blank=True
+    )
+    status_novo = models.CharField(max_length=1, choices=Entrega.Status_entrega.choices)
+    rota = models.ForeignKey(
+        Rota, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name="+"
+    )
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["entrega", "ocorrido_em"]),
+            models.Index(fields=["ocorrido_em"]),
+        ]
+
+    def __str__(self):
+        return f"{self.entrega_id}: {self.status_anterior or '-'} -> {self.status_novo}"
+
+
+# ---------- REMOÇÕES (SINCRONIZAÇÃO) ----------
+# Entregas, rotas e veículos excluídos ou que deixaram de ser de um motorista,
+# para a sincronização incremental dos aplicativos (sincronizacao.py)
+class Remocao(models.Model):
+
+    class Modelo(models.TextChoices):
+        ENTREGA = 'entrega', 'Entrega'
+        ROTA = 'rota', 'Rota'
+        VEICULO = 'veiculo', 'Veículo'
+
+    modelo = models.CharField(max_length=10, choices=Modelo.choices)
+    chave = models.CharField(max_length=20)
+    # motorista que tinha o objeto; continua gravado se o motorista for excluído
+    motorista = models.ForeignKey(
+        Motorista, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name="+"
+    )
+    # False: o objeto continua existindo, só passou para outro motorista ou ficou sem
+    excluido = models.BooleanField(default=True)
+    removido_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["motorista", "removido_em"]),
+            models.Index(fields=["removido_em"]),
+        ]
+
+    def __str__(self):
+        return f"{self.modelo}:{self.chave}"
+
+
+# ---------- TELEMETRIA ----------
+# Pontos de GPS/odômetro enviados pelos veículos, gravados em lote (telemetria.py)
+class Telemetria(models.Model):
+    veiculo = models.ForeignKey(Veiculo, on_delete=models.CASCADE)
+    registrada_em = models.DateTimeField()
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    km = models.PositiveIntegerField(null=True, blank=True)
+    velocidade_kmh = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["veiculo", "registrada_em"])]
+
+    def __str__(self):
+        return f"{self.veiculo_id} {self.registrada_em:%Y-%m-%d %H:%M:%S}"
+
+
+# ---------- CHECKPOINT DE IMPORTAÇÃO ----------
+# Posição do último bloco gravado de um arquivo CSV (importar_csv --lote)
+class CheckpointImportacao(models.Model):
+    hash_arquivo = models.CharField(max_length=64)
+    arquivo = models.CharField(max_length=100)
+    caminho = models.CharField(max_length=500)
+    offset = models.BigIntegerField(default=0)
+    linha = models.PositiveBigIntegerField(default=0)
+    concluido = models.BooleanField(default=False)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["hash_arquivo", "arquivo"], name="checkpoint_arquivo_unico"),
+        ]
+
+    # Chamado dentro da transação de cada bloco gravado
+    def avancar(self, bloco):
+        self.offset = bloco.offset
+        self.linha = bloco.ultima_linha
+        self.save(update_fields=["offset", "linha", "atualizado_em"])
+
+    def concluir(self):
+        self.concluido = True
+        self.save(update_fields=["concluido", "atualizado_em"])
+
+    def reiniciar(self):
+        self.offset = 0
+        self.linha = 0
+        self.concluido = False
+        self.save(update_fields=["offset", "linha", "concluido", "atualizado_em"])
+
+    def __str__(self):
+        return f"{self.arquivo} ({self.linha} linhas)"
+
+
+
+# ---------- IMPRESSÃO DIGITAL DE LINHA IMPORTADA ----------
+# Hash do conteúdo normalizado de cada linha gravada pela importação em
+# lote, usado pelo modo incremental para pular linhas sem alteração
+class ImpressaoLinha(models.Model):
+    tabela = models.CharField(max_length=30)
+    chave = models.CharField(max_length=64)
+    hash = models.CharField(max_length=32)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tabela", "chave"], name="impressao_linha_unica"),
+        ]
 
     def __str__(self):
-        return self.codigo_rastreio
\ No newline at end of file
+        return f"{self.tabela}:{self.chave}"
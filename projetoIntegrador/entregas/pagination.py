@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+# ============================
+# PAGINAÇÃO POR CURSOR (KEYSET)
+# - O cursor guarda a última chave lida: cada página é um
+#   WHERE chave > x ORDER BY chave LIMIT n, com o mesmo custo
+#   na primeira ou na milésima página
+# - Ordena pela chave primária do modelo paginado (única e
+#   indexada): codigo_rastreio, id, placa, cpf, cpf_cliente
+# - Tamanho padrão page_size, ajustável pelo cliente com
+#   ?page_size= até max_page_size
+# ============================
+class PaginacaoCursor(CursorPagination):
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        # pelo modelo do queryset, e não da view: ações como /rotas/{id}/entregas/
+        # paginam outro modelo
+        return (queryset.model._meta.pk.name,)
@@ -1,6 +1,7 @@
 
 
 from rest_framework.permissions import BasePermission
+from .authentication import papel_do_usuario
 
 # ============================
 # ADMINISTRADOR
@@ -16,7 +17,7 @@ class IsAdmin(BasePermission):
 # ============================
 class IsMotorista(BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_authenticated and hasattr(request.user, "motorista")
+        return request.user.is_authenticated and papel_do_usuario(request.user).motorista
 
 
 # ============================
@@ -25,7 +26,7 @@ class IsMotorista(BasePermission):
 # ============================
 class IsCliente(BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_authenticated and hasattr(request.user, "cliente") 
+        return request.user.is_authenticated and papel_do_usuario(request.user).cliente
 
 # ============================
 # MOTORISTA OU ADMIN
@@ -35,7 +36,7 @@ class IsMotoristaOrAdmin(BasePermission):
         user = request.user
         return (
             user.is_authenticated and (
-                user.is_staff or hasattr(user, "motorista")
+                user.is_staff or papel_do_usuario(user).motorista
             )
         )
 
@@ -47,7 +48,7 @@ class IsClienteOrAdmin(BasePermission):
         user = request.user
         return (
             user.is_authenticated and (
-                user.is_staff or hasattr(user, "cliente")
+                user.is_staff or papel_do_usuario(user).cliente
             )
         )
 
@@ -60,8 +61,8 @@ class IsAnyUser(BasePermission):
         user = request.user
         return (
             user.is_authenticated and (
-                user.is_staff 
-                or hasattr(user, "motorista")
-                or hasattr(user, "cliente")
+                user.is_staff
+                or papel_do_usuario(user).motorista
+                or papel_do_usuario(user).cliente
             )
         )
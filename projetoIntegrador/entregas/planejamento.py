@@ -0,0 +1,259 @@
+"""
+Planejamento automático de carga.
+
+Distribui as entregas pendentes (status P) sem rota entre os veículos
+disponíveis (status D) e cria uma rota planejada por veículo utilizado:
+
+- cada veículo precisa de um motorista com CNH compatível
+  (Veiculo.COMPATIBILIDADE_CNH): o motorista ativo do veículo ou um
+  motorista disponível sem veículo, nenhum deles já escalado na data
+- as entregas são empacotadas por first-fit decreasing sobre
+  capacidade_necessaria x capacidade_maxima, com os veículos maiores
+  primeiro
+- tudo em arrays NumPy: entregas de mesmo tamanho são distribuídas de uma
+  vez, com um cumsum sobre as capacidades restantes de todos os veículos
+- a gravação é em lote: bulk_create das rotas e dos vínculos
+  rota <-> cliente, e um UPDATE por rota nas entregas, pela chave
+  primária (as entregas ficam travadas desde a leitura, ver planejar)
+"""
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Motorista, Veiculo, Rota, Entrega
+from .sincronizacao import registrar_desvinculos
+
+
+# ============================
+# EMPACOTAMENTO
+# ============================
+def first_fit_decreasing(tamanhos, capacidades):
+    """
+    Índice do veículo de cada entrega (-1 quando não coube em nenhum).
+
+    Os veículos são tentados na ordem recebida. Para uma sequência de k itens
+    de mesmo tamanho s, o first-fit coloca restante // s itens em cada veículo,
+    em ordem, até acabarem os k: isso é calculado para todos os veículos de
+    uma vez. Itens sem peso (s <= 0) vão para o primeiro veículo.
+    """
+    tamanhos = np.asarray(tamanhos, dtype=np.int64)
+    restante = np.asarray(capacidades, dtype=np.int64).copy()
+    destino = np.full(len(tamanhos), -1, dtype=np.int64)
+    if not len(tamanhos) or not len(restante):
+        return destino
+
+    ordem = np.argsort(-tamanhos, kind="stable")
+    valores, inicios, contagens = np.unique(-tamanhos[ordem], return_index=True, return_counts=True)
+    veiculos = np.arange(len(restante))
+
+    for valor, inicio, k in zip(valores, inicios, contagens):
+        tamanho = -int(valor)
+        itens = ordem[inicio:inicio + k]
+        if tamanho <= 0:
+            destino[itens] = 0
+            continue
+        cabem = np.maximum(restante, 0) // tamanho
+        antes = np.cumsum(cabem) - cabem
+        recebe = np.clip(k - antes, 0, cabem)
+        colocados = int(recebe.sum())
+        destino[itens[:colocados]] = np.repeat(veiculos, recebe)
+        restante -= recebe * tamanho
+
+    return destino
+
+
+# ============================
+# ESCALA DE MOTORISTAS
+# ============================
+def versatilidade_cnh():
+    """Quantos tipos de veículo cada CNH pode conduzir"""
+    contagem = defaultdict(int)
+    for cnhs in Veiculo.COMPATIBILIDADE_CNH.values():
+        for cnh in cnhs:
+            contagem[cnh] += 1
+    return contagem
+
+
+def escalar_motoristas(veiculos, livres):
+    """
+    Motorista (cpf) de cada veículo, ou None.
+
+    veiculos: (placa, tipo, cpf do motorista ativo, cnh do motorista ativo),
+    já na ordem de preferência. livres: cnh -> cpfs disponíveis. Veículos sem
+    motorista ativo compatível recebem o motorista livre cuja CNH serve para
+    menos tipos de veículo, preservando os mais versáteis para os demais.
+    """
+    versatilidade = versatilidade_cnh()
+    livres = {cnh: list(cpfs) for cnh, cpfs in livres.items()}
+    escala = []
+    for placa, tipo, motorista_ativo, cnh_ativo in veiculos:
+        compativeis = Veiculo.COMPATIBILIDADE_CNH.get(tipo, [])
+        if motorista_ativo is not None:
+            escala.append(motorista_ativo if cnh_ativo in compativeis else None)
+            continue
+        cnh = min(
+            (cnh for cnh in compativeis if livres.get(cnh)),
+            key=lambda cnh: versatilidade[cnh],
+            default=None,
+        )
+        escala.append(livres[cnh].pop() if cnh else None)
+    return escala
+
+
+# ============================
+# PLANO
+# ============================
+@dataclass
+class RotaPlanejada:
+    rota: Rota
+    capacidade_maxima: int
+    entregas: np.ndarray        # códigos de rastreio
+    clientes: np.ndarray        # cpfs distintos dos clientes das entregas
+
+
+@dataclass
+class Plano:
+    data: date
+    rotas: list = field(default_factory=list)
+    sem_rota: list = field(default_factory=list)
+    veiculos_sem_motorista: list = field(default_factory=list)
+    segundos: float = 0.0
+
+    @property
+    def entregas_planejadas(self):
+        return sum(len(planejada.entregas) for planejada in self.rotas)
+
+    def gravar(self):
+        inicio = time.perf_counter()
+        with transaction.atomic():
+            Rota.objects.bulk_create([planejada.rota for planejada in self.rotas])
+
+            agora = timezone.now()
+            for planejada in self.rotas:
+                rota = planejada.rota
+                for i in range(0, len(planejada.entregas), 500):
+                    codigos = planejada.entregas[i:i + 500].tolist()
+                    # entregas pendentes já atribuídas a outro motorista saem do aplicativo dele
+                    registrar_desvinculos(Entrega, dict.fromkeys(codigos, rota.motorista_id))
+                    Entrega.objects.filter(codigo_rastreio__in=codigos).update(
+                        rota=rota, motorista=rota.motorista_id, atualizado_em=agora
+                    )
+
+            through = Rota.clientes.through
+            through.objects.bulk_create(
+                [
+                    through(rota_id=planejada.rota.pk, cliente_id=cpf)
+                    for planejada in self.rotas
+                    for cpf in planejada.clientes.tolist()
+                ],
+                batch_size=1000,
+            )
+        self.segundos += time.perf_counter() - inicio
+
+    def resumo(self, limite=1000):
+        return {
+            "data": self.data,
+            "rotas_criadas": len(self.rotas),
+            "entregas_planejadas": self.entregas_planejadas,
+            "entregas_sem_rota": len(self.sem_rota),
+            "codigos_sem_rota": self.sem_rota[:limite],
+            "veiculos_sem_motorista": self.veiculos_sem_motorista,
+            "segundos": round(self.segundos, 3),
+            "rotas": [
+                {
+                    "id": planejada.rota.pk,
+                    "veiculo": planejada.rota.veiculo_id,
+                    "motorista": planejada.rota.motorista_id,
+                    "entregas": len(planejada.entregas),
+                    "capacidade_utilizada": planejada.rota.capacidade_total_utilizada,
+                    "capacidade_maxima": planejada.capacidade_maxima,
+                }
+                for planejada in self.rotas
+            ],
+        }
+
+
+def planejar(data, travar=False):
+    """
+    Monta (sem gravar) o plano de rotas para a data.
+
+    Com travar=True, dentro de uma transação, as entregas lidas ficam travadas
+    (select_for_update) até o commit: Plano.gravar pode atualizá-las só pela
+    chave primária, e um planejamento concorrente espera este terminar.
+    """
+    inicio = time.perf_counter()
+    plano = Plano(data=data)
+
+    pendentes = Entrega.objects.filter(status="P", rota__isnull=True)
+    if travar:
+        pendentes = pendentes.select_for_update()
+    entregas = list(
+        pendentes
+        .order_by("data_entrega_prevista", "codigo_rastreio")
+        .values_list("codigo_rastreio", "capacidade_necessaria", "cliente_id")
+    )
+
+    # veículos e motoristas já escalados em rotas ativas na data ficam de fora
+    # (lidos depois da trava, já enxergam as rotas de um planejamento concorrente)
+    escalados = Rota.objects.filter(data_rota=data, status_rota__in=["P", "A"])
+    veiculos = list(
+        Veiculo.objects.filter(status_veiculo="D")
+        .exclude(placa__in=escalados.values("veiculo_id"))
+        .exclude(motorista_ativo__in=escalados.values("motorista_id"))
+        .order_by("-capacidade_maxima", "placa")
+        .values_list("placa", "tipo", "motorista_ativo_id", "motorista_ativo__cnh", "capacidade_maxima")
+    )
+    livres = defaultdict(list)
+    for cpf, cnh in (
+        Motorista.objects.filter(status_motorista="D", veiculo__isnull=True)
+        .exclude(cpf__in=escalados.values("motorista_id"))
+        .order_by("-cpf")       # pop() do fim: os menores cpfs primeiro
+        .values_list("cpf", "cnh")
+    ):
+        livres[cnh].append(cpf)
+
+    escala = escalar_motoristas([v[:4] for v in veiculos], livres)
+    plano.veiculos_sem_motorista = [v[0] for v, cpf in zip(veiculos, escala) if cpf is None]
+    usados = [(v, cpf) for v, cpf in zip(veiculos, escala) if cpf is not None]
+
+    if not entregas:
+        plano.segundos = time.perf_counter() - inicio
+        return plano
+
+    codigos = np.array([e[0] for e in entregas], dtype=object)
+    tamanhos = np.fromiter((e[1] for e in entregas), dtype=np.int64, count=len(entregas))
+    clientes = np.array([e[2] for e in entregas], dtype=object)
+    capacidades = np.fromiter((v[4] for v, _ in usados), dtype=np.int64, count=len(usados))
+
+    destino = first_fit_decreasing(tamanhos, capacidades)
+    plano.sem_rota = codigos[destino < 0].tolist()
+
+    # agrupa as entregas por veículo
+    ordem = np.argsort(destino, kind="stable")
+    ordem = ordem[destino[ordem] >= 0]
+    indices, inicios = np.unique(destino[ordem], return_index=True)
+    for indice, itens in zip(indices.tolist(), np.split(ordem, inicios[1:])):
+        (placa, _, _, _, capacidade_maxima), cpf = usados[indice]
+        plano.rotas.append(RotaPlanejada(
+            rota=Rota(
+                nome_rota=f"Rota {data:%d/%m/%Y} - {placa}",
+                descricao="Gerada pelo planejamento automático de carga",
+                motorista_id=cpf,
+                veiculo_id=placa,
+                data_rota=data,
+                capacidade_total_utilizada=int(np.maximum(tamanhos[itens], 0).sum()),
+                km_total_estimado=0,
+                tempo_estimado=timedelta(0),
+            ),
+            capacidade_maxima=capacidade_maxima,
+            entregas=codigos[itens],
+            clientes=np.unique(clientes[itens]),
+        ))
+
+    plano.segundos = time.perf_counter() - inicio
+    return plano
@@ -0,0 +1,195 @@
+"""
+Sequenciamento das paradas de uma rota.
+
+Os destinos das entregas viram coordenadas pela geocodificação local
+(geocodificacao.py). A ordem de visita sai do vizinho mais próximo,
+melhorado por 2-opt, sobre uma matriz de distâncias (haversine) montada
+de uma vez com NumPy. Grava Entrega.ordem_parada e recalcula
+Rota.km_total_estimado e Rota.tempo_estimado.
+
+Configuração em settings.ENTREGAS_ROTEIRIZACAO (ver PADRAO).
+"""
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import invalidar_dashboard
+from .geocodificacao import geocodificar_entregas
+from .models import Rota, Entrega
+
+RAIO_TERRA_KM = 6371.0088
+
+PADRAO = {
+    "AUTOMATICA": True,             # recalcula quando as entregas da rota mudam
+    "DEPOSITO": None,               # (latitude, longitude) de saída; None = percurso livre
+    "FATOR_RODOVIARIO": 1.3,        # km por estrada / km em linha reta
+    "VELOCIDADE_MEDIA_KMH": 30,
+    "MINUTOS_POR_PARADA": 5,
+}
+
+
+def configuracao():
+    return {**PADRAO, **getattr(settings, "ENTREGAS_ROTEIRIZACAO", {})}
+
+
+# ============================
+# DISTÂNCIAS E HEURÍSTICAS
+# ============================
+def matriz_distancias(lat, lon):
+    """Distâncias em km (haversine) entre todos os pares de pontos"""
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def vizinho_mais_proximo(dist, inicio=0):
+    """Percurso que sai de inicio e vai sempre ao ponto não visitado mais próximo"""
+    n = len(dist)
+    visitado = np.zeros(n, dtype=bool)
+    percurso = np.empty(n, dtype=np.int64)
+    atual = inicio
+    for k in range(n):
+        percurso[k] = atual
+        visitado[atual] = True
+        if k < n - 1:
+            atual = int(np.argmin(np.where(visitado, np.inf, dist[atual])))
+    return percurso
+
+
+def dois_opt(ciclo, dist, fim, max_passadas=100):
+    """
+    Melhora um ciclo invertendo trechos ciclo[i..j] (1 <= i < j <= fim) enquanto
+    alguma inversão o encurta. ciclo[0] e as posições após fim não se movem.
+    Para cada i, o ganho de todos os j é calculado de uma vez.
+    """
+    ciclo = ciclo.copy()
+    n = len(ciclo)
+    for _ in range(max_passadas):
+        melhorou = False
+        for i in range(1, fim):
+            a, b = ciclo[i - 1], ciclo[i]
+            posicoes = np.arange(i + 1, fim + 1)
+            c = ciclo[posicoes]
+            d = ciclo[(posicoes + 1) % n]
+            ganho = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            melhor = int(np.argmin(ganho))
+            if ganho[melhor] < -1e-9:
+                j = i + 1 + melhor
+                ciclo[i:j + 1] = ciclo[i:j + 1][::-1]
+                melhorou = True
+        if not melhorou:
+            break
+    return ciclo
+
+
+def sequenciar(lat, lon, deposito=None):
+    """
+    Ordem de visita (índices dos pontos) e km em linha reta do percurso.
+
+    O percurso é aberto: não volta ao depósito. Um nó virtual, a distância
+    zero de todos, fecha o ciclo usado pelo 2-opt; fixado logo após o
+    depósito (ou no início, sem depósito), deixa as pontas livres.
+    """
+    n = len(lat)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), 0.0
+    if deposito is not None:
+        lat = np.concatenate([[deposito[0]], lat])
+        lon = np.concatenate([[deposito[1]], lon])
+
+    m = len(lat)
+    reais = matriz_distancias(lat, lon)
+    dist = np.pad(reais, ((0, 1), (0, 1)))      # nó virtual = índice m
+
+    if deposito is not None:
+        ciclo = np.append(vizinho_mais_proximo(reais, 0), m)
+        caminho = dois_opt(ciclo, dist, fim=m - 1)[:m]
+        ordem = caminho[1:] - 1
+    else:
+        # começa pela parada mais afastada das demais, uma das pontas prováveis
+        inicio = int(np.argmax(reais.sum(axis=1)))
+        ciclo = np.insert(vizinho_mais_proximo(reais, inicio), 0, m)
+        caminho = dois_opt(ciclo, dist, fim=m)[1:]
+        ordem = caminho
+
+    km = float(reais[caminho[:-1], caminho[1:]].sum())
+    return ordem, km
+
+
+# ============================
+# ROTAS
+# ============================
+def gravar_ordem_paradas(codigos):
+    """
+    Grava ordem_parada = posição (a partir de 1) de cada código. Um UPDATE
+    parametrizado em executemany: o bulk_update monta um CASE com um When
+    por entrega, e isso custava mais que toda a otimização da rota. Só as
+    entregas que mudaram de posição ganham atualizado_em novo (sincronizacao.py).
+    """
+    ops = connection.ops
+    tabela = ops.quote_name(Entrega._meta.db_table)
+    coluna = ops.quote_name(Entrega._meta.get_field("ordem_parada").column)
+    atualizado_em = ops.quote_name(Entrega._meta.get_field("atualizado_em").column)
+    chave = ops.quote_name(Entrega._meta.pk.column)
+    agora = ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {tabela} SET {coluna} = %s, {atualizado_em} = %s "
+            f"WHERE {chave} = %s AND ({coluna} IS NULL OR {coluna} <> %s)",
+            [(ordem, agora, codigo, ordem) for ordem, codigo in enumerate(codigos, 1)],
+        )
+
+
+def roteirizar_rota(rota_id):
+    """
+    Ordena as paradas da rota, grava Entrega.ordem_parada e atualiza km e tempo
+    estimados. Entregas sem coordenadas ficam no fim, na ordem do código.
+    Devolve (códigos na ordem de visita, km estimado).
+    """
+    config = configuracao()
+    todos, lat, lon = geocodificar_entregas(
+        Entrega.objects.filter(rota_id=rota_id).order_by("codigo_rastreio")
+    )
+    conhecidas = np.flatnonzero(~np.isnan(lat))
+    desconhecidas = np.flatnonzero(np.isnan(lat))
+
+    ordem, km_reta = sequenciar(lat[conhecidas], lon[conhecidas], config["DEPOSITO"])
+    ordem = np.concatenate([conhecidas[ordem], desconhecidas]).astype(np.int64)
+
+    km = km_reta * config["FATOR_RODOVIARIO"]
+    tempo = timedelta(
+        hours=km / config["VELOCIDADE_MEDIA_KMH"],
+        minutes=len(todos) * config["MINUTOS_POR_PARADA"],
+    )
+    codigos = [todos[i] for i in ordem.tolist()]
+
+    with transaction.atomic():
+        gravar_ordem_paradas(codigos)
+        estimativa = {
+            "km_total_estimado": math.ceil(km),
+            "tempo_estimado": timedelta(seconds=round(tempo.total_seconds())),
+        }
+        Rota.objects.filter(pk=rota_id).exclude(**estimativa).update(**estimativa, atualizado_em=timezone.now())
+        # update() e SQL direto não disparam signals
+        transaction.on_commit(lambda: invalidar_dashboard(rota_id))
+
+    return codigos, km
+
+
+def roteirizar_rotas(rota_ids):
+    for rota_id in rota_ids:
+        roteirizar_rota(rota_id)
+
+
+def agendar_roteirizacao(*rota_ids):
+    """Roteiriza as rotas depois do commit da transação atual, se a roteirização automática estiver ligada"""
+    rota_ids = sorted({rota_id for rota_id in rota_ids if rota_id is not None})
+    if rota_ids and configuracao()["AUTOMATICA"]:
+        transaction.on_commit(lambda: roteirizar_rotas(rota_ids))
@@ -1,5 +1,7 @@
+from django.db.models import Sum
 from rest_framework import serializers
 from .models import Motorista, Veiculo, Cliente, Rota, Entrega  
+from .campos import CamposDinamicosMixin
 
 
 # ============================
@@ -7,7 +9,7 @@ from .models import Motorista, Veiculo, Cliente, Rota, Entrega
 # Responsável por converter dados do Motorista
 # entre Python <-> JSON
 # ============================
-class MotoristaSerializer(serializers.ModelSerializer):
+class MotoristaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Motorista
         fields = '__all__'
@@ -15,31 +17,49 @@ class MotoristaSerializer(serializers.ModelSerializer):
 # ============================
 # SERIALIZER: VEÍCULO
 # ============================
-class VeiculoSerializer(serializers.ModelSerializer):
+class VeiculoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    expansoes = {"motorista_ativo": (MotoristaSerializer, False)}
+
     class Meta:
         model = Veiculo
         fields = '__all__'  
+        extra_kwargs = {
+            # Preenchida ao gravar uma nova latitude/longitude
+            "posicao_atualizada_em": {"read_only": True},
+        }
         
 # ============================
 # SERIALIZER: CLIENTE
 # ============================
-class ClienteSerializer(serializers.ModelSerializer):
+class ClienteSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Cliente
         fields = '__all__'  
+        extra_kwargs = {
+            # Calculadas do endereço (Cliente.save)
+            "latitude": {"read_only": True},
+            "longitude": {"read_only": True},
+        }
         
 # ============================
 # SERIALIZER: ENTREGA
 # Observação:
 # - A entrega pode existir SEM rota inicialmente
 # ============================
-class EntregaSerializer(serializers.ModelSerializer):
+class EntregaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    expansoes = {
+        "cliente": (ClienteSerializer, False),
+        "motorista": (MotoristaSerializer, False),
+    }
+
     class Meta:
         model = Entrega
         fields = '__all__'
         extra_kwargs = {
             # Permite criar entrega sem rota atribuída
-            "rota": {"required": False, "allow_null": True}
+            "rota": {"required": False, "allow_null": True},
+            # Calculada pela roteirização da rota
+            "ordem_parada": {"read_only": True},
         }
         
 # ============================
@@ -47,10 +67,16 @@ class EntregaSerializer(serializers.ModelSerializer):
 # - Exibe as entregas associadas
 # - Valida capacidade do veículo
 # ============================
-class RotaSerializer(serializers.ModelSerializer):
+class RotaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     # Lista as entregas associadas à rota (somente leitura)
     entregas = EntregaSerializer(many=True, read_only=True, source='entrega_set')
 
+    expansoes = {
+        "motorista": (MotoristaSerializer, False),
+        "veiculo": (VeiculoSerializer, False),
+        "clientes": (ClienteSerializer, True),
+    }
+
     class Meta:
         model = Rota
         fields = '__all__'
@@ -72,8 +98,9 @@ class RotaSerializer(serializers.ModelSerializer):
         capacidade_max = veiculo.capacidade_maxima
 
         # Soma das capacidades das entregas já associadas
-        entregas = Entrega.objects.filter(rota=rota) if rota else []
-        capacidade_utilizada = sum(e.capacidade_necessaria for e in entregas)
+        capacidade_utilizada = (
+            Entrega.objects.filter(rota=rota).aggregate(total=Sum("capacidade_necessaria"))["total"] or 0
+        ) if rota else 0
 
         # Capacidade informada manualmente (se houver)
         nova_capacidade = data.get("capacidade_total_utilizada", capacidade_utilizada)
@@ -89,6 +116,16 @@ class RotaSerializer(serializers.ModelSerializer):
 
         return data
     
+# ============================
+# SERIALIZER: ROTA NA SINCRONIZAÇÃO
+# - Sem as entregas: o aplicativo as recebe à parte,
+#   só as alteradas
+# ============================
+class RotaSincronizacaoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Rota
+        fields = '__all__'
+
 # ============================
 # SERIALIZER: DASHBOARD DA ROTA
 # Endpoint de composição (A+B+C+D)
@@ -0,0 +1,191 @@
+"""
+Signals que invalidam o cache do dashboard das rotas, o do rastreio público
+e o de tokens da autenticação, que agendam a roteirização das rotas, que
+mantêm o índice espacial dos veículos, que gravam os eventos de status
+das entregas e as remoções da sincronização incremental.
+
+A troca de versão só acontece depois do commit: invalidar antes permitiria
+que uma leitura concorrente guardasse no cache, já na versão nova, dados
+ainda não confirmados.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidar_tokens
+from .cache import invalidar_dashboard, invalidar_rastreio
+from .espacial import atualizar_veiculo_no_indice
+from .eventos import novo_evento, registrar_eventos
+from .models import Cliente, Entrega, Motorista, Rota, Veiculo
+from .roteirizacao import agendar_roteirizacao
+from .sincronizacao import campo_motorista, nova_remocao, registrar_remocoes
+
+
+def invalidar_rotas(*rota_ids):
+    """Invalida o dashboard das rotas quando a transação atual confirmar"""
+    rota_ids = {rota_id for rota_id in rota_ids if rota_id is not None}
+    if rota_ids:
+        transaction.on_commit(lambda: invalidar_dashboard(*rota_ids))
+
+
+def invalidar_rastreios(*codigos):
+    """Invalida o rastreio público das entregas quando a transação atual confirmar"""
+    if codigos:
+        transaction.on_commit(lambda: invalidar_rastreio(*codigos))
+
+
+def rotas_afetadas(modelo, pks):
+    """Ids das rotas cujo dashboard exibe algum dos objetos informados"""
+    pks = list(pks)
+    if not pks:
+        return []
+    if modelo is Rota:
+        return pks
+    if modelo is Entrega:
+        consulta = Entrega.objects.filter(pk__in=pks)
+    elif modelo is Cliente:
+        consulta = Entrega.objects.filter(cliente__in=pks)
+    elif modelo is Veiculo:
+        return list(Rota.objects.filter(veiculo__in=pks).values_list("id", flat=True))
+    elif modelo is Motorista:
+        return list(Rota.objects.filter(motorista__in=pks).values_list("id", flat=True))
+    else:
+        return []
+    return list(consulta.filter(rota__isnull=False).values_list("rota_id", flat=True).distinct())
+
+
+def invalidar_objetos(modelo, pks):
+    """Para gravações em lote (bulk_update, queryset.update), que não disparam signals"""
+    invalidar_rotas(*rotas_afetadas(modelo, pks))
+
+
+# ---------- ENTREGA ----------
+# Guarda a rota carregada do banco para invalidar também a rota de origem
+# quando a entrega muda de rota, e o status para registrar a mudança
+@receiver(post_init, sender=Entrega)
+def guardar_rota_original(sender, instance, **kwargs):
+    instance._rota_id_original = instance.__dict__.get("rota_id")
+    instance._destino_original = instance.__dict__.get("endereco_destino")
+    instance._status_original = instance.__dict__.get("status")
+
+
+@receiver(post_save, sender=Entrega)
+@receiver(post_delete, sender=Entrega)
+def entrega_alterada(sender, instance, signal, created=False, **kwargs):
+    invalidar_rotas(instance.rota_id, instance._rota_id_original)
+    invalidar_rastreios(instance.pk)
+
+    # a sequência de paradas muda quando a rota ganha, perde ou tem o destino
+    # de uma entrega alterado; mudanças de status não reordenam a rota
+    if (
+        created
+        or signal is post_delete
+        or instance.rota_id != instance._rota_id_original
+        or instance.endereco_destino != instance._destino_original
+    ):
+        agendar_roteirizacao(instance.rota_id, instance._rota_id_original)
+
+    # a rota de origem perde a entrega sem que nenhuma linha dela mude: atualiza
+    # a rota para a versão usada no GET condicional (condicional.py) mudar
+    origem = instance._rota_id_original
+    if origem is not None and (signal is post_delete or instance.rota_id != origem):
+        Rota.objects.filter(pk=origem).update(atualizado_em=timezone.now())
+
+    if signal is post_save and (created or instance.status != instance._status_original):
+        registrar_eventos([novo_evento(
+            instance.pk, None if created else instance._status_original, instance.status, instance.rota_id,
+        )])
+
+    instance._rota_id_original = instance.rota_id
+    instance._destino_original = instance.endereco_destino
+    instance._status_original = instance.status
+
+
+# ---------- ROTA ----------
+@receiver(post_save, sender=Rota)
+@receiver(post_delete, sender=Rota)
+def rota_alterada(sender, instance, **kwargs):
+    invalidar_rotas(instance.pk)
+
+
+# Os clientes da rota (M2M) aparecem no detalhe da rota
+@receiver(m2m_changed, sender=Rota.clientes.through)
+def clientes_da_rota_alterados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    rota_ids = pk_set if reverse else {instance.pk}
+    if rota_ids:
+        Rota.objects.filter(pk__in=rota_ids).update(atualizado_em=timezone.now())
+
+
+# ---------- VEÍCULO / MOTORISTA / CLIENTE ----------
+# Aparecem dentro do dashboard; exclusões já chegam pelo cascade das rotas
+# e entregas, então basta tratar o post_save
+@receiver(post_save, sender=Veiculo)
+@receiver(post_save, sender=Motorista)
+@receiver(post_save, sender=Cliente)
+def exibido_no_dashboard_alterado(sender, instance, created, **kwargs):
+    if not created:
+        invalidar_objetos(sender, [instance.pk])
+
+
+# ---------- ÍNDICE ESPACIAL ----------
+# Posição, status, tipo e capacidade dos veículos ficam na grade de espacial.py
+@receiver(post_save, sender=Veiculo)
+@receiver(post_delete, sender=Veiculo)
+def veiculo_alterado(sender, instance, signal, **kwargs):
+    excluido = signal is post_delete
+    transaction.on_commit(lambda: atualizar_veiculo_no_indice(instance, excluido))
+
+
+# ---------- SINCRONIZAÇÃO ----------
+# Guarda o motorista dono carregado do banco: exclusões e trocas de motorista
+# viram remoções para o aplicativo de quem tinha o objeto
+@receiver(post_init, sender=Entrega)
+@receiver(post_init, sender=Rota)
+@receiver(post_init, sender=Veiculo)
+def guardar_motorista_original(sender, instance, **kwargs):
+    instance._motorista_original = instance.__dict__.get(campo_motorista(sender))
+
+
+@receiver(post_save, sender=Entrega)
+@receiver(post_save, sender=Rota)
+@receiver(post_save, sender=Veiculo)
+@receiver(post_delete, sender=Entrega)
+@receiver(post_delete, sender=Rota)
+@receiver(post_delete, sender=Veiculo)
+def sincronizado_alterado(sender, instance, signal, **kwargs):
+    anterior = instance._motorista_original
+    atual = getattr(instance, campo_motorista(sender))
+    if signal is post_delete:
+        registrar_remocoes([nova_remocao(sender, instance.pk, anterior)])
+    elif anterior is not None and anterior != atual:
+        registrar_remocoes([nova_remocao(sender, instance.pk, anterior, excluido=False)])
+    instance._motorista_original = atual
+
+
+# A exclusão da rota desvincula as entregas por UPDATE (SET_NULL), sem signals
+@receiver(pre_delete, sender=Rota)
+def rota_excluida(sender, instance, **kwargs):
+    Entrega.objects.filter(rota=instance).update(atualizado_em=timezone.now())
+
+
+# ---------- AUTENTICAÇÃO ----------
+# Token excluído, usuário alterado (ativo, staff) ou vínculo com
+# motorista/cliente alterado: o papel em cache pode estar errado
+@receiver(post_delete, sender=Token)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Motorista)
+@receiver(post_delete, sender=Motorista)
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def perfil_alterado(sender, instance, update_fields=None, **kwargs):
+    if sender is User and update_fields == {"last_login"}:
+        return
+    transaction.on_commit(invalidar_tokens)
+
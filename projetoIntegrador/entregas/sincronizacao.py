@@ -0,0 +1,250 @@
+"""
+Sincronização incremental dos aplicativos dos motoristas.
+
+Entrega, Rota e Veiculo têm atualizado_em: o save() preenche sozinho
+(auto_now); as gravações em lote (queryset.update, bulk_update, SQL
+direto) preenchem explicitamente com timezone.now().
+
+O que sai do escopo de um motorista vira uma Remocao:
+- exclusão da entrega, da rota ou do veículo (signals.py);
+- desvínculo: o objeto passou para outro motorista ou ficou sem motorista
+  (signals.py para o save(); registrar_desvinculos para as gravações em lote).
+
+alteracoes_desde(cursor, motorista) devolve as linhas do escopo com
+atualizado_em a partir do cursor e as remoções desde o cursor; o novo
+cursor é a hora da consulta. A hora é gravada antes do commit: uma
+transação que confirma depois da consulta pode ter gravado uma hora
+anterior ao cursor devolvido, por isso a consulta relê MARGEM_SEGUNDOS
+antes do cursor. O aplicativo grava as linhas pela chave, e receber a
+mesma linha de novo não tem efeito.
+
+Remoções com mais de RETENCAO_DIAS são descartadas (limpar_remocoes); um
+cursor mais antigo que isso (ou nenhum) recebe o escopo inteiro, com
+reiniciar=True: o aplicativo descarta o que tem e grava o que recebeu.
+
+As linhas vêm em páginas de até `limite`, modelo a modelo, em ordem de
+(atualizado_em, pk): cada página seguinte é um WHERE (atualizado_em, pk) >
+(última lida), como em eventos_desde, com o mesmo custo em qualquer
+página. Enquanto houver linhas a resposta traz `proximo` (a Posicao
+codificada) em vez do cursor; as remoções e o cursor vêm na última página.
+Uma linha gravada durante a paginação ganha um atualizado_em maior e
+aparece de novo mais adiante, então nada se perde entre as páginas.
+"""
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Entrega, Remocao, Rota, Veiculo
+
+PADRAO = {
+    "MARGEM_SEGUNDOS": 5,
+    "RETENCAO_DIAS": 30,
+    "LIMITE": 1000,                 # linhas por página (somando os três modelos)
+}
+
+# modelos sincronizados -> (nome na Remocao, campo do motorista dono)
+SINCRONIZADOS = {
+    Entrega: (Remocao.Modelo.ENTREGA, "motorista"),
+    Rota: (Remocao.Modelo.ROTA, "motorista"),
+    Veiculo: (Remocao.Modelo.VEICULO, "motorista_ativo"),
+}
+
+
+def configuracao():
+    return {**PADRAO, **getattr(settings, "ENTREGAS_SINCRONIZACAO", {})}
+
+
+def campo_motorista(modelo):
+    """attname do motorista dono (motorista_id, motorista_ativo_id)"""
+    return modelo._meta.get_field(SINCRONIZADOS[modelo][1]).attname
+
+
+# ============================
+# REMOÇÕES
+# ============================
+def nova_remocao(modelo, chave, motorista_id, excluido=True, removido_em=None):
+    return Remocao(
+        modelo=SINCRONIZADOS[modelo][0],
+        chave=str(chave),
+        motorista_id=motorista_id,
+        excluido=excluido,
+        removido_em=removido_em or timezone.now(),
+    )
+
+
+def registrar_remocoes(remocoes):
+    """Grava as remoções na transação atual"""
+    if remocoes:
+        Remocao.objects.bulk_create(remocoes, batch_size=1000)
+
+
+def registrar_desvinculos(modelo, novos):
+    """
+    Para gravações em lote que trocam o motorista dono: novos = {pk: motorista_id
+    que será gravado}. Registra a remoção para o motorista atual de cada objeto
+    que vai mudar de dono. Chamar antes do UPDATE, na mesma transação.
+    """
+    if not novos:
+        return
+    attname = campo_motorista(modelo)
+    agora = timezone.now()
+    atuais = (
+        modelo.objects.filter(pk__in=list(novos), **{f"{attname}__isnull": False})
+        .values_list("pk", attname)
+    )
+    registrar_remocoes([
+        nova_remocao(modelo, pk, motorista_id, excluido=False, removido_em=agora)
+        for pk, motorista_id in atuais
+        if novos[pk] != motorista_id
+    ])
+
+
+def limpar_remocoes():
+    """Exclui as remoções mais antigas que RETENCAO_DIAS; devolve quantas"""
+    limite = timezone.now() - timedelta(days=configuracao()["RETENCAO_DIAS"])
+    return Remocao.objects.filter(removido_em__lt=limite).delete()[0]
+
+
+# ============================
+# CONSULTA
+# ============================
+@dataclass(frozen=True)
+class Posicao:
+    """
+    Onde a próxima página começa: o intervalo consultado (desde, já com a
+    margem, ou None no reinício; cursor, a hora da primeira página), o
+    índice do modelo em SINCRONIZADOS e a última linha lida dele.
+    """
+    desde: Optional[object]
+    cursor: object
+    modelo: int = 0
+    atualizado_em: Optional[object] = None
+    chave: Optional[str] = None
+
+    def codificar(self):
+        dados = [
+            self.desde and self.desde.isoformat(), self.cursor.isoformat(), self.modelo,
+            self.atualizado_em and self.atualizado_em.isoformat(), self.chave,
+        ]
+        return base64.urlsafe_b64encode(json.dumps(dados).encode()).decode()
+
+    @classmethod
+    def decodificar(cls, texto):
+        """ValueError se o texto não for um `proximo` devolvido pela sincronização"""
+        try:
+            desde, cursor, modelo, atualizado_em, chave = json.loads(base64.urlsafe_b64decode(texto.encode()))
+            desde, cursor, atualizado_em = (
+                parse_datetime(data) if data else None for data in (desde, cursor, atualizado_em)
+            )
+        except (TypeError, ValueError, UnicodeError):
+            raise ValueError("posição inválida")
+        if cursor is None or not isinstance(modelo, int) or not 0 <= modelo < len(SINCRONIZADOS):
+            raise ValueError("posição inválida")
+        if (atualizado_em is None) != (chave is None) or not isinstance(chave, (str, type(None))):
+            raise ValueError("posição inválida")
+        return cls(desde, cursor, modelo, atualizado_em, chave)
+
+
+@dataclass
+class Alteracoes:
+    cursor: object                                    # None até a última página
+    reiniciar: bool
+    linhas: dict = field(default_factory=dict)        # modelo -> objetos alterados
+    removidos: dict = field(default_factory=dict)     # modelo -> chaves removidas
+    proximo: Optional[str] = None                     # Posicao da página seguinte
+
+    @property
+    def completo(self):
+        return self.proximo is None
+
+
+def alteracoes_desde(desde=None, motorista_id=None, limite=None, posicao=None):
+    """
+    Até `limite` linhas de Entrega, Rota e Veiculo gravadas desde o cursor
+    `desde` (datetime) e, na última página, as chaves removidas desde então,
+    do motorista informado (None = de todos; aí só as exclusões contam como
+    remoção). As páginas seguintes recebem a `posicao` (Posicao) em vez de
+    `desde`.
+    """
+    config = configuracao()
+    limite = limite or config["LIMITE"]
+    reiniciar = False
+    if posicao is None:
+        agora = timezone.now()
+        if desde is not None and timezone.is_naive(desde):
+            desde = timezone.make_aware(desde)
+        reiniciar = desde is None or desde < agora - timedelta(days=config["RETENCAO_DIAS"])
+        desde = None if reiniciar else desde - timedelta(seconds=config["MARGEM_SEGUNDOS"])
+        posicao = Posicao(desde, agora)
+    desde = posicao.desde
+    alteracoes = Alteracoes(cursor=None, reiniciar=reiniciar)
+
+    restantes = limite
+    for indice, modelo in enumerate(SINCRONIZADOS):
+        alteracoes.linhas[modelo] = []
+        alteracoes.removidos[modelo] = []
+        if indice < posicao.modelo or alteracoes.proximo:
+            continue
+        linhas = escopo(modelo, motorista_id)
+        if desde is not None:
+            linhas = linhas.filter(atualizado_em__gte=desde)
+        if indice == posicao.modelo and posicao.atualizado_em is not None:
+            chave = modelo._meta.pk.to_python(posicao.chave)
+            linhas = linhas.filter(
+                Q(atualizado_em__gt=posicao.atualizado_em) | Q(atualizado_em=posicao.atualizado_em, pk__gt=chave)
+            )
+        if modelo is Rota:
+            linhas = linhas.prefetch_related("clientes")
+        # uma linha a mais diz se o modelo continua na próxima página
+        lidas = list(linhas.order_by("atualizado_em", "pk")[:restantes + 1])
+        if len(lidas) > restantes:
+            lidas = lidas[:restantes]
+            ultima = lidas[-1] if lidas else None
+            alteracoes.proximo = Posicao(
+                desde, posicao.cursor, indice,
+                ultima and ultima.atualizado_em, ultima and str(ultima.pk),
+            ).codificar()
+        alteracoes.linhas[modelo] = lidas
+        restantes -= len(lidas)
+
+    if alteracoes.proximo:
+        return alteracoes
+    alteracoes.cursor = posicao.cursor
+    if desde is None:
+        return alteracoes
+
+    remocoes = Remocao.objects.filter(removido_em__gte=desde)
+    if motorista_id is not None:
+        remocoes = remocoes.filter(motorista=motorista_id)
+    else:
+        remocoes = remocoes.filter(excluido=True)
+
+    por_nome = {nome: modelo for modelo, (nome, _) in SINCRONIZADOS.items()}
+    chaves = {}
+    for nome, chave in remocoes.values_list("modelo", "chave").distinct():
+        modelo = por_nome[nome]
+        chaves.setdefault(modelo, set()).add(modelo._meta.pk.to_python(chave))
+    for modelo, removidas in chaves.items():
+        # um objeto removido e depois devolvido ao motorista vem nas linhas
+        # (desta ou de uma página anterior): a remoção anterior deixa de valer
+        presentes = set(
+            escopo(modelo, motorista_id)
+            .filter(pk__in=removidas, atualizado_em__gte=desde)
+            .values_list("pk", flat=True)
+        )
+        alteracoes.removidos[modelo] = sorted(removidas - presentes)
+    return alteracoes
+
+
+def escopo(modelo, motorista_id):
+    linhas = modelo.objects.all()
+    if motorista_id is not None:
+        linhas = linhas.filter(**{campo_motorista(modelo): motorista_id})
+    return linhas
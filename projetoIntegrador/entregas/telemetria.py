@@ -0,0 +1,376 @@
+"""
+Ingestão de telemetria (GPS/odômetro) dos veículos.
+
+Os pontos recebidos não vão direto para o banco: ficam em um buffer em
+memória do processo, uma fila circular por veículo (deque com maxlen:
+quando um veículo manda mais pontos do que cabem antes da gravação, os
+mais antigos são descartados). Uma thread grava o buffer a cada LOTE
+pontos ou INTERVALO_MS milissegundos, o que vier primeiro:
+
+- um INSERT parametrizado em executemany com todos os pontos em Telemetria
+  (bulk_create gastava mais instanciando e preparando os modelos do que
+  o banco gastava gravando)
+- um único executemany em Veiculo com o maior km (km_atual nunca diminui)
+  e a posição mais recente de cada veículo, lidos antes com
+  select_for_update
+
+Assim o custo por ponto é o de um append, e o banco recebe poucas
+transações grandes em vez de uma por ponto. As métricas de ingestão
+(pontos recebidos, gravados, descartados, por segundo...) ficam em
+MetricasTelemetria.
+
+Configuração em settings.ENTREGAS_TELEMETRIA (ver PADRAO).
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .espacial import mover_veiculos_no_indice
+from .models import Telemetria, Veiculo
+from .signals import invalidar_objetos
+
+logger = logging.getLogger(__name__)
+
+PADRAO = {
+    "LOTE": 2000,                   # pontos pendentes que disparam a gravação
+    "INTERVALO_MS": 1000,           # gravação periódica, mesmo com poucos pontos
+    "PONTOS_POR_VEICULO": 1000,     # tamanho da fila circular de cada veículo
+}
+
+
+def configuracao():
+    return {**PADRAO, **getattr(settings, "ENTREGAS_TELEMETRIA", {})}
+
+
+@dataclass(frozen=True, slots=True)
+class Ponto:
+    placa: str
+    registrada_em: object       # datetime com fuso
+    latitude: float
+    longitude: float
+    km: Optional[int] = None
+    velocidade_kmh: Optional[float] = None
+
+
+class PontoInvalido(Exception):
+    """Ponto de telemetria mal formado (a mensagem explica o motivo)."""
+
+
+def ler_ponto(dado, agora):
+    """Ponto a partir de um dict do JSON; registrada_em ausente = agora"""
+    try:
+        placa = str(dado["placa"])
+        latitude, longitude = float(dado["latitude"]), float(dado["longitude"])
+        km = dado.get("km")
+        km = None if km is None else int(km)
+        velocidade = dado.get("velocidade_kmh")
+        velocidade = None if velocidade is None else float(velocidade)
+        registrada_em = dado.get("registrada_em")
+        registrada_em = parse_datetime(str(registrada_em)) if registrada_em else agora
+    except (KeyError, TypeError, ValueError) as e:
+        raise PontoInvalido(f"campo ausente ou inválido: {e}")
+
+    if registrada_em is None:
+        raise PontoInvalido("registrada_em deve estar no formato ISO 8601")
+    if timezone.is_naive(registrada_em):
+        registrada_em = timezone.make_aware(registrada_em)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise PontoInvalido("latitude/longitude fora do intervalo")
+    if km is not None and km < 0:
+        raise PontoInvalido("km não pode ser negativo")
+    return Ponto(placa, registrada_em, latitude, longitude, km, velocidade)
+
+
+# ============================
+# MÉTRICAS
+# ============================
+class MetricasTelemetria:
+
+    JANELA_SEGUNDOS = 60
+
+    def __init__(self):
+        self.recebidos = 0          # pontos aceitos no buffer
+        self.rejeitados = 0         # mal formados ou de veículos desconhecidos
+        self.descartados = 0        # empurrados para fora da fila circular
+        self.gravados = 0
+        self.perdidos = 0           # de veículos excluídos antes da gravação
+        self.gravacoes = 0
+        self.falhas = 0
+        self.ultima_gravacao_ms = 0.0
+        self.ultima_gravacao_em = None
+        self._por_segundo = deque()     # (segundo, pontos recebidos nele)
+        self._lock = threading.Lock()
+
+    def registrar_rejeitados(self, quantidade):
+        with self._lock:
+            self.rejeitados += quantidade
+
+    def registrar_recebidos(self, quantidade, descartados=0):
+        segundo = int(time.time())
+        with self._lock:
+            self.recebidos += quantidade
+            self.descartados += descartados
+            if self._por_segundo and self._por_segundo[-1][0] == segundo:
+                self._por_segundo[-1][1] += quantidade
+            else:
+                self._por_segundo.append([segundo, quantidade])
+            while self._por_segundo[0][0] <= segundo - self.JANELA_SEGUNDOS:
+                self._por_segundo.popleft()
+
+    def pontos_por_segundo(self):
+        """Média dos últimos JANELA_SEGUNDOS segundos"""
+        limite = int(time.time()) - self.JANELA_SEGUNDOS
+        with self._lock:
+            total = sum(quantidade for segundo, quantidade in self._por_segundo if segundo > limite)
+        return total / self.JANELA_SEGUNDOS
+
+    def resumo(self, pendentes):
+        return {
+            "recebidos": self.recebidos,
+            "rejeitados": self.rejeitados,
+            "descartados": self.descartados,
+            "gravados": self.gravados,
+            "perdidos": self.perdidos,
+            "pendentes": pendentes,
+            "gravacoes": self.gravacoes,
+            "falhas": self.falhas,
+            "pontos_por_segundo": round(self.pontos_por_segundo(), 1),
+            "ultima_gravacao_ms": round(self.ultima_gravacao_ms, 2),
+            "ultima_gravacao_em": self.ultima_gravacao_em,
+        }
+
+
+# ============================
+# GRAVAÇÃO
+# ============================
+def gravar_pontos(filas):
+    """
+    Grava {placa: pontos} em uma transação e atualiza km e posição dos
+    veículos. Devolve (pontos gravados, pontos de veículos inexistentes).
+    """
+    adaptar = connection.ops.adapt_datetimefield_value
+    with transaction.atomic():
+        atuais = {
+            placa: (km, atualizada_em)
+            for placa, km, atualizada_em in Veiculo.objects.select_for_update()
+            .filter(pk__in=list(filas))
+            .values_list("placa", "km_atual", "posicao_atualizada_em")
+        }
+
+        registros = []          # parâmetros do INSERT, um por ponto
+        alteracoes = []         # parâmetros do UPDATE, um por veículo
+        posicoes = {}
+        km_alterado = []
+        for placa, pontos in filas.items():
+            if placa not in atuais:
+                continue
+            registros.extend(
+                (placa, adaptar(p.registrada_em), p.latitude, p.longitude, p.km, p.velocidade_kmh)
+                for p in pontos
+            )
+            km_atual, atualizada_em = atuais[placa]
+            km = max((p.km for p in pontos if p.km is not None), default=km_atual)
+            ultimo = max(pontos, key=lambda p: p.registrada_em)
+            if atualizada_em is None or ultimo.registrada_em > atualizada_em:
+                posicao = ultimo.latitude, ultimo.longitude, ultimo.registrada_em
+            else:
+                posicao = None
+            if km <= km_atual and posicao is None:
+                continue
+            if km > km_atual:
+                km_alterado.append(placa)
+            if posicao:
+                posicoes[placa] = posicao
+            alteracoes.append((placa, max(km, km_atual), posicao))
+
+        inserir_telemetria(registros)
+        atualizar_veiculos(alteracoes)
+
+        # SQL direto não dispara signals: o dashboard exibe km_atual, e a grade
+        # de espacial.py guarda as posições
+        invalidar_objetos(Veiculo, km_alterado)
+        transaction.on_commit(lambda: mover_veiculos_no_indice(posicoes))
+
+    return len(registros), sum(len(pontos) for placa, pontos in filas.items() if placa not in atuais)
+
+
+def inserir_telemetria(registros):
+    """registros: (placa, registrada_em já adaptada, latitude, longitude, km, velocidade_kmh)"""
+    if not registros:
+        return
+    ops = connection.ops
+    meta = Telemetria._meta
+    colunas = ", ".join(
+        ops.quote_name(meta.get_field(campo).column)
+        for campo in ("veiculo", "registrada_em", "latitude", "longitude", "km", "velocidade_kmh")
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {ops.quote_name(meta.db_table)} ({colunas}) VALUES (%s, %s, %s, %s, %s, %s)",
+            registros,
+        )
+
+
+def atualizar_veiculos(alteracoes):
+    """
+    Um UPDATE parametrizado em executemany para todos os veículos: bulk_update
+    montaria um CASE por campo com um When por veículo, caro a cada gravação.
+    """
+    if not alteracoes:
+        return
+    ops = connection.ops
+    meta = Veiculo._meta
+    coluna = lambda campo: ops.quote_name(meta.get_field(campo).column)
+    agora = ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {ops.quote_name(meta.db_table)} SET {coluna('km_atual')} = %s, "
+            f"{coluna('latitude')} = COALESCE(%s, {coluna('latitude')}), "
+            f"{coluna('longitude')} = COALESCE(%s, {coluna('longitude')}), "
+            f"{coluna('posicao_atualizada_em')} = COALESCE(%s, {coluna('posicao_atualizada_em')}), "
+            f"{coluna('atualizado_em')} = %s "
+            f"WHERE {ops.quote_name(meta.pk.column)} = %s",
+            [
+                (
+                    km,
+                    *(posicao[:2] if posicao else (None, None)),
+                    ops.adapt_datetimefield_value(posicao[2]) if posicao else None,
+                    agora,
+                    placa,
+                )
+                for placa, km, posicao in alteracoes
+            ],
+        )
+
+
+# ============================
+# BUFFER
+# ============================
+class BufferTelemetria:
+
+    def __init__(self, lote=PADRAO["LOTE"], intervalo_ms=PADRAO["INTERVALO_MS"],
+                 pontos_por_veiculo=PADRAO["PONTOS_POR_VEICULO"]):
+        self.lote = lote
+        self.intervalo = intervalo_ms / 1000
+        self.pontos_por_veiculo = pontos_por_veiculo
+        self.metricas = MetricasTelemetria()
+        self._filas = self._novas_filas()
+        self._pendentes = 0
+        self._lock = threading.Lock()
+        self._gravando = threading.Lock()       # uma gravação por vez
+        self._acordar = threading.Event()
+        self._thread = None
+
+    def _novas_filas(self):
+        return defaultdict(lambda: deque(maxlen=self.pontos_por_veiculo))
+
+    @property
+    def pendentes(self):
+        return self._pendentes
+
+    def adicionar(self, pontos):
+        """Enfileira os pontos; a gravação acontece na thread do buffer"""
+        descartados = 0
+        with self._lock:
+            for ponto in pontos:
+                fila = self._filas[ponto.placa]
+                if len(fila) == fila.maxlen:
+                    descartados += 1
+                fila.append(ponto)
+            self._pendentes += len(pontos) - descartados
+            cheio = self._pendentes >= self.lote
+
+        self.metricas.registrar_recebidos(len(pontos), descartados)
+        self._iniciar()
+        if cheio:
+            self._acordar.set()
+
+    def _iniciar(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._executar, name="telemetria", daemon=True)
+                    self._thread.start()
+
+    def _executar(self):
+        while True:
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            close_old_connections()
+            try:
+                self.descarregar()
+            except Exception:
+                logger.exception("Falha ao gravar a telemetria; os pontos voltam para o buffer")
+
+    def descarregar(self):
+        """Grava tudo o que está no buffer agora. Devolve o número de pontos gravados"""
+        with self._gravando:
+            with self._lock:
+                filas, self._filas = self._filas, self._novas_filas()
+                self._pendentes = 0
+            if not filas:
+                return 0
+
+            inicio = time.perf_counter()
+            try:
+                gravados, perdidos = gravar_pontos(filas)
+            except Exception:
+                self.metricas.falhas += 1
+                self._devolver(filas)
+                raise
+
+            self.metricas.gravados += gravados
+            self.metricas.perdidos += perdidos
+            self.metricas.gravacoes += 1
+            self.metricas.ultima_gravacao_ms = (time.perf_counter() - inicio) * 1000
+            self.metricas.ultima_gravacao_em = timezone.now()
+            return gravados
+
+    def descartar(self):
+        """Esvazia o buffer sem gravar. Devolve o número de pontos descartados"""
+        with self._lock:
+            descartados, self._pendentes = self._pendentes, 0
+            self._filas = self._novas_filas()
+        return descartados
+
+    def _devolver(self, filas):
+        """Recoloca no buffer os pontos de uma gravação que falhou, antes dos mais novos"""
+        with self._lock:
+            for placa, pontos in filas.items():
+                fila = self._filas[placa]
+                restantes = list(fila)
+                fila.clear()
+                fila.extend(pontos)
+                fila.extend(restantes)
+            self._pendentes = sum(len(fila) for fila in self._filas.values())
+
+
+_buffer = None
+_lock_buffer = threading.Lock()
+
+
+def buffer_telemetria():
+    global _buffer
+    with _lock_buffer:
+        if _buffer is None:
+            config = configuracao()
+            _buffer = BufferTelemetria(config["LOTE"], config["INTERVALO_MS"], config["PONTOS_POR_VEICULO"])
+        return _buffer
+
+
+def _descarregar_ao_sair():
+    # grava o que sobrar no buffer atual quando o processo terminar normalmente
+    if _buffer is not None:
+        _buffer.descarregar()
+
+
+atexit.register(_descarregar_ao_sair)
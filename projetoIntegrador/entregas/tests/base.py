@@ -0,0 +1,115 @@
+"""Dados e preparação comuns aos testes do app entregas"""
+import tempfile
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from entregas import authentication, cache, espacial, idempotencia, metricas, telemetria
+from entregas.models import Cliente, Entrega, Motorista, Rota, Veiculo
+
+# métricas e caches em arquivo dos testes; o diretório é apagado ao fim da execução
+_diretorio_testes = tempfile.TemporaryDirectory(prefix="entregas-testes-")
+DIRETORIO_TESTES = _diretorio_testes.name
+
+
+def limpar_caches():
+    """Os caches são globais de cada processo e sobrevivem ao rollback dos testes"""
+    cache._cache_dashboard = None
+    cache._cache_versoes_dashboard = None
+    cache._cache_rastreio = None
+    authentication._cache_tokens = None
+    authentication._cache_versao_tokens = None
+    idempotencia._cache = None
+    espacial._indice_veiculos = None
+    # os pontos pendentes dos testes não são gravados ao sair
+    if telemetria._buffer is not None:
+        telemetria._buffer.descartar()
+    telemetria._buffer = None
+    # as séries das requisições dos testes não vão para o arquivo gravado ao sair
+    metricas.registro._valores.clear()
+    metricas.registro._arquivo = None
+
+
+# caches só do processo (as versões compartilhadas do dashboard e dos tokens no
+# diretório dos testes), sem instrumentação, métricas e roteirização automática
+configuracao_testes = override_settings(
+    ENTREGAS_CACHE_DASHBOARD={
+        "BACKEND": "memoria",
+        "VERSOES": {"BACKEND": "arquivo", "OPCOES": {"diretorio": DIRETORIO_TESTES}},
+    },
+    ENTREGAS_CACHE_TOKENS={
+        "BACKEND": "memoria",
+        "VERSAO": {"BACKEND": "arquivo", "OPCOES": {"diretorio": DIRETORIO_TESTES}},
+    },
+    ENTREGAS_IDEMPOTENCIA={"BACKEND": "memoria", "ESPERA_SEGUNDOS": 1},
+    ENTREGAS_INSTRUMENTACAO={"AMOSTRAGEM": 0},
+    ENTREGAS_METRICAS={"DIRETORIO": DIRETORIO_TESTES},
+    ENTREGAS_ROTEIRIZACAO={"AUTOMATICA": False},
+)
+
+
+@configuracao_testes
+class EntregasTestCase(APITestCase):
+    """
+    Um administrador, um motorista e um cliente (com usuários), um veículo,
+    uma rota do motorista e três entregas pendentes do cliente, duas na rota.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("admin", password="senha", is_staff=True)
+        cls.usuario_motorista = User.objects.create_user("motorista", password="senha")
+        cls.usuario_cliente = User.objects.create_user("cliente", password="senha")
+
+        cls.motorista = Motorista.objects.create(
+            cpf="12312312312", nome_motorista="João Pedro", telefone="61988880001",
+            data_cadastro=date(2024, 1, 10), cnh="B", status_motorista="A", user=cls.usuario_motorista,
+        )
+        cls.cliente = Cliente.objects.create(
+            cpf_cliente="11111111111", nome_cliente="Ana Souza", endereco="Rua A 123",
+            cidade="Brasília", estado="DF", bairro="Centro", cep="70000000",
+            telefone="61999990001", email="ana@example.com", user=cls.usuario_cliente,
+        )
+        cls.veiculo = Veiculo.objects.create(
+            placa="ABC1A11", modelo="Fiorino", capacidade_maxima=800, km_atual=12000,
+            motorista_ativo=cls.motorista, tipo="1", status_veiculo="D",
+            latitude=-15.79, longitude=-47.88,
+        )
+        cls.rota = Rota.objects.create(
+            nome_rota="Rota Norte", descricao="Entrega zona norte", motorista=cls.motorista,
+            veiculo=cls.veiculo, data_rota=date(2024, 4, 1), km_total_estimado=40,
+            tempo_estimado=timedelta(hours=2, minutes=30), capacidade_total_utilizada=250,
+        )
+        cls.rota.clientes.add(cls.cliente)
+        cls.entregas = [
+            cls.criar_entrega("ENT00000001", 100, rota=cls.rota),
+            cls.criar_entrega("ENT00000002", 150, rota=cls.rota),
+            cls.criar_entrega("ENT00000003", 200),
+        ]
+
+    @classmethod
+    def criar_entrega(cls, codigo, capacidade, **campos):
+        return Entrega.objects.create(**{
+            "codigo_rastreio": codigo,
+            "capacidade_necessaria": capacidade,
+            "endereco_origem": "Centro",
+            "endereco_destino": "Asa Norte",
+            "valor_frete": "25.50",
+            "data_entrega_prevista": date(2024, 4, 5),
+            "data_solicitacao": date(2024, 4, 1),
+            "cliente": cls.cliente,
+            **campos,
+        })
+
+    def setUp(self):
+        limpar_caches()
+        self.addCleanup(limpar_caches)
+
+    def entrar(self, user):
+        """Autentica o cliente de testes com o token do usuário (o caminho da API)"""
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        return token
@@ -0,0 +1,78 @@
+from rest_framework.authtoken.models import Token
+
+from entregas import authentication
+from entregas.models import Motorista
+
+from .base import EntregasTestCase, limpar_caches
+
+
+class TokenEmCacheTests(EntregasTestCase):
+
+    def test_login_devolve_o_token(self):
+        resposta = self.client.post("/api/token/", {"username": "motorista", "password": "senha"})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["token"], Token.objects.get(user=self.usuario_motorista).key)
+
+    def test_login_com_senha_errada(self):
+        resposta = self.client.post("/api/token/", {"username": "motorista", "password": "errada"})
+
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_token_e_papel_vem_do_cache(self):
+        self.entrar(self.usuario_motorista)
+        self.client.get("/veiculos/")
+
+        # só a consulta dos veículos do motorista: token, usuário e papel vêm do cache
+        with self.assertNumQueries(1):
+            resposta = self.client.get("/veiculos/")
+
+        self.assertEqual([v["placa"] for v in resposta.data["results"]], ["ABC1A11"])
+
+    def test_token_invalido(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Token invalido")
+
+        self.assertEqual(self.client.get("/veiculos/").status_code, 401)
+
+    def test_token_excluido_deixa_de_valer(self):
+        token = self.entrar(self.usuario_motorista)
+        self.client.get("/veiculos/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            token.delete()
+
+        self.assertEqual(self.client.get("/veiculos/").status_code, 401)
+
+    def test_token_excluido_em_outro_processo_deixa_de_valer(self):
+        token = self.entrar(self.usuario_motorista)
+        self.client.get("/veiculos/")
+        deste_processo = authentication._cache_tokens, authentication._cache_versao_tokens
+
+        # outro worker: caches próprios, mesmo diretório da versão
+        limpar_caches()
+        with self.captureOnCommitCallbacks(execute=True):
+            token.delete()
+
+        authentication._cache_tokens, authentication._cache_versao_tokens = deste_processo
+        self.assertEqual(self.client.get("/veiculos/").status_code, 401)
+
+    def test_usuario_desativado_deixa_de_valer(self):
+        self.entrar(self.usuario_motorista)
+        self.client.get("/veiculos/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario_motorista.is_active = False
+            self.usuario_motorista.save()
+
+        self.assertEqual(self.client.get("/veiculos/").status_code, 401)
+
+    def test_papel_recalculado_quando_o_vinculo_muda(self):
+        self.entrar(self.usuario_motorista)
+        self.assertEqual(self.client.get("/veiculos/").status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            motorista = Motorista.objects.get(pk=self.motorista.pk)
+            motorista.user = None
+            motorista.save()
+
+        self.assertEqual(self.client.get("/veiculos/").status_code, 403)
@@ -0,0 +1,65 @@
+from decimal import Decimal
+
+from entregas.campos import leitura_rapida
+from entregas.models import Entrega
+from entregas.serializers import EntregaSerializer, RotaSerializer
+
+from .base import EntregasTestCase
+
+
+class CamposEsparsosTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def test_fields_limita_a_resposta(self):
+        resposta = self.client.get("/entregas/", {"fields": "codigo_rastreio,status"})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["results"][0], {"codigo_rastreio": "ENT00000001", "status": "P"})
+
+    def test_leitura_rapida_igual_ao_serializer(self):
+        Entrega.objects.filter(pk="ENT00000001").update(valor_frete=Decimal("7.5"))
+
+        rapida = self.client.get("/entregas/").data["results"]
+
+        serializadas = EntregaSerializer(Entrega.objects.order_by("pk"), many=True).data
+        self.assertEqual([dict(linha) for linha in rapida], [dict(linha) for linha in serializadas])
+        self.assertIsNotNone(leitura_rapida(EntregaSerializer, None))
+        # entregas aninhadas: passa pelo serializer
+        self.assertIsNone(leitura_rapida(RotaSerializer, None))
+
+    def test_detalhe_com_fields(self):
+        resposta = self.client.get(f"/rotas/{self.rota.pk}/", {"fields": "id,nome_rota"})
+
+        self.assertEqual(resposta.data, {"id": self.rota.pk, "nome_rota": "Rota Norte"})
+
+    def test_expand_troca_a_chave_pelo_objeto(self):
+        resposta = self.client.get("/entregas/", {"expand": "cliente", "fields": "codigo_rastreio"})
+
+        self.assertEqual(resposta.data["results"][0]["cliente"]["nome_cliente"], "Ana Souza")
+        self.assertEqual(set(resposta.data["results"][0]), {"codigo_rastreio", "cliente"})
+
+        resposta = self.client.get(f"/rotas/{self.rota.pk}/", {"expand": "veiculo,motorista,clientes"})
+        self.assertEqual(resposta.data["veiculo"]["placa"], "ABC1A11")
+        self.assertEqual(resposta.data["motorista"]["nome_motorista"], "João Pedro")
+        self.assertEqual([c["cpf_cliente"] for c in resposta.data["clientes"]], ["11111111111"])
+
+    def test_expand_sem_consultas_por_linha(self):
+        for i in range(4, 9):
+            self.criar_entrega(f"ENT0000000{i}", 10)
+
+        # página e cliente em uma consulta só (select_related)
+        with self.assertNumQueries(1):
+            self.client.get("/entregas/", {"expand": "cliente"})
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get("/entregas/", {"fields": "codigo_rastreio,senha"}).status_code, 400)
+        self.assertEqual(self.client.get("/rotas/", {"expand": "entregas"}).status_code, 400)
+
+    def test_expand_so_para_administradores_e_motoristas(self):
+        self.client.force_authenticate(self.usuario_cliente)
+
+        self.assertEqual(self.client.get("/entregas/", {"expand": "cliente"}).status_code, 403)
+        self.assertEqual(self.client.get("/entregas/", {"fields": "codigo_rastreio"}).status_code, 200)
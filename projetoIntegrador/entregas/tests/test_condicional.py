@@ -0,0 +1,93 @@
+from entregas.models import Entrega, Motorista, Veiculo
+
+from .base import EntregasTestCase
+
+
+class GetCondicionalDaRotaTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.url = f"/rotas/{self.rota.pk}/"
+
+    def revalidar(self, url, etag, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+    def test_304_enquanto_nada_muda(self):
+        resposta = self.client.get(self.url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn("no-cache", resposta["Cache-Control"])
+        self.assertIn("Last-Modified", resposta)
+
+        # uma consulta agregada, sem carregar nem serializar a rota
+        with self.assertNumQueries(1):
+            revalidada = self.revalidar(self.url, resposta["ETag"])
+        self.assertEqual(revalidada.status_code, 304)
+        self.assertEqual(revalidada.content, b"")
+        self.assertEqual(revalidada["ETag"], resposta["ETag"])
+
+    def test_gravacoes_trocam_a_etag(self):
+        for alterar in (
+            lambda: Entrega.objects.get(pk="ENT00000001").save(),
+            lambda: self.criar_entrega("ENT00000009", 10, rota=self.rota),
+            lambda: Entrega.objects.get(pk="ENT00000002").delete(),
+            lambda: self.rota.clientes.clear(),
+        ):
+            etag = self.client.get(self.url)["ETag"]
+            alterar()
+            with self.subTest(alterar=alterar):
+                self.assertEqual(self.revalidar(self.url, etag).status_code, 200)
+
+    def test_entrega_que_sai_da_rota_troca_a_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        entrega = Entrega.objects.get(pk="ENT00000001")
+        entrega.rota = None
+        entrega.save()
+
+        self.assertEqual(self.revalidar(self.url, etag).status_code, 200)
+
+    def test_query_string_entra_na_etag(self):
+        etag = self.client.get(self.url, {"fields": "id,nome_rota"})["ETag"]
+
+        self.assertEqual(self.revalidar(self.url, etag).status_code, 200)
+        self.assertEqual(self.revalidar(self.url, etag, fields="id,nome_rota").status_code, 304)
+
+    def test_expand_sai_sem_etag(self):
+        resposta = self.client.get(self.url, {"expand": "motorista"})
+        self.assertNotIn("ETag", resposta)
+
+        etag = self.client.get(self.url)["ETag"]
+        Motorista.objects.filter(pk=self.motorista.pk).update(nome_motorista="João P. Lima")
+        resposta = self.revalidar(self.url, etag, expand="motorista")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["motorista"]["nome_motorista"], "João P. Lima")
+
+    def test_entregas_da_rota(self):
+        url = f"/rotas/{self.rota.pk}/entregas/"
+        etag = self.client.get(url)["ETag"]
+
+        self.assertEqual(self.revalidar(url, etag).status_code, 304)
+        Entrega.objects.filter(pk="ENT00000001").update(status="T")
+        Entrega.objects.get(pk="ENT00000001").save()
+        self.assertEqual(self.revalidar(url, etag).status_code, 200)
+
+    def test_capacidade_ignora_a_telemetria(self):
+        url = f"/rotas/{self.rota.pk}/capacidade/"
+        etag = self.client.get(url)["ETag"]
+
+        veiculo = Veiculo.objects.get(pk="ABC1A11")
+        veiculo.km_atual += 10
+        veiculo.save()
+        self.assertEqual(self.revalidar(url, etag).status_code, 304)
+
+        veiculo.capacidade_maxima = 900
+        veiculo.save()
+        resposta = self.revalidar(url, etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["capacidade_maxima_veiculo"], 900)
+
+    def test_rota_invisivel_responde_normalmente(self):
+        self.client.force_authenticate(self.usuario_motorista)
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get("/rotas/999/", HTTP_IF_NONE_MATCH='"x"').status_code, 404)
@@ -0,0 +1,64 @@
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from entregas.models import Rota
+
+from .base import EntregasTestCase
+
+
+class ConsultasDasListasTests(EntregasTestCase):
+    """A quantidade de consultas de cada lista não depende da quantidade de itens"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def consultas(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return len(contexto.captured_queries)
+
+    def criar_rotas(self, quantidade):
+        for i in range(quantidade):
+            rota = Rota.objects.create(
+                nome_rota=f"Rota {i}", descricao="extra", motorista=self.motorista, veiculo=self.veiculo,
+                data_rota=date(2024, 4, 2), km_total_estimado=10, tempo_estimado=timedelta(hours=1),
+            )
+            rota.clientes.add(self.cliente)
+            self.criar_entrega(f"EXT{i:08d}", 10, rota=rota)
+
+    def test_lista_de_rotas(self):
+        antes = self.consultas("/rotas/")
+        self.criar_rotas(5)
+
+        self.assertEqual(self.consultas("/rotas/"), antes)
+
+    def test_lista_de_rotas_expandida(self):
+        antes = self.consultas("/rotas/?expand=motorista,veiculo,clientes")
+        self.criar_rotas(5)
+
+        self.assertEqual(self.consultas("/rotas/?expand=motorista,veiculo,clientes"), antes)
+
+    def test_entregas_da_rota(self):
+        antes = self.consultas(f"/rotas/{self.rota.pk}/entregas/")
+        for i in range(5):
+            self.criar_entrega(f"EXT{i:08d}", 10, rota=self.rota)
+
+        self.assertEqual(self.consultas(f"/rotas/{self.rota.pk}/entregas/"), antes)
+
+    def test_lista_de_entregas(self):
+        antes = self.consultas("/entregas/")
+        for i in range(5):
+            self.criar_entrega(f"EXT{i:08d}", 10, rota=self.rota)
+
+        self.assertEqual(self.consultas("/entregas/"), antes)
+
+    def test_capacidade_com_o_veiculo_na_mesma_consulta(self):
+        # a versão da rota (ETag) e a rota com o veículo
+        with self.assertNumQueries(2):
+            resposta = self.client.get(f"/rotas/{self.rota.pk}/capacidade/")
+
+        self.assertEqual(resposta.data["capacidade_disponivel"], 550)
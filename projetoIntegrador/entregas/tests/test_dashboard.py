@@ -0,0 +1,91 @@
+from django.urls import reverse
+
+from entregas import cache
+from entregas.models import Cliente, Entrega
+from entregas.signals import invalidar_objetos
+
+from .base import EntregasTestCase, limpar_caches
+
+
+class DashboardCacheTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse("rota-dashboard", args=[self.rota.pk])
+
+    def entregas_do_dashboard(self):
+        resposta = self.client.get(self.url)
+        self.assertEqual(resposta.status_code, 200)
+        return {entrega["codigo_rastreio"]: entrega for entrega in resposta.data["entregas"]}
+
+    def test_dashboard(self):
+        resposta = self.client.get(self.url)
+
+        self.assertEqual(resposta.data["capacidade_total_utilizada"], 250)
+        self.assertEqual(resposta.data["capacidade_disponivel"], 550)
+        self.assertEqual(set(self.entregas_do_dashboard()), {"ENT00000001", "ENT00000002"})
+
+    def test_segunda_leitura_vem_do_cache(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_gravacao_da_entrega_invalida_depois_do_commit(self):
+        self.entregas_do_dashboard()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            entrega = Entrega.objects.get(pk="ENT00000001")
+            entrega.status = "T"
+            entrega.save()
+
+        self.assertEqual(self.entregas_do_dashboard()["ENT00000001"]["status"], "T")
+
+    def test_sem_commit_o_cache_nao_muda(self):
+        self.entregas_do_dashboard()
+
+        with self.captureOnCommitCallbacks(execute=False):
+            Entrega.objects.filter(pk="ENT00000001").update(status="T")
+            invalidar_objetos(Entrega, ["ENT00000001"])
+
+        self.assertEqual(self.entregas_do_dashboard()["ENT00000001"]["status"], "P")
+
+    def test_gravacao_em_outro_processo_invalida_o_dashboard_deste(self):
+        self.entregas_do_dashboard()
+        deste_processo = cache._cache_dashboard, cache._cache_versoes_dashboard
+
+        # outro worker: caches próprios, mesmo diretório das versões
+        limpar_caches()
+        with self.captureOnCommitCallbacks(execute=True):
+            entrega = Entrega.objects.get(pk="ENT00000001")
+            entrega.status = "T"
+            entrega.save()
+
+        cache._cache_dashboard, cache._cache_versoes_dashboard = deste_processo
+        self.assertEqual(self.entregas_do_dashboard()["ENT00000001"]["status"], "T")
+
+    def test_entrega_que_muda_de_rota_invalida_a_origem(self):
+        self.entregas_do_dashboard()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            entrega = Entrega.objects.get(pk="ENT00000002")
+            entrega.rota = None
+            entrega.save()
+
+        self.assertEqual(set(self.entregas_do_dashboard()), {"ENT00000001"})
+
+    def test_cliente_alterado_invalida_as_rotas_das_entregas(self):
+        self.entregas_do_dashboard()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cliente = Cliente.objects.get(pk=self.cliente.pk)
+            cliente.nome_cliente = "Ana S. Souza"
+            cliente.save()
+
+        self.assertEqual(self.entregas_do_dashboard()["ENT00000001"]["cliente"]["nome"], "Ana S. Souza")
+
+    def test_rota_inexistente(self):
+        resposta = self.client.get(reverse("rota-dashboard", args=[999]))
+
+        self.assertEqual(resposta.status_code, 404)
@@ -0,0 +1,156 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from entregas.espacial import GradeEspacial, distancia_km, kmeans
+from entregas.models import Entrega, Veiculo
+
+from .base import EntregasTestCase
+
+
+class GradeEspacialTests(SimpleTestCase):
+
+    def setUp(self):
+        gerador = np.random.default_rng(11)
+        self.pontos = {f"V{i}": (float(lat), float(lon)) for i, (lat, lon) in enumerate(
+            zip(gerador.uniform(-16.2, -15.4, 300), gerador.uniform(-48.3, -47.5, 300))
+        )}
+        self.grade = GradeEspacial(0.05)
+        for chave, (lat, lon) in self.pontos.items():
+            self.grade.inserir(chave, lat, lon, {"par": int(chave[1:]) % 2 == 0})
+
+    def mais_proximos(self, lat, lon, k, filtro=lambda chave: True):
+        distancias = sorted(
+            (float(distancia_km(lat, lon, *ponto)), chave) for chave, ponto in self.pontos.items() if filtro(chave)
+        )
+        return [chave for _, chave in distancias[:k]]
+
+    def test_igual_a_busca_exaustiva(self):
+        for lat, lon in ((-15.8, -47.9), (-15.41, -48.29), (-10.0, -40.0)):
+            with self.subTest(lat=lat, lon=lon):
+                achados = self.grade.proximos(lat, lon, 7)
+                self.assertEqual([chave for _, chave, _ in achados], self.mais_proximos(lat, lon, 7))
+
+    def test_filtro_e_raio(self):
+        achados = self.grade.proximos(-15.8, -47.9, 5, filtro=lambda dados: dados["par"], raio_km=5)
+
+        self.assertTrue(all(distancia <= 5 and dados["par"] for distancia, _, dados in achados))
+        self.assertEqual(
+            [chave for _, chave, _ in achados],
+            [chave for chave in self.mais_proximos(-15.8, -47.9, 5, lambda chave: int(chave[1:]) % 2 == 0)
+             if distancia_km(-15.8, -47.9, *self.pontos[chave]) <= 5],
+        )
+
+    def test_mover_e_remover(self):
+        self.grade.inserir("V0", -15.0, -47.0)
+        self.grade.remover("V1")
+
+        self.assertEqual(self.grade.proximos(-15.0, -47.0, 1)[0][1], "V0")
+        self.assertNotIn("V1", [chave for _, chave, _ in self.grade.proximos(*self.pontos["V1"], 3)])
+        self.assertEqual(len(self.grade), 299)
+
+    def test_kmeans_separa_grupos_distantes(self):
+        pontos = np.array([[0, 0], [1, 0], [0, 1], [100, 100], [101, 100], [100, 101]], dtype=float)
+
+        rotulos, _ = kmeans(pontos, 2)
+
+        self.assertEqual(len(set(rotulos[:3])), 1)
+        self.assertEqual(len(set(rotulos[3:])), 1)
+        self.assertNotEqual(rotulos[0], rotulos[3])
+
+
+class VeiculosProximosTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        Veiculo.objects.create(
+            placa="CDE3C33", modelo="VUC", capacidade_maxima=3000, km_atual=0, tipo="3",
+            latitude=-15.83, longitude=-48.05,
+        )
+        Veiculo.objects.create(
+            placa="DEF4D44", modelo="Strada", capacidade_maxima=700, km_atual=0, tipo="1",
+            status_veiculo="M", latitude=-15.79, longitude=-47.88,
+        )
+
+    def proximos(self, **params):
+        return self.client.get("/veiculos/proximos/", params)
+
+    def test_mais_proximos_disponiveis(self):
+        resposta = self.proximos(latitude=-15.79, longitude=-47.88)
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([v["placa"] for v in resposta.data["veiculos"]], ["ABC1A11", "CDE3C33"])
+        self.assertEqual(resposta.data["veiculos"][0]["distancia_km"], 0)
+
+    def test_filtros(self):
+        self.assertEqual(
+            [v["placa"] for v in self.proximos(latitude=-15.79, longitude=-47.88, cnh="C").data["veiculos"]],
+            ["ABC1A11", "CDE3C33"],
+        )
+        self.assertEqual(
+            [v["placa"] for v in self.proximos(latitude=-15.79, longitude=-47.88, capacidade=1000).data["veiculos"]],
+            ["CDE3C33"],
+        )
+        self.assertEqual(
+            [v["placa"] for v in self.proximos(latitude=-15.79, longitude=-47.88, raio_km=5).data["veiculos"]],
+            ["ABC1A11"],
+        )
+
+    def test_por_cep(self):
+        resposta = self.proximos(cep="70000-000", k=1)
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.data["veiculos"]), 1)
+
+    def test_posicao_gravada_move_o_veiculo(self):
+        self.proximos(latitude=-15.79, longitude=-47.88)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            veiculo = Veiculo.objects.get(pk="CDE3C33")
+            veiculo.latitude, veiculo.longitude = -15.7901, -47.8801
+            veiculo.save()
+
+        resposta = self.proximos(latitude=-15.7901, longitude=-47.8801, k=1)
+        self.assertEqual(resposta.data["veiculos"][0]["placa"], "CDE3C33")
+
+    def test_parametros_invalidos(self):
+        for params in (
+            {},
+            {"latitude": "nan", "longitude": "-47.88"},
+            {"latitude": "-15.79", "longitude": "inf"},
+            {"latitude": "-inf", "longitude": "-47.88"},
+            {"latitude": "91", "longitude": "-47.88"},
+            {"latitude": "-15.79", "longitude": "-181"},
+            {"latitude": "-15.79", "longitude": "-47.88", "raio_km": "nan"},
+            {"latitude": "-15.79", "longitude": "-47.88", "raio_km": "-1"},
+            {"latitude": "-15.79", "longitude": "-47.88", "k": "cinco"},
+            {"cep": "00000-000"[:3]},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.proximos(**params).status_code, 400)
+
+    def test_apenas_administradores(self):
+        self.client.force_authenticate(self.usuario_motorista)
+
+        self.assertEqual(self.proximos(latitude=-15.79, longitude=-47.88).status_code, 403)
+
+
+class ZonasTests(EntregasTestCase):
+
+    def test_agrupa_as_pendentes_sem_rota(self):
+        self.client.force_authenticate(self.admin)
+        self.criar_entrega("ENT00000004", 50, endereco_destino="Asa Norte")
+        self.criar_entrega("ENT00000005", 60, endereco_destino="Planaltina")
+        self.criar_entrega("ENT00000006", 70, endereco_destino="Sobradinho")
+        Entrega.objects.filter(pk="ENT00000003").update(endereco_destino="Lago Norte")
+
+        resposta = self.client.get("/entregas/zonas/", {"k": 2})
+
+        self.assertEqual(resposta.status_code, 200)
+        zonas = {tuple(zona["codigos"]) for zona in resposta.data["zonas"]}
+        self.assertEqual(zonas, {("ENT00000003", "ENT00000004"), ("ENT00000005", "ENT00000006")})
+
+    def test_k_invalido(self):
+        self.client.force_authenticate(self.admin)
+
+        self.assertEqual(self.client.get("/entregas/zonas/", {"k": 0}).status_code, 400)
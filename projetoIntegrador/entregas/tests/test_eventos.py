@@ -0,0 +1,101 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from entregas.eventos import autor_eventos, eventos_desde, linha_do_tempo
+from entregas.models import Entrega, EntregaEvento
+
+from .base import EntregasTestCase
+
+
+class HistoricoDeStatusTests(EntregasTestCase):
+
+    def test_criacao_e_mudancas_de_status_viram_eventos(self):
+        entrega = self.criar_entrega("ENT00000010", 10)
+        entrega.status = "T"
+        with autor_eventos(self.usuario_motorista):
+            entrega.save()
+        entrega.valor_frete = "30.00"
+        entrega.save()
+
+        eventos = list(EntregaEvento.objects.filter(entrega_id="ENT00000010").order_by("id"))
+        self.assertEqual(
+            [(e.status_anterior, e.status_novo, e.usuario_id) for e in eventos],
+            [(None, "P", None), ("P", "T", self.usuario_motorista.pk)],
+        )
+
+    def test_evento_desfeito_com_a_transacao(self):
+        entrega = Entrega.objects.get(pk="ENT00000003")
+        antes = EntregaEvento.objects.count()
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            entrega.status = "C"
+            entrega.save()
+            raise RuntimeError
+
+        self.assertEqual(EntregaEvento.objects.count(), antes)
+
+    def test_linha_do_tempo_com_tempo_em_cada_status(self):
+        agora = timezone.now()
+        EntregaEvento.objects.filter(entrega_id="ENT00000003").update(ocorrido_em=agora - timedelta(hours=3))
+        EntregaEvento.objects.create(
+            entrega_id="ENT00000003", ocorrido_em=agora - timedelta(hours=1), status_anterior="P", status_novo="T",
+        )
+
+        eventos = linha_do_tempo("ENT00000003")
+
+        self.assertEqual([e["status_novo"] for e in eventos], ["P", "T"])
+        self.assertEqual(eventos[0]["segundos_no_status"], 7200)
+        self.assertEqual([e["status_atual"] for e in eventos], [False, True])
+
+    def test_feed_por_id_com_limite_e_periodo(self):
+        ids = list(EntregaEvento.objects.order_by("id").values_list("id", flat=True))
+
+        eventos, proximo = eventos_desde(0, limite=2)
+        self.assertEqual([e["id"] for e in eventos], ids[:2])
+        eventos, proximo = eventos_desde(proximo, limite=2)
+        self.assertEqual([e["id"] for e in eventos], ids[2:])
+        self.assertEqual(eventos_desde(proximo), ([], proximo))
+        self.assertEqual(eventos_desde(0, fim=timezone.now() - timedelta(days=1))[0], [])
+
+
+class EventosEndpointTests(EntregasTestCase):
+
+    def test_linha_do_tempo_da_propria_entrega(self):
+        self.client.force_authenticate(self.usuario_cliente)
+
+        resposta = self.client.get("/entregas/ENT00000001/linha-do-tempo/")
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["status"], "P")
+        self.assertEqual([e["status_novo"] for e in resposta.data["eventos"]], ["P"])
+
+    def test_linha_do_tempo_de_outro_cliente(self):
+        self.client.force_authenticate(self.usuario_motorista)
+
+        # a entrega não é do motorista: o get_queryset não a encontra
+        self.assertEqual(self.client.get("/entregas/ENT00000001/linha-do-tempo/").status_code, 404)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get("/entregas/ENT00000001/linha-do-tempo/").status_code, 401)
+
+    def test_feed_de_eventos(self):
+        self.client.force_authenticate(self.admin)
+
+        resposta = self.client.get("/entregas/eventos/", {"limite": 2})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.data["eventos"]), 2)
+        self.assertFalse(resposta.data["completo"])
+        resposta = self.client.get("/entregas/eventos/", {"desde": resposta.data["proximo"]})
+        self.assertEqual([e["entrega_id"] for e in resposta.data["eventos"]], ["ENT00000003"])
+        self.assertTrue(resposta.data["completo"])
+
+    def test_feed_parametros_invalidos_e_permissao(self):
+        self.client.force_authenticate(self.admin)
+        for params in ({"desde": "x"}, {"limite": "muitos"}, {"inicio": "ontem"}, {"fim": "2024-13-01"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get("/entregas/eventos/", params).status_code, 400)
+
+        self.client.force_authenticate(self.usuario_motorista)
+        self.assertEqual(self.client.get("/entregas/eventos/").status_code, 403)
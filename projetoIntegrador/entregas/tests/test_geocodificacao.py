@@ -0,0 +1,78 @@
+from django.test import SimpleTestCase
+
+from entregas.geocodificacao import (
+    IndiceCep, centroide, coordenadas_cliente, extrair_cep, interpretar_endereco, normalizar_cep,
+)
+from entregas.models import Cliente
+
+from .base import EntregasTestCase
+
+ASA_NORTE = (-15.7631, -47.8828)
+BRASILIA = (-15.7939, -47.8828)
+
+
+class NormalizacaoTests(SimpleTestCase):
+
+    def test_normalizar_cep(self):
+        self.assertEqual(normalizar_cep("70000-001"), "70000001")
+        self.assertEqual(normalizar_cep("70000001"), "70000001")
+        self.assertIsNone(normalizar_cep("7000"))
+        self.assertIsNone(normalizar_cep(None))
+
+    def test_cep_no_texto(self):
+        self.assertEqual(extrair_cep("SQN 210, Bloco A - 70862-010, Brasília"), "70862010")
+        self.assertIsNone(extrair_cep("Telefone 6199999000012"))
+
+    def test_interpretar_endereco(self):
+        self.assertEqual(interpretar_endereco("Águas  Claras, Rua 3"), (None, "aguas claras rua 3"))
+
+
+class IndiceCepTests(SimpleTestCase):
+
+    def setUp(self):
+        self.indice = IndiceCep.montar([("7", 1.0, 1.0), ("70", 2.0, 2.0), ("70150", 3.0, 3.0), ("9", 4.0, 4.0)])
+
+    def test_prefixo_mais_longo(self):
+        lat, lon, precisao = self.indice.coordenadas([70150900, 70000000, 71000000, 99999999])
+
+        self.assertEqual(lat.tolist(), [3.0, 2.0, 1.0, 4.0])
+        self.assertEqual(precisao.tolist(), [5, 2, 1, 1])
+
+    def test_cep_fora_das_faixas_ou_invalido(self):
+        lat, _, precisao = self.indice.coordenadas([10000000, -1])
+
+        self.assertTrue(all(valor != valor for valor in lat))
+        self.assertEqual(precisao.tolist(), [0, 0])
+
+    def test_limites_das_faixas(self):
+        # linhas na ordem do tamanho do prefixo: 7, 9, 70, 70150
+        self.assertEqual(self.indice.buscar([70149999, 70150000, 70150999, 70151000]).tolist(), [2, 3, 3, 2])
+
+
+class CoordenadasClienteTests(EntregasTestCase):
+
+    def test_cep_grosseiro_perde_para_o_bairro(self):
+        self.assertEqual(coordenadas_cliente("70000000", "DF", "Brasília", "Asa Norte"), ASA_NORTE)
+
+    def test_bairro_desconhecido_usa_a_cidade(self):
+        self.assertEqual(coordenadas_cliente("", "df", "BRASILIA", "Inexistente"), BRASILIA)
+        self.assertEqual(centroide("DF", "Brasília"), BRASILIA)
+
+    def test_coordenadas_gravadas_no_cliente(self):
+        self.assertEqual((self.cliente.latitude, self.cliente.longitude), BRASILIA)
+
+        cliente = Cliente.objects.get(pk=self.cliente.pk)
+        cliente.bairro = "Asa Norte"
+        cliente.save(update_fields=["bairro"])
+
+        cliente.refresh_from_db()
+        self.assertEqual((cliente.latitude, cliente.longitude), ASA_NORTE)
+
+    def test_outros_campos_nao_geocodificam_de_novo(self):
+        Cliente.objects.filter(pk=self.cliente.pk).update(latitude=1.0, longitude=1.0)
+        cliente = Cliente.objects.get(pk=self.cliente.pk)
+        cliente.telefone = "61999990099"
+        cliente.save(update_fields=["telefone"])
+
+        cliente.refresh_from_db()
+        self.assertEqual((cliente.latitude, cliente.longitude), (1.0, 1.0))
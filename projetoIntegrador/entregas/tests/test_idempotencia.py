@@ -0,0 +1,201 @@
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from entregas import idempotencia
+from entregas.cache import CacheArquivo
+from entregas.idempotencia import EmAndamento, _chave_cache, _guardar, cache_idempotencia
+from entregas.models import Entrega, Rota
+
+from .base import DIRETORIO_TESTES, EntregasTestCase
+from .test_lote_entregas import nova
+
+
+class IdempotencyKeyTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def post(self, url, dados, chave="chave-1"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, dados, format="json", HTTP_IDEMPOTENCY_KEY=chave)
+
+    def test_repeticao_devolve_a_mesma_resposta_sem_gravar(self):
+        primeira = self.post("/entregas/", nova("ENT00000010"))
+        with mock.patch("entregas.views.EntregaViewSet.perform_create") as gravar:
+            repetida = self.post("/entregas/", nova("ENT00000010"))
+
+        self.assertEqual(primeira.status_code, 201)
+        self.assertEqual((repetida.status_code, repetida.data), (201, primeira.data))
+        self.assertEqual(repetida["Idempotent-Replayed"], "true")
+        self.assertNotIn("Idempotent-Replayed", primeira)
+        gravar.assert_not_called()
+
+    def test_sem_chave_executa_sempre(self):
+        self.client.post("/entregas/", nova("ENT00000010"), format="json")
+
+        self.assertEqual(self.client.post("/entregas/", nova("ENT00000010"), format="json").status_code, 400)
+
+    def test_chave_de_outra_requisicao_e_recusada(self):
+        self.post("/entregas/", nova("ENT00000010"))
+
+        self.assertEqual(self.post("/entregas/", nova("ENT00000011")).status_code, 422)
+        self.assertEqual(self.post("/entregas/lote/", {"entregas": [nova("ENT00000010")]}).status_code, 422)
+        self.assertFalse(Entrega.objects.filter(pk="ENT00000011").exists())
+
+    def test_chaves_por_usuario(self):
+        self.post("/entregas/", nova("ENT00000010"))
+        self.client.force_authenticate(self.usuario_cliente)
+
+        # outro usuário com a mesma chave: outra requisição (e o código já existe)
+        self.assertEqual(self.post("/entregas/", nova("ENT00000010")).status_code, 400)
+
+    def test_repeticao_concorrente_recebe_409_depois_da_espera(self):
+        # a primeira requisição com a chave ainda não terminou
+        chave = _chave_cache(SimpleNamespace(user=self.admin), "chave-1")
+        cache_idempotencia().add(chave, _guardar(EmAndamento("impressao")))
+
+        with mock.patch("entregas.idempotencia.impressao_digital", return_value="impressao"), \
+                override_settings(ENTREGAS_IDEMPOTENCIA={"BACKEND": "memoria", "ESPERA_SEGUNDOS": 0.1}):
+            self.assertEqual(self.post("/entregas/", nova("ENT00000010")).status_code, 409)
+        self.assertFalse(Entrega.objects.filter(pk="ENT00000010").exists())
+
+    def test_erros_do_servidor_nao_sao_guardados(self):
+        with mock.patch("entregas.views.gravar_lote", side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.post("/entregas/lote/", {"entregas": [nova("ENT00000010")]})
+
+        resposta = self.post("/entregas/lote/", {"entregas": [nova("ENT00000010")]})
+
+        self.assertEqual((resposta.status_code, resposta.data["criadas"]), (200, 1))
+        self.assertNotIn("Idempotent-Replayed", resposta)
+
+    def test_chave_longa_demais(self):
+        self.assertEqual(self.post("/entregas/", nova("ENT00000010"), chave="x" * 256).status_code, 400)
+
+    def test_put_e_patch(self):
+        resposta = self.client.patch(
+            "/entregas/ENT00000003/", {"status": "T"}, format="json", HTTP_IDEMPOTENCY_KEY="patch-1"
+        )
+        self.assertEqual(resposta.status_code, 200)
+        Entrega.objects.filter(pk="ENT00000003").update(status="R")
+
+        repetida = self.client.patch(
+            "/entregas/ENT00000003/", {"status": "T"}, format="json", HTTP_IDEMPOTENCY_KEY="patch-1"
+        )
+
+        self.assertEqual(repetida["Idempotent-Replayed"], "true")
+        self.assertEqual(Entrega.objects.get(pk="ENT00000003").status, "R")
+
+    @override_settings(ENTREGAS_IDEMPOTENCIA={"BACKEND": "arquivo", "OPCOES": {"diretorio": DIRETORIO_TESTES}})
+    def test_arquivo_atende_repeticoes_de_outro_processo(self):
+        primeira = self.post("/entregas/", nova("ENT00000010"), chave="arquivo-1")
+        # outro worker: cache do processo vazio, mesmo diretório
+        idempotencia._cache = None
+        repetida = self.post("/entregas/", nova("ENT00000010"), chave="arquivo-1")
+
+        self.assertEqual(repetida.status_code, 201)
+        self.assertEqual(repetida.data, primeira.data)
+        self.assertEqual(repetida["Idempotent-Replayed"], "true")
+
+    def test_login_repetido_depois_de_excluir_o_token_gera_outro(self):
+        self.client.force_authenticate(None)
+        dados = {"username": "motorista", "password": "senha"}
+        primeira = self.client.post("/api/token/", dados, HTTP_IDEMPOTENCY_KEY="login-1")
+        self.assertEqual(
+            self.client.post("/api/token/", dados, HTTP_IDEMPOTENCY_KEY="login-1")["Idempotent-Replayed"], "true"
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Token.objects.filter(key=primeira.data["token"]).delete()
+        repetida = self.client.post("/api/token/", dados, HTTP_IDEMPOTENCY_KEY="login-1")
+
+        self.assertNotIn("Idempotent-Replayed", repetida)
+        self.assertEqual(repetida.data["token"], Token.objects.get(user=self.usuario_motorista).key)
+        self.assertNotEqual(repetida.data["token"], primeira.data["token"])
+
+    def test_padrao_e_compartilhado_entre_processos(self):
+        with override_settings(ENTREGAS_IDEMPOTENCIA={}):
+            self.assertEqual(idempotencia.configuracao()["BACKEND"], "arquivo")
+
+
+class CacheArquivoTests(SimpleTestCase):
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory(prefix="entregas-cache-")
+        self.addCleanup(diretorio.cleanup)
+        self.diretorio = os.path.join(diretorio.name, "cache")
+
+    def test_diretorio_criado_so_para_o_usuario_e_valores_em_json(self):
+        cache = CacheArquivo(self.diretorio)
+        cache.set("chave", {"status": 201, "dados": [1, "a"]}, ttl=0)
+
+        self.assertEqual(os.stat(self.diretorio).st_mode & 0o777, 0o700)
+        with open(cache._caminho("chave"), encoding="utf-8") as arquivo:
+            self.assertEqual(json.load(arquivo), [None, {"status": 201, "dados": [1, "a"]}])
+        self.assertEqual(cache.get("chave"), {"status": 201, "dados": [1, "a"]})
+
+    def test_recusa_diretorio_em_que_outros_gravam(self):
+        os.makedirs(self.diretorio)
+        os.chmod(self.diretorio, 0o777)
+
+        with self.assertRaises(ImproperlyConfigured):
+            CacheArquivo(self.diretorio)
+
+    def test_arquivo_invalido_e_ausente(self):
+        cache = CacheArquivo(self.diretorio)
+        with open(cache._caminho("chave"), "wb") as arquivo:
+            arquivo.write(b"\x80\x04pickle")
+
+        self.assertIsNone(cache.get("chave"))
+
+
+# ============================
+# ENTREGA NA ROTA
+# ============================
+class AdicionarEntregaTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.url = f"/rotas/{self.rota.pk}/adicionar_entrega/"
+
+    def adicionar(self, codigo, chave=None):
+        extras = {"HTTP_IDEMPOTENCY_KEY": chave} if chave else {}
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, {"entrega_id": codigo}, format="json", **extras)
+
+    def test_adiciona_e_a_repeticao_nao_soma_de_novo(self):
+        primeira = self.adicionar("ENT00000003", chave="rota-1")
+        repetida = self.adicionar("ENT00000003", chave="rota-1")
+
+        self.assertEqual(primeira.status_code, 200)
+        self.assertEqual((repetida.status_code, repetida["Idempotent-Replayed"]), (200, "true"))
+        self.assertEqual(Entrega.objects.get(pk="ENT00000003").rota_id, self.rota.pk)
+        self.assertEqual(Rota.objects.get(pk=self.rota.pk).capacidade_total_utilizada, 450)
+
+    def test_erros(self):
+        self.criar_entrega("ENT00000010", 600)
+
+        self.assertEqual(self.adicionar(None).status_code, 400)
+        self.assertEqual(self.adicionar("NAOEXISTE00").status_code, 404)
+        self.assertEqual(self.adicionar("ENT00000001").data, {"erro": "Entrega já está vinculada a uma rota"})
+        self.assertEqual(self.adicionar("ENT00000010").data, {"erro": "Capacidade do veículo excedida"})
+        Rota.objects.filter(pk=self.rota.pk).update(status_rota="C")
+        self.assertEqual(self.adicionar("ENT00000003").status_code, 400)
+
+    def test_remover_entrega(self):
+        url = f"/rotas/{self.rota.pk}/entregas/ENT00000001/"
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.delete(url)
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIsNone(Entrega.objects.get(pk="ENT00000001").rota_id)
+        self.assertEqual(Rota.objects.get(pk=self.rota.pk).capacidade_total_utilizada, 150)
+        self.assertEqual(self.client.delete(url).status_code, 404)
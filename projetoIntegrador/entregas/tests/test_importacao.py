@@ -0,0 +1,352 @@
+import csv
+import os
+import tempfile
+from concurrent.futures import Future
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from entregas.importacao import (
+    TABELAS, ImportadorLote, Resultado, atualizar_objetos, grafo_dependencias, importar_em_paralelo,
+    ler_em_blocos, opcoes_sqlite_em_paralelo, ordem_de_importacao,
+)
+from entregas.models import (
+    CheckpointImportacao, Cliente, Entrega, EntregaEvento, ImpressaoLinha, Motorista, Rota, Veiculo
+)
+
+from .base import EntregasTestCase, configuracao_testes, limpar_caches
+
+
+def linha_entrega(codigo, **campos):
+    return {
+        "codigo_rastreio": codigo, "data_entrega_real": "", "capacidade_necessaria": "100",
+        "endereco_origem": "Centro", "observacoes": "", "endereco_destino": "Asa Norte",
+        "valor_frete": "25.50", "data_entrega_prevista": "2024-04-05", "data_solicitacao": "2024-04-01",
+        "cliente_cpf": "11111111111", "rota_id": "", "status": "P",
+        **campos,
+    }
+
+
+def escrever_csv(linhas):
+    """Grava as linhas em um CSV temporário (apagado ao fim do teste) e devolve o caminho"""
+    descritor, caminho = tempfile.mkstemp(suffix=".csv")
+    with os.fdopen(descritor, "w", newline="", encoding="utf-8") as arquivo:
+        escritor = csv.DictWriter(arquivo, fieldnames=list(linhas[0]))
+        escritor.writeheader()
+        escritor.writerows(linhas)
+    return caminho
+
+
+# ============================
+# MODO LOTE
+# ============================
+class ImportacaoLoteTests(EntregasTestCase):
+
+    def importar(self, linhas, **opcoes):
+        mensagens = []
+        importador = ImportadorLote(tamanho_lote=2, saida=mensagens.append, **opcoes)
+        return importador.importar(TABELAS["entregas.csv"], linhas), mensagens
+
+    def test_insere_novas_e_atualiza_existentes(self):
+        resultado, _ = self.importar([
+            linha_entrega("ENT00000001", observacoes="alterada", rota_id=str(self.rota.pk)),
+            linha_entrega("NOV00000001"),
+            linha_entrega("NOV00000002", valor_frete="10.00"),
+        ])
+
+        self.assertEqual((resultado.inseridas, resultado.atualizadas, resultado.rejeitadas), (2, 1, 0))
+        self.assertEqual(Entrega.objects.get(pk="ENT00000001").observacoes, "alterada")
+        self.assertEqual(Entrega.objects.get(pk="NOV00000002").valor_frete, Decimal("10.00"))
+
+    def test_atualizacao_grava_atualizado_em_e_eventos(self):
+        antes = Entrega.objects.get(pk="ENT00000001").atualizado_em
+
+        self.importar([linha_entrega("ENT00000001", status="T", rota_id=str(self.rota.pk))])
+
+        entrega = Entrega.objects.get(pk="ENT00000001")
+        self.assertEqual(entrega.status, "T")
+        self.assertGreater(entrega.atualizado_em, antes)
+        evento = EntregaEvento.objects.get(entrega_id="ENT00000001", status_novo="T")
+        self.assertEqual(evento.status_anterior, "P")
+
+    @override_settings(ENTREGAS_ROTEIRIZACAO={"AUTOMATICA": True})
+    def test_roteiriza_as_rotas_de_origem_e_de_destino(self):
+        outra = Rota.objects.create(
+            nome_rota="Rota Sul", descricao="Entrega zona sul", motorista=self.motorista,
+            veiculo=self.veiculo, data_rota=date(2024, 4, 1), km_total_estimado=40,
+            tempo_estimado=timedelta(hours=2), capacidade_total_utilizada=0,
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.importar([
+                linha_entrega("ENT00000002", rota_id=str(outra.pk)),
+                linha_entrega("NOV00000001", rota_id=str(outra.pk), endereco_destino="Ceilândia"),
+            ])
+
+        self.assertEqual(
+            dict(Entrega.objects.filter(rota__isnull=False).values_list("pk", "ordem_parada")),
+            {"ENT00000001": 1, "ENT00000002": 1, "NOV00000001": 2},
+        )
+        self.assertNotEqual(Rota.objects.get(pk=outra.pk).km_total_estimado, 40)
+
+    def test_rejeita_linhas_com_chaves_inexistentes(self):
+        resultado, mensagens = self.importar([
+            linha_entrega("NOV00000001", cliente_cpf="99999999999"),
+            linha_entrega("NOV00000002", rota_id="999"),
+            linha_entrega("NOV00000003", capacidade_necessaria="muito"),
+        ])
+
+        self.assertEqual((resultado.inseridas, resultado.rejeitadas), (0, 3))
+        self.assertEqual(len(mensagens), 3)
+        self.assertFalse(Entrega.objects.filter(pk__startswith="NOV").exists())
+
+    def test_atualizar_objetos_em_uma_consulta(self):
+        entregas = list(Entrega.objects.order_by("pk"))
+        for entrega in entregas:
+            entrega.observacoes = f"obs {entrega.pk}"
+            entrega.data_entrega_real = date(2024, 4, 6)
+
+        with self.assertNumQueries(1):
+            atualizar_objetos(Entrega, entregas, ("observacoes", "data_entrega_real", "rota"))
+
+        for entrega in Entrega.objects.all():
+            self.assertEqual(entrega.observacoes, f"obs {entrega.pk}")
+            self.assertEqual(entrega.data_entrega_real, date(2024, 4, 6))
+
+
+@configuracao_testes
+class ComandoImportarCsvTests(TestCase):
+
+    def setUp(self):
+        limpar_caches()
+        self.addCleanup(limpar_caches)
+
+    def test_importa_a_pasta_csv_em_lote(self):
+        call_command("importar_csv", "--lote", stdout=StringIO())
+
+        self.assertEqual(Cliente.objects.count(), 10)
+        self.assertEqual(Motorista.objects.count(), 6)
+        self.assertEqual(Veiculo.objects.count(), 6)
+        self.assertEqual(Rota.objects.count(), 4)
+        self.assertEqual(Entrega.objects.count(), 12)
+        self.assertEqual(Rota.objects.get(pk=1).clientes.count(), 3)
+
+    def test_reimportar_atualiza_sem_duplicar(self):
+        call_command("importar_csv", "--lote", stdout=StringIO())
+        call_command("importar_csv", "--lote", "--reiniciar", stdout=StringIO())
+
+        self.assertEqual(Entrega.objects.count(), 12)
+        self.assertEqual(Rota.objects.get(pk=1).clientes.count(), 3)
+
+
+# ============================
+# LEITURA EM BLOCOS E CHECKPOINTS
+# ============================
+class LeituraEmBlocosTests(TestCase):
+
+    def test_blocos_com_offset_e_ultima_linha(self):
+        conteudo = "\ufeffa,b\n1,x\n2,y\n\n3,z\n".encode()
+
+        blocos = list(ler_em_blocos(BytesIO(conteudo), 2))
+
+        self.assertEqual([bloco.linhas for bloco in blocos], [
+            [{"a": "1", "b": "x"}, {"a": "2", "b": "y"}],
+            [{"a": "3", "b": "z"}],
+        ])
+        self.assertEqual([bloco.ultima_linha for bloco in blocos], [2, 3])
+        self.assertEqual(blocos[-1].offset, len(conteudo))
+
+    def test_continua_a_partir_do_offset(self):
+        conteudo = "a,b\n1,x\n2,y\n3,z\n".encode()
+        primeiro = next(ler_em_blocos(BytesIO(conteudo), 2))
+
+        restantes = list(ler_em_blocos(BytesIO(conteudo), 2, primeiro.offset, primeiro.ultima_linha))
+
+        self.assertEqual(restantes[0].linhas, [{"a": "3", "b": "z"}])
+        self.assertEqual(restantes[0].ultima_linha, 3)
+
+    def test_arquivo_vazio(self):
+        self.assertEqual(list(ler_em_blocos(BytesIO(b""), 2)), [])
+
+
+class CheckpointTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.caminho = escrever_csv([linha_entrega(f"NOV0000000{i}") for i in range(1, 6)])
+        self.addCleanup(os.remove, self.caminho)
+        self.tabela = TABELAS["entregas.csv"]
+
+    def interromper_no_bloco(self, numero):
+        """gravar_bloco que falha ao chegar no bloco `numero` (uma queda no meio da importação)"""
+        original = ImportadorLote.gravar_bloco
+        chamadas = []
+
+        def gravar_bloco(importador, *args, **kwargs):
+            chamadas.append(1)
+            if len(chamadas) == numero:
+                raise RuntimeError("queda")
+            return original(importador, *args, **kwargs)
+        return mock.patch.object(ImportadorLote, "gravar_bloco", gravar_bloco)
+
+    def test_retoma_do_ultimo_bloco_gravado(self):
+        mensagens = []
+        with self.interromper_no_bloco(2), self.assertRaises(RuntimeError):
+            ImportadorLote(tamanho_lote=2).importar_arquivo(self.tabela, self.caminho)
+
+        checkpoint = CheckpointImportacao.objects.get(arquivo="entregas.csv")
+        self.assertEqual((checkpoint.linha, checkpoint.concluido), (2, False))
+        self.assertEqual(Entrega.objects.filter(pk__startswith="NOV").count(), 2)
+
+        resultado = ImportadorLote(tamanho_lote=2, saida=mensagens.append).importar_arquivo(self.tabela, self.caminho)
+
+        self.assertEqual(resultado.inseridas, 3)
+        self.assertIn("Retomando entregas.csv a partir da linha 3", mensagens)
+        self.assertEqual(Entrega.objects.filter(pk__startswith="NOV").count(), 5)
+        self.assertTrue(CheckpointImportacao.objects.get(arquivo="entregas.csv").concluido)
+
+    def test_arquivo_concluido_nao_e_importado_de_novo(self):
+        ImportadorLote(tamanho_lote=2).importar_arquivo(self.tabela, self.caminho)
+
+        self.assertIsNone(ImportadorLote(tamanho_lote=2).importar_arquivo(self.tabela, self.caminho))
+
+    def test_reiniciar_ignora_o_checkpoint(self):
+        ImportadorLote(tamanho_lote=2).importar_arquivo(self.tabela, self.caminho)
+
+        resultado = ImportadorLote(tamanho_lote=2).importar_arquivo(self.tabela, self.caminho, reiniciar=True)
+
+        self.assertEqual((resultado.inseridas, resultado.atualizadas), (0, 5))
+
+
+# ============================
+# MODO INCREMENTAL
+# ============================
+class ImportacaoIncrementalTests(EntregasTestCase):
+
+    def importar(self, linhas):
+        importador = ImportadorLote(tamanho_lote=2, saida=lambda mensagem: None, incremental=True)
+        return importador.importar(TABELAS["entregas.csv"], linhas)
+
+    def test_pula_linhas_sem_alteracao(self):
+        linhas = [linha_entrega(f"NOV0000000{i}") for i in range(1, 4)]
+        self.importar(linhas)
+
+        resultado = self.importar(linhas)
+
+        self.assertEqual((resultado.inseridas, resultado.atualizadas, resultado.ignoradas), (0, 0, 3))
+
+    def test_grava_so_as_linhas_alteradas(self):
+        linhas = [linha_entrega(f"NOV0000000{i}") for i in range(1, 4)]
+        self.importar(linhas)
+        linhas[1] = linha_entrega("NOV00000002", observacoes="alterada")
+
+        resultado = self.importar(linhas)
+
+        self.assertEqual((resultado.atualizadas, resultado.ignoradas), (1, 2))
+        self.assertEqual(Entrega.objects.get(pk="NOV00000002").observacoes, "alterada")
+
+    def test_linha_excluida_do_banco_e_gravada_de_novo(self):
+        linhas = [linha_entrega("NOV00000001")]
+        self.importar(linhas)
+        Entrega.objects.filter(pk="NOV00000001").delete()
+
+        resultado = self.importar(linhas)
+
+        self.assertEqual((resultado.inseridas, resultado.ignoradas), (1, 0))
+        self.assertTrue(Entrega.objects.filter(pk="NOV00000001").exists())
+
+    def test_impressoes_mantidas_fora_do_modo_incremental(self):
+        ImportadorLote(saida=lambda mensagem: None).importar(
+            TABELAS["entregas.csv"], [linha_entrega("NOV00000001")]
+        )
+
+        self.assertTrue(ImpressaoLinha.objects.filter(tabela="entregas.csv", chave="NOV00000001").exists())
+        self.assertEqual(self.importar([linha_entrega("NOV00000001")]).ignoradas, 1)
+
+
+# ============================
+# GRAFO E IMPORTAÇÃO EM PARALELO
+# ============================
+class ExecutorLocal:
+    """ProcessPoolExecutor que executa na hora, no próprio processo"""
+
+    def __init__(self, max_workers, initializer):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        return False
+
+    def submit(self, funcao, *args):
+        futuro = Future()
+        try:
+            futuro.set_result(funcao(*args))
+        except Exception as e:
+            futuro.set_exception(e)
+        return futuro
+
+
+class ImportacaoParalelaTests(TestCase):
+
+    def test_grafo_segue_as_chaves_estrangeiras(self):
+        grafo = grafo_dependencias()
+
+        self.assertEqual(grafo["clientes.csv"], set())
+        self.assertEqual(grafo["veiculos.csv"], {"motoristas.csv"})
+        self.assertEqual(grafo["rotas.csv"], {"clientes.csv", "motoristas.csv", "veiculos.csv"})
+        self.assertEqual(grafo["entregas.csv"], {"clientes.csv", "motoristas.csv", "rotas.csv"})
+
+    def test_ordem_de_importacao(self):
+        self.assertEqual(
+            ordem_de_importacao(),
+            ["clientes.csv", "motoristas.csv", "veiculos.csv", "rotas.csv", "entregas.csv"],
+        )
+
+    def test_dependencia_circular(self):
+        with self.assertRaises(ValueError):
+            ordem_de_importacao({"a.csv": {"b.csv"}, "b.csv": {"a.csv"}})
+
+    def importar(self, arquivos, falha=None):
+        """importar_em_paralelo no próprio processo; `falha` é o arquivo que dá erro"""
+        importados = []
+
+        def importar_arquivo(arquivo, caminho, *opcoes):
+            if arquivo == falha:
+                raise RuntimeError(f"erro em {arquivo}")
+            importados.append(arquivo)
+            return Resultado(arquivo), []
+
+        with mock.patch("entregas.importacao.ProcessPoolExecutor", ExecutorLocal), \
+                mock.patch("entregas.importacao._importar_em_processo", importar_arquivo):
+            eventos = list(importar_em_paralelo([(TABELAS[arquivo], arquivo) for arquivo in arquivos], 2))
+        return importados, {tabela.arquivo: erro for tabela, _, _, erro in eventos}
+
+    def test_arquivo_espera_as_dependencias(self):
+        importados, erros = self.importar(["entregas.csv", "rotas.csv", "clientes.csv"])
+
+        self.assertEqual(importados, ["clientes.csv", "rotas.csv", "entregas.csv"])
+        self.assertEqual(set(erros.values()), {None})
+
+    def test_falha_impede_os_dependentes(self):
+        importados, erros = self.importar(
+            ["clientes.csv", "motoristas.csv", "veiculos.csv", "rotas.csv"], falha="motoristas.csv"
+        )
+
+        self.assertEqual(importados, ["clientes.csv"])
+        self.assertIn("erro em motoristas.csv", erros["motoristas.csv"])
+        self.assertEqual(erros["veiculos.csv"], "não importado: depende de motoristas.csv")
+        self.assertIn("não importado", erros["rotas.csv"])
+
+    def test_opcoes_sqlite_em_paralelo(self):
+        opcoes = opcoes_sqlite_em_paralelo({"init_command": "PRAGMA foreign_keys=ON"})
+
+        self.assertEqual(opcoes["transaction_mode"], "IMMEDIATE")
+        self.assertGreaterEqual(opcoes["timeout"], 60)
+        self.assertEqual(opcoes["init_command"], "PRAGMA foreign_keys=ON")
+        self.assertEqual(opcoes_sqlite_em_paralelo({"timeout": 900})["timeout"], 900)
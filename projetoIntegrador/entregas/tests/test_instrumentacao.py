@@ -0,0 +1,81 @@
+import json
+
+from django.test import SimpleTestCase, override_settings
+
+from entregas.instrumentacao import Medicao, _medicao, medir_serializacao
+
+from .base import EntregasTestCase
+
+
+class MedicaoTests(SimpleTestCase):
+
+    def test_repetidas_so_conta_selects(self):
+        medicao = Medicao()
+        executar = lambda sql, params, many, context: None
+        for sql in ["SELECT 1"] * 3 + ["SELECT 2"] * 2 + ["UPDATE x"] * 5:
+            medicao(executar, sql, (), False, {})
+
+        self.assertEqual(medicao.consultas, 10)
+        self.assertEqual(medicao.repetidas(3), {"SELECT 1": 3})
+
+    def test_serializacao_aninhada_conta_uma_vez(self):
+        medicao = Medicao()
+        token = _medicao.set(medicao)
+        try:
+            with medir_serializacao():
+                with medir_serializacao():
+                    pass
+                self.assertTrue(medicao.serializando)
+        finally:
+            _medicao.reset(token)
+
+        self.assertFalse(medicao.serializando)
+        self.assertGreater(medicao.serializacao_s, 0)
+
+
+@override_settings(ENTREGAS_INSTRUMENTACAO={"AMOSTRAGEM": 1, "LIMITE_REPETICOES": 3, "LENTA_MS": 60_000})
+class InstrumentacaoMiddlewareTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def registro(self, logs):
+        return json.loads(logs.records[-1].getMessage())
+
+    def test_server_timing_e_log_da_requisicao(self):
+        with self.assertLogs("entregas.instrumentacao", "INFO") as logs:
+            resposta = self.client.get(f"/rotas/{self.rota.pk}/")
+
+        metricas = [parte.split(";")[0] for parte in resposta["Server-Timing"].split(", ")]
+        self.assertEqual(metricas, ["total", "db", "serializacao", "app"])
+        registro = self.registro(logs)
+        self.assertEqual(logs.records[-1].levelname, "INFO")
+        self.assertEqual((registro["metodo"], registro["status"], registro["repetidas"]), ("GET", 200, []))
+        self.assertEqual(registro["rota"], "^rotas/(?P<pk>[^/.]+)/$")
+        self.assertGreater(registro["consultas"], 0)
+        self.assertGreater(registro["serializacao_ms"], 0)
+
+    @override_settings(ENTREGAS_INSTRUMENTACAO={"AMOSTRAGEM": 1, "LIMITE_REPETICOES": 1, "LENTA_MS": 60_000})
+    def test_consultas_repetidas_viram_warning(self):
+        with self.assertLogs("entregas.instrumentacao", "INFO") as logs:
+            resposta = self.client.get("/entregas/")
+
+        self.assertIn("repetidas;", resposta["Server-Timing"])
+        self.assertEqual(logs.records[-1].levelname, "WARNING")
+        self.assertTrue(all(r["vezes"] >= 1 for r in self.registro(logs)["repetidas"]))
+
+    @override_settings(ENTREGAS_INSTRUMENTACAO={"AMOSTRAGEM": 1, "LENTA_MS": 0, "CABECALHO": False})
+    def test_requisicao_lenta_sem_cabecalho(self):
+        with self.assertLogs("entregas.instrumentacao", "INFO") as logs:
+            resposta = self.client.get("/entregas/")
+
+        self.assertNotIn("Server-Timing", resposta)
+        self.assertEqual(logs.records[-1].levelname, "WARNING")
+
+    @override_settings(ENTREGAS_INSTRUMENTACAO={"AMOSTRAGEM": 0})
+    def test_fora_da_amostra_nao_mede(self):
+        with self.assertNoLogs("entregas.instrumentacao", "INFO"):
+            resposta = self.client.get("/entregas/")
+
+        self.assertNotIn("Server-Timing", resposta)
@@ -0,0 +1,115 @@
+from entregas.models import Entrega, EntregaEvento, Rota
+
+from .base import EntregasTestCase
+
+
+def nova(codigo, **campos):
+    return {
+        "codigo_rastreio": codigo, "cliente": "11111111111", "capacidade_necessaria": 10,
+        "endereco_origem": "Centro", "endereco_destino": "Asa Sul", "valor_frete": "12.50",
+        "data_entrega_prevista": "2024-04-05", "data_solicitacao": "2024-04-01", **campos,
+    }
+
+
+# ============================
+# CRIAÇÃO EM LOTE
+# ============================
+class CriacaoEmLoteTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def lote(self, entregas, **extras):
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post("/entregas/lote/", {"entregas": entregas, **extras}, format="json")
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.data
+
+    def test_cria_e_rejeita_item_a_item(self):
+        dados = self.lote([nova("ENT00000010"), nova("ENT00000011", status="X"), nova("ENT00000012", rota=self.rota.pk)])
+
+        self.assertEqual((dados["criadas"], dados["rejeitadas"]), (2, 1))
+        self.assertEqual(dados["resultados"][1]["erros"], {"status": '"X" não é uma escolha válida.'})
+        entrega = Entrega.objects.get(pk="ENT00000012")
+        self.assertEqual((entrega.status, entrega.rota_id, str(entrega.valor_frete)), ("P", self.rota.pk, "12.50"))
+        self.assertEqual(Rota.objects.get(pk=self.rota.pk).capacidade_total_utilizada, 260)
+        self.assertEqual(EntregaEvento.objects.filter(entrega_id__in=["ENT00000010", "ENT00000012"]).count(), 2)
+
+    def test_mesmas_regras_do_post_unitario(self):
+        # o mesmo item com textos em branco: o POST /entregas/ e o lote rejeitam
+        item = nova("", endereco_origem="", endereco_destino="")
+
+        unitario = self.client.post("/entregas/", item, format="json")
+        dados = self.lote([item])
+
+        self.assertEqual(unitario.status_code, 400)
+        self.assertEqual(dados["rejeitadas"], 1)
+        erros = dados["resultados"][0]["erros"]
+        self.assertEqual(set(erros), {"codigo_rastreio", "endereco_origem", "endereco_destino"})
+        for campo, mensagem in erros.items():
+            self.assertEqual(mensagem, str(unitario.data[campo][0]))
+        self.assertFalse(Entrega.objects.filter(pk="").exists())
+
+    def test_tipos_tamanhos_e_obrigatorios(self):
+        dados = self.lote([
+            nova("ENT00000010", capacidade_necessaria="1.5"),
+            nova("ENT00000011", valor_frete="1.234"),
+            nova("ENT00000012", data_solicitacao="2024-02-30"),
+            nova("ENT000000130"),
+            nova("ENT00000014", cliente=None),
+            {"codigo_rastreio": "ENT00000015"},
+            "texto",
+        ])
+
+        erros = [resultado.get("erros", {}) for resultado in dados["resultados"]]
+        self.assertEqual([set(e) for e in erros[:5]], [
+            {"capacidade_necessaria"}, {"valor_frete"}, {"data_solicitacao"}, {"codigo_rastreio"}, {"cliente"},
+        ])
+        self.assertIn("endereco_origem", erros[5])
+        self.assertEqual(set(erros[6]), {"item"})
+        self.assertEqual(dados["criadas"], 0)
+
+    def test_repetidos_existentes_e_relacionados(self):
+        dados = self.lote([
+            nova("ENT00000010"), nova("ENT00000010"), nova("ENT00000001"),
+            nova("ENT00000011", cliente="99999999999"), nova("ENT00000012", rota=999),
+            nova("ENT00000013", motorista="99999999999"),
+        ])
+
+        self.assertEqual([r["resultado"] for r in dados["resultados"]], ["criada"] + ["rejeitada"] * 5)
+        self.assertEqual(
+            [list(r["erros"].values())[0] for r in dados["resultados"][1:]],
+            ["Código repetido no lote.", "Já existe uma entrega com este código.", "Cliente não encontrado.",
+             "Rota não encontrada.", "Motorista não encontrado."],
+        )
+
+    def test_capacidade_aceita_na_ordem_enquanto_couber(self):
+        dados = self.lote([
+            nova("ENT00000010", capacidade_necessaria=500, rota=self.rota.pk),
+            nova("ENT00000011", capacidade_necessaria=100, rota=self.rota.pk),
+            nova("ENT00000012", capacidade_necessaria=50, rota=self.rota.pk),
+        ])
+
+        self.assertEqual([r["resultado"] for r in dados["resultados"]], ["criada", "rejeitada", "criada"])
+        self.assertEqual(Rota.objects.get(pk=self.rota.pk).capacidade_total_utilizada, 800)
+
+    def test_atualizar_so_os_campos_enviados(self):
+        dados = self.lote(
+            [{"codigo_rastreio": "ENT00000003", "status": "T", "rota": self.rota.pk}, nova("ENT00000010")],
+            atualizar=True,
+        )
+
+        self.assertEqual((dados["criadas"], dados["atualizadas"]), (1, 1))
+        entrega = Entrega.objects.get(pk="ENT00000003")
+        self.assertEqual((entrega.status, entrega.rota_id, entrega.endereco_destino), ("T", self.rota.pk, "Asa Norte"))
+        self.assertTrue(EntregaEvento.objects.filter(entrega_id="ENT00000003", status_novo="T").exists())
+        self.assertEqual(Rota.objects.get(pk=self.rota.pk).capacidade_total_utilizada, 450)
+
+    def test_corpo_invalido_e_permissao(self):
+        self.assertEqual(self.client.post("/entregas/lote/", {"entregas": []}, format="json").status_code, 400)
+        self.assertEqual(self.client.post("/entregas/lote/", {"entregas": "x"}, format="json").status_code, 400)
+
+        self.client.force_authenticate(self.usuario_motorista)
+        self.assertEqual(self.client.post("/entregas/lote/", {"entregas": [nova("ENT00000010")]}, format="json")
+                         .status_code, 403)
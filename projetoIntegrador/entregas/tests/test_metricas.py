@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from entregas import metricas
+from entregas.metricas import ACUMULADO, TRAVA_ACUMULADO, Registro, agregar, formato_texto
+
+from .base import EntregasTestCase
+
+PID_ENCERRADO = 999_999_999     # acima do pid_max: nenhum processo tem esse pid
+ERROS = "entregas_requisicao_erros_total"
+
+
+class DiretorioTemporario:
+    """DIRETORIO das métricas próprio do teste"""
+
+    def setUp(self):
+        super().setUp()
+        self.diretorio = tempfile.mkdtemp(prefix="entregas-metricas-")
+        self.addCleanup(shutil.rmtree, self.diretorio, ignore_errors=True)
+        configuracao = override_settings(ENTREGAS_METRICAS={"DIRETORIO": self.diretorio, "RETENCAO_HORAS": 1})
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        # o arquivo deste processo vai para o diretório do teste
+        self.arquivo_original = metricas.registro._arquivo
+        metricas.registro._arquivo = None
+        self.addCleanup(setattr, metricas.registro, "_arquivo", self.arquivo_original)
+
+    def gravar_processo(self, nome, erros, horas_atras=0):
+        caminho = os.path.join(self.diretorio, nome)
+        with open(caminho, "w") as arquivo:
+            json.dump([[ERROS, [["acao", "list"], ["status", "404"], ["view", "Teste"]], erros]], arquivo)
+        momento = time.time() - horas_atras * 3600
+        os.utime(caminho, (momento, momento))
+        return caminho
+
+    def erros(self):
+        return agregar().get((ERROS, (("acao", "list"), ("status", "404"), ("view", "Teste"))), 0)
+
+
+class FormatoTextoTests(SimpleTestCase):
+
+    def test_histograma_acumulado_com_soma_e_contagem(self):
+        registro = Registro()
+        for valor in (0.003, 0.02, 0.02, 30):
+            registro.observar("entregas_requisicao_segundos", valor, view="RotaViewSet", acao="list")
+        registro.incrementar(ERROS, view="RotaViewSet", acao="list", status="404")
+
+        texto = formato_texto(registro.retrato())
+
+        self.assertIn('entregas_requisicao_segundos_bucket{acao="list",view="RotaViewSet",le="0.005"} 1', texto)
+        self.assertIn('entregas_requisicao_segundos_bucket{acao="list",view="RotaViewSet",le="0.025"} 3', texto)
+        self.assertIn('entregas_requisicao_segundos_bucket{acao="list",view="RotaViewSet",le="+Inf"} 4', texto)
+        self.assertIn('entregas_requisicao_segundos_count{acao="list",view="RotaViewSet"} 4', texto)
+        self.assertIn('entregas_requisicao_segundos_sum{acao="list",view="RotaViewSet"} 30.043', texto)
+        self.assertIn('entregas_requisicao_erros_total{acao="list",status="404",view="RotaViewSet"} 1', texto)
+        self.assertIn("# TYPE entregas_requisicao_segundos histogram", texto)
+
+
+class AgregacaoTests(DiretorioTemporario, SimpleTestCase):
+
+    def test_soma_os_arquivos_de_todos_os_processos(self):
+        self.gravar_processo("101-1.json", 2)
+        self.gravar_processo("102-1.json", 3)
+
+        self.assertEqual(self.erros(), 5)
+
+    def test_processos_encerrados_vao_para_o_acumulado(self):
+        antigo = self.gravar_processo(f"{PID_ENCERRADO}-1.json", 4, horas_atras=2)
+        self.gravar_processo(f"{PID_ENCERRADO}-2.json", 1)
+
+        # a primeira leitura acumula; o arquivo só é apagado na seguinte
+        self.assertEqual(self.erros(), 5)
+        with open(os.path.join(self.diretorio, ACUMULADO)) as arquivo:
+            self.assertEqual(json.load(arquivo)["arquivos"], [os.path.basename(antigo)])
+        self.assertTrue(os.path.exists(antigo))
+        self.assertEqual(self.erros(), 5)
+        self.assertFalse(os.path.exists(antigo))
+        self.assertEqual(self.erros(), 5)
+
+    def test_acumulado_soma_varias_passadas(self):
+        self.gravar_processo(f"{PID_ENCERRADO}-1.json", 4, horas_atras=2)
+        self.erros()
+        self.gravar_processo(f"{PID_ENCERRADO}-2.json", 6, horas_atras=2)
+
+        self.assertEqual([self.erros() for _ in range(3)], [10, 10, 10])
+        self.assertEqual(
+            sorted(os.listdir(self.diretorio)),
+            sorted([ACUMULADO, os.path.basename(metricas.registro._arquivo)]),
+        )
+
+    def test_processo_vivo_nao_e_acumulado(self):
+        vivo = self.gravar_processo(f"{os.getpid()}-1.json", 4, horas_atras=2)
+
+        self.assertEqual([self.erros(), self.erros()], [4, 4])
+        self.assertTrue(os.path.exists(vivo))
+
+    def test_outro_processo_acumulando(self):
+        antigo = self.gravar_processo(f"{PID_ENCERRADO}-1.json", 4, horas_atras=2)
+        open(os.path.join(self.diretorio, TRAVA_ACUMULADO), "w").close()
+
+        self.assertEqual(self.erros(), 4)
+        self.assertFalse(os.path.exists(os.path.join(self.diretorio, ACUMULADO)))
+        self.assertTrue(os.path.exists(antigo))
+
+
+class MetricasEndpointTests(DiretorioTemporario, EntregasTestCase):
+
+    def test_erros_por_view_e_acao(self):
+        self.client.force_authenticate(self.admin)
+        self.client.get("/rotas/999/")
+
+        texto = self.client.get("/metricas/").content.decode()
+
+        self.assertIn('entregas_requisicao_erros_total{acao="retrieve",status="404",view="RotaViewSet"}', texto)
+        self.assertIn('entregas_requisicao_segundos_count{acao="retrieve",view="RotaViewSet"}', texto)
+
+    def test_so_para_ips_permitidos(self):
+        self.assertEqual(self.client.get("/metricas/").status_code, 200)
+        self.assertEqual(self.client.get("/metricas/", REMOTE_ADDR="10.0.0.8").status_code, 404)
+
+    def test_token_substitui_os_ips(self):
+        with override_settings(ENTREGAS_METRICAS={"DIRETORIO": self.diretorio, "TOKEN": "segredo"}):
+            self.assertEqual(self.client.get("/metricas/").status_code, 404)
+            self.assertEqual(self.client.get("/metricas/", HTTP_AUTHORIZATION="Bearer outro").status_code, 404)
+            resposta = self.client.get("/metricas/", REMOTE_ADDR="10.0.0.8", HTTP_AUTHORIZATION="Bearer segredo")
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta["Content-Type"].startswith("text/plain; version=0.0.4"))
@@ -0,0 +1,58 @@
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from entregas.pagination import PaginacaoCursor
+
+from .base import EntregasTestCase
+
+
+class PaginacaoCursorTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def test_percorre_as_paginas_pela_chave_primaria(self):
+        primeira = self.client.get("/entregas/", {"page_size": 2})
+
+        self.assertEqual([e["codigo_rastreio"] for e in primeira.data["results"]], ["ENT00000001", "ENT00000002"])
+        self.assertIsNone(primeira.data["previous"])
+
+        segunda = self.client.get(primeira.data["next"])
+
+        self.assertEqual([e["codigo_rastreio"] for e in segunda.data["results"]], ["ENT00000003"])
+        self.assertIsNone(segunda.data["next"])
+        self.assertIsNotNone(segunda.data["previous"])
+
+    def test_pagina_nao_repete_nem_pula_itens_inseridos_no_meio(self):
+        primeira = self.client.get("/entregas/", {"page_size": 2})
+        self.criar_entrega("ENT00000000", 10)
+        self.criar_entrega("ENT00000004", 10)
+
+        segunda = self.client.get(primeira.data["next"])
+
+        self.assertEqual([e["codigo_rastreio"] for e in segunda.data["results"]], ["ENT00000003", "ENT00000004"])
+
+    def test_tamanho_maximo_da_pagina(self):
+        requisicao = Request(APIRequestFactory().get("/entregas/", {"page_size": 10_000}))
+
+        self.assertEqual(PaginacaoCursor().get_page_size(requisicao), 500)
+
+    def test_acao_pagina_o_modelo_do_queryset(self):
+        resposta = self.client.get(f"/rotas/{self.rota.pk}/entregas/", {"page_size": 1})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["results"][0]["codigo_rastreio"], "ENT00000001")
+        self.assertIsNotNone(resposta.data["next"])
+
+    def test_outras_listas_paginadas(self):
+        for url in ("/rotas/", "/veiculos/", "/motorista/", "/cliente/"):
+            with self.subTest(url=url):
+                resposta = self.client.get(url)
+                self.assertEqual(resposta.status_code, 200)
+                self.assertIn("next", resposta.data)
+
+    def test_cursor_invalido(self):
+        resposta = self.client.get("/entregas/", {"cursor": "invalido"})
+
+        self.assertEqual(resposta.status_code, 404)
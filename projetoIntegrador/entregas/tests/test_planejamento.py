@@ -0,0 +1,112 @@
+from datetime import date
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from entregas.models import Entrega, Motorista, Rota, Veiculo
+from entregas.planejamento import escalar_motoristas, first_fit_decreasing
+
+from .base import EntregasTestCase
+
+
+def first_fit_decreasing_simples(tamanhos, capacidades):
+    """Item a item, para comparar com a versão vetorizada"""
+    restante = list(capacidades)
+    destino = [-1] * len(tamanhos)
+    for i in sorted(range(len(tamanhos)), key=lambda i: -tamanhos[i]):
+        for v, livre in enumerate(restante):
+            if tamanhos[i] <= 0 or tamanhos[i] <= livre:
+                destino[i] = v
+                restante[v] -= max(tamanhos[i], 0)
+                break
+    return destino
+
+
+class EmpacotamentoTests(SimpleTestCase):
+
+    def test_igual_ao_first_fit_item_a_item(self):
+        gerador = np.random.default_rng(7)
+        for _ in range(50):
+            tamanhos = gerador.integers(0, 40, gerador.integers(0, 60)).tolist()
+            capacidades = gerador.integers(0, 120, gerador.integers(0, 6)).tolist()
+            with self.subTest(tamanhos=tamanhos, capacidades=capacidades):
+                self.assertEqual(
+                    first_fit_decreasing(tamanhos, capacidades).tolist(),
+                    first_fit_decreasing_simples(tamanhos, capacidades),
+                )
+
+    def test_nao_coube(self):
+        self.assertEqual(first_fit_decreasing([50, 30, 30], [60]).tolist(), [0, -1, -1])
+
+    def test_sem_veiculos(self):
+        self.assertEqual(first_fit_decreasing([10], []).tolist(), [-1])
+
+    def test_escala_prefere_a_cnh_menos_versatil(self):
+        veiculos = [("V1", "1", None, None), ("V2", "3", None, None), ("V3", "2", "M9", "B")]
+
+        escala = escalar_motoristas(veiculos, {"E": ["M1"], "B": ["M2"], "C": ["M3"]})
+
+        # carro com CNH B, caminhão com C; a E fica livre; o motorista ativo sem CNH de van não serve
+        self.assertEqual(escala, ["M2", "M3", None])
+
+
+class PlanejarTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def planejar(self, **corpo):
+        return self.client.post("/rotas/planejar/", {"data": "2024-04-10", **corpo}, format="json")
+
+    def test_simulacao_nao_grava(self):
+        resposta = self.planejar(simular=True)
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.data["simulacao"])
+        self.assertEqual(resposta.data["entregas_planejadas"], 1)
+        self.assertEqual(Rota.objects.count(), 1)
+        self.assertIsNone(Entrega.objects.get(pk="ENT00000003").rota_id)
+
+    def test_cria_as_rotas_e_vincula_as_entregas(self):
+        resposta = self.planejar()
+
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(resposta.data["rotas_criadas"], 1)
+        rota = Rota.objects.get(pk=resposta.data["rotas"][0]["id"])
+        self.assertEqual((rota.veiculo_id, rota.motorista_id, rota.data_rota), ("ABC1A11", "12312312312", date(2024, 4, 10)))
+        self.assertEqual(rota.capacidade_total_utilizada, 200)
+        entrega = Entrega.objects.get(pk="ENT00000003")
+        self.assertEqual((entrega.rota_id, entrega.motorista_id), (rota.pk, "12312312312"))
+        self.assertEqual(list(rota.clientes.values_list("pk", flat=True)), ["11111111111"])
+
+    def test_sem_veiculo_livre_na_data(self):
+        self.planejar()
+        self.criar_entrega("ENT00000004", 10)
+
+        resposta = self.planejar()
+
+        self.assertEqual(resposta.data["rotas_criadas"], 0)
+        self.assertEqual(resposta.data["codigos_sem_rota"], ["ENT00000004"])
+
+    def test_veiculo_sem_motorista_compativel(self):
+        Veiculo.objects.create(
+            placa="CDE3C33", modelo="Caminhão VUC", capacidade_maxima=3000, km_atual=0, tipo="3",
+        )
+        Motorista.objects.create(
+            cpf="34534534534", nome_motorista="Caio", telefone="0", data_cadastro=date(2024, 1, 1), cnh="D",
+        )
+
+        resposta = self.planejar(simular=True)
+
+        self.assertEqual(resposta.data["veiculos_sem_motorista"], ["CDE3C33"])
+
+    def test_data_invalida(self):
+        resposta = self.client.post("/rotas/planejar/", {"data": "10/04/2024"}, format="json")
+
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_apenas_administradores(self):
+        self.client.force_authenticate(self.usuario_motorista)
+
+        self.assertEqual(self.planejar().status_code, 403)
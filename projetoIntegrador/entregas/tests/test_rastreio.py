@@ -0,0 +1,53 @@
+from entregas.models import Entrega
+
+from .base import EntregasTestCase
+
+
+class RastreioTests(EntregasTestCase):
+
+    def test_rastreio_publico(self):
+        resposta = self.client.get("/rastreio/ENT00000001/")
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json(), {
+            "codigo_rastreio": "ENT00000001",
+            "status": "P",
+            "data_entrega_prevista": "2024-04-05",
+            "data_entrega_real": None,
+            "status_descricao": "Pendente",
+        })
+
+    def test_codigo_inexistente(self):
+        resposta = self.client.get("/rastreio/NAOEXISTE00/")
+
+        self.assertEqual(resposta.status_code, 404)
+        self.assertEqual(resposta.json(), {"erro": "Entrega não encontrada"})
+
+    def test_repeticoes_nao_consultam_o_banco(self):
+        self.client.get("/rastreio/ENT00000001/")
+        self.client.get("/rastreio/NAOEXISTE00/")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/rastreio/ENT00000001/").status_code, 200)
+            self.assertEqual(self.client.get("/rastreio/NAOEXISTE00/").status_code, 404)
+
+    def test_gravacao_invalida_o_codigo(self):
+        self.client.get("/rastreio/ENT00000001/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            entrega = Entrega.objects.get(pk="ENT00000001")
+            entrega.status = "T"
+            entrega.save()
+
+        self.assertEqual(self.client.get("/rastreio/ENT00000001/").json()["status"], "T")
+
+    def test_entrega_criada_depois_de_um_404(self):
+        self.client.get("/rastreio/NOV00000001/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.criar_entrega("NOV00000001", 10)
+
+        self.assertEqual(self.client.get("/rastreio/NOV00000001/").status_code, 200)
+
+    def test_so_get(self):
+        self.assertEqual(self.client.post("/rastreio/ENT00000001/").status_code, 405)
@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+
+from entregas.models import Entrega, Rota
+
+from .base import EntregasTestCase
+
+
+# ============================
+# LOTES DE ENTREGAS DA ROTA
+# ============================
+class LoteEntregasDaRotaTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.outra_rota = Rota.objects.create(
+            nome_rota="Rota Sul", descricao="zona sul", motorista=self.motorista, veiculo=self.veiculo,
+            data_rota=date(2024, 4, 2), km_total_estimado=10, tempo_estimado=timedelta(hours=1),
+        )
+        self.criar_entrega("ENT00000004", 100, rota=self.outra_rota)
+        self.criar_entrega("ENT00000005", 500)
+
+    def adicionar(self, codigos, rota=None):
+        return self.client.post(
+            f"/rotas/{(rota or self.rota).pk}/adicionar-entregas/", {"entregas": codigos}, format="json"
+        )
+
+    def test_adiciona_na_ordem_enquanto_couber(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.adicionar([
+                "ENT00000003", "ENT00000001", "ENT00000004", "NAOEXISTE00", "ENT00000005",
+            ])
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["aceitas"], ["ENT00000003"])
+        self.assertEqual(resposta.data["rejeitadas"], [
+            {"entrega": "ENT00000001", "motivo": "Entrega já está nesta rota"},
+            {"entrega": "ENT00000004", "motivo": "Entrega já está vinculada a uma rota"},
+            {"entrega": "NAOEXISTE00", "motivo": "Entrega não encontrada"},
+            {"entrega": "ENT00000005", "motivo": "Capacidade do veículo excedida"},
+        ])
+        self.assertEqual(resposta.data["capacidade_total_utilizada"], 450)
+        self.assertEqual(resposta.data["capacidade_disponivel"], 350)
+        self.assertEqual(Entrega.objects.get(pk="ENT00000003").rota_id, self.rota.pk)
+
+    def test_remove_e_devolve_a_capacidade(self):
+        resposta = self.client.post(
+            f"/rotas/{self.rota.pk}/remover-entregas/",
+            {"entregas": ["ENT00000001", "ENT00000004"]}, format="json",
+        )
+
+        self.assertEqual(resposta.data["aceitas"], ["ENT00000001"])
+        self.assertEqual(resposta.data["rejeitadas"], [
+            {"entrega": "ENT00000004", "motivo": "Entrega não encontrada nesta rota"},
+        ])
+        self.assertEqual(resposta.data["capacidade_total_utilizada"], 150)
+        self.assertIsNone(Entrega.objects.get(pk="ENT00000001").rota_id)
+
+    def test_lote_invalido(self):
+        for corpo in ({}, {"entregas": []}, {"entregas": "ENT00000003"}, {"entregas": [1, 2]}):
+            with self.subTest(corpo=corpo):
+                resposta = self.client.post(f"/rotas/{self.rota.pk}/adicionar-entregas/", corpo, format="json")
+                self.assertEqual(resposta.status_code, 400)
+
+    def test_lote_acima_do_limite(self):
+        resposta = self.adicionar([f"X{i:010d}" for i in range(1001)])
+
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_rota_fora_do_planejamento(self):
+        Rota.objects.filter(pk=self.rota.pk).update(status_rota="A")
+
+        resposta = self.adicionar(["ENT00000003"])
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIsNone(Entrega.objects.get(pk="ENT00000003").rota_id)
+
+    def test_apenas_administradores(self):
+        self.client.force_authenticate(self.usuario_motorista)
+
+        self.assertEqual(self.adicionar(["ENT00000003"]).status_code, 403)
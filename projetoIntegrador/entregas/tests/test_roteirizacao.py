@@ -0,0 +1,100 @@
+from datetime import timedelta
+from itertools import permutations
+
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from entregas.models import Entrega, Rota
+from entregas.roteirizacao import matriz_distancias, sequenciar
+
+from .base import EntregasTestCase
+
+CENTRO = (-15.7939, -47.8828)
+
+
+def comprimento(dist, caminho):
+    return sum(dist[a, b] for a, b in zip(caminho, caminho[1:]))
+
+
+class SequenciamentoTests(SimpleTestCase):
+
+    def test_matriz_distancias(self):
+        dist = matriz_distancias([0, 0], [0, 1])
+
+        self.assertAlmostEqual(dist[0, 1], 111.19, places=1)
+        self.assertEqual(dist[0, 0], 0)
+
+    def test_pontos_em_linha(self):
+        lat = np.array([0.0, 0.3, 0.1, 0.2])
+        lon = np.zeros(4)
+
+        ordem, km = sequenciar(lat, lon)
+
+        self.assertIn(ordem.tolist(), ([0, 2, 3, 1], [1, 3, 2, 0]))
+        self.assertAlmostEqual(km, matriz_distancias([0, 0.3], [0, 0])[0, 1])
+
+    def test_com_deposito_comeca_pelo_mais_proximo(self):
+        ordem, _ = sequenciar(np.array([0.3, 0.1, 0.2]), np.zeros(3), deposito=(0.0, 0.0))
+
+        self.assertEqual(ordem.tolist(), [1, 2, 0])
+
+    def test_proximo_do_otimo(self):
+        gerador = np.random.default_rng(3)
+        for _ in range(20):
+            lat, lon = gerador.random(7), gerador.random(7)
+            dist = matriz_distancias(lat, lon)
+            otimo = min(comprimento(dist, caminho) for caminho in permutations(range(7)))
+
+            ordem, km = sequenciar(lat, lon)
+
+            self.assertEqual(sorted(ordem.tolist()), list(range(7)))
+            self.assertAlmostEqual(km, comprimento(dist, ordem.tolist()))
+            self.assertLessEqual(km, otimo * 1.15)
+
+    def test_sem_pontos(self):
+        ordem, km = sequenciar(np.array([]), np.array([]))
+
+        self.assertEqual((len(ordem), km), (0, 0.0))
+
+
+@override_settings(ENTREGAS_ROTEIRIZACAO={"AUTOMATICA": False, "DEPOSITO": CENTRO})
+class RoteirizarRotaTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        Entrega.objects.filter(pk="ENT00000001").update(endereco_destino="Ceilândia")
+        Entrega.objects.filter(pk="ENT00000002").update(endereco_destino="Asa Norte")
+        self.criar_entrega("ENT00000004", 10, rota=self.rota, endereco_destino="Rua 7, Taguatinga")
+        self.criar_entrega("ENT00000005", 10, rota=self.rota, endereco_destino="endereço desconhecido")
+
+    def test_ordena_as_paradas_e_estima_km_e_tempo(self):
+        resposta = self.client.post(f"/rotas/{self.rota.pk}/roteirizar/")
+
+        self.assertEqual(resposta.status_code, 200)
+        # o cliente tem coordenadas (Centro): o destino desconhecido usa as dele
+        self.assertEqual(resposta.data["paradas"], ["ENT00000005", "ENT00000002", "ENT00000004", "ENT00000001"])
+        self.assertEqual(
+            list(Entrega.objects.filter(rota=self.rota).order_by("ordem_parada").values_list("pk", flat=True)),
+            resposta.data["paradas"],
+        )
+        rota = Rota.objects.get(pk=self.rota.pk)
+        self.assertGreater(rota.km_total_estimado, 0)
+        minutos = rota.km_total_estimado / 30 * 60 + 4 * 5
+        self.assertAlmostEqual(rota.tempo_estimado / timedelta(minutes=1), minutos, delta=1.3 / 30 * 60)
+
+    def test_so_grava_as_entregas_que_mudaram_de_posicao(self):
+        self.client.post(f"/rotas/{self.rota.pk}/roteirizar/")
+        antes = dict(Entrega.objects.values_list("pk", "atualizado_em"))
+
+        self.client.post(f"/rotas/{self.rota.pk}/roteirizar/")
+
+        self.assertEqual(dict(Entrega.objects.values_list("pk", "atualizado_em")), antes)
+
+    @override_settings(ENTREGAS_ROTEIRIZACAO={"AUTOMATICA": True, "DEPOSITO": CENTRO})
+    def test_roteirizacao_automatica_depois_do_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.criar_entrega("ENT00000006", 10, rota=self.rota, endereco_destino="Planaltina")
+
+        ordens = dict(Entrega.objects.filter(rota=self.rota).values_list("pk", "ordem_parada"))
+        self.assertEqual(sorted(ordens.values()), [1, 2, 3, 4, 5])
@@ -0,0 +1,127 @@
+from datetime import date, timedelta
+
+from django.utils import timezone
+
+from entregas.models import Entrega, Motorista, Rota
+from entregas.sincronizacao import Posicao
+
+from .base import EntregasTestCase
+
+
+class SincronizacaoTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Entrega.objects.filter(rota=self.rota).update(motorista=self.motorista)
+        self.outro = Motorista.objects.create(
+            cpf="45645645645", nome_motorista="Maria Lima", telefone="61988880002",
+            data_cadastro=date(2024, 1, 11), cnh="C", status_motorista="A",
+        )
+        self.client.force_authenticate(self.usuario_motorista)
+
+    def sincronizar(self, **params):
+        resposta = self.client.get("/entregas/sincronizar/", params)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.data
+
+    def todas_as_paginas(self, **params):
+        paginas = [self.sincronizar(**params)]
+        while not paginas[-1]["completo"]:
+            paginas.append(self.sincronizar(proximo=paginas[-1]["proximo"], limite=params.get("limite")))
+        return paginas
+
+    @staticmethod
+    def chaves(paginas):
+        return (
+            [e["codigo_rastreio"] for p in paginas for e in p["entregas"]],
+            [r["id"] for p in paginas for r in p["rotas"]],
+            [v["placa"] for p in paginas for v in p["veiculos"]],
+        )
+
+    def test_primeira_sincronizacao_traz_o_escopo_do_motorista(self):
+        dados = self.sincronizar()
+
+        self.assertTrue(dados["reiniciar"])
+        self.assertTrue(dados["completo"])
+        self.assertIsNone(dados["proximo"])
+        self.assertIsNotNone(dados["cursor"])
+        self.assertEqual(self.chaves([dados]), (["ENT00000001", "ENT00000002"], [self.rota.pk], ["ABC1A11"]))
+
+    def test_paginas_cobrem_os_tres_modelos_sem_repetir(self):
+        for i in range(4, 9):
+            self.criar_entrega(f"ENT0000000{i}", 10, motorista=self.motorista)
+
+        paginas = self.todas_as_paginas(limite=2)
+
+        entregas, rotas, veiculos = self.chaves(paginas)
+        self.assertEqual(len(paginas), 5)
+        self.assertEqual(sorted(entregas), ["ENT00000001", "ENT00000002", *(f"ENT0000000{i}" for i in range(4, 9))])
+        self.assertEqual(len(entregas), len(set(entregas)))
+        self.assertEqual((rotas, veiculos), ([self.rota.pk], ["ABC1A11"]))
+        self.assertTrue(all(len(p["entregas"]) + len(p["rotas"]) + len(p["veiculos"]) <= 2 for p in paginas))
+        # reinício só na primeira página; o cursor só na última
+        self.assertEqual([p["reiniciar"] for p in paginas], [True] + [False] * 4)
+        self.assertEqual([p["cursor"] is None for p in paginas], [True] * 4 + [False])
+
+    def test_linha_gravada_durante_a_paginacao_volta_mais_adiante(self):
+        for i in range(4, 7):
+            self.criar_entrega(f"ENT0000000{i}", 10, motorista=self.motorista)
+        primeira = self.sincronizar(limite=2)
+        lida = primeira["entregas"][0]["codigo_rastreio"]
+        Entrega.objects.get(pk=lida).save()
+
+        paginas = [primeira, *self.todas_as_paginas(proximo=primeira["proximo"], limite=2)]
+
+        entregas = self.chaves(paginas)[0]
+        self.assertEqual(entregas.count(lida), 2)
+        self.assertEqual(len(set(entregas)), 5)
+
+    def test_incremental_com_remocoes(self):
+        cursor = self.sincronizar()["cursor"]
+        antes = timezone.now() - timedelta(minutes=1)
+        Entrega.objects.update(atualizado_em=antes)
+        Rota.objects.update(atualizado_em=antes)
+        self.veiculo.__class__.objects.update(atualizado_em=antes)
+
+        entrega = Entrega.objects.get(pk="ENT00000002")
+        entrega.motorista = self.outro
+        entrega.save()
+        Entrega.objects.get(pk="ENT00000001").delete()
+        self.criar_entrega("ENT00000004", 10, motorista=self.motorista)
+
+        dados = self.sincronizar(desde=cursor.isoformat())
+
+        self.assertFalse(dados["reiniciar"])
+        # a rota perdeu entregas: vem de novo
+        self.assertEqual(self.chaves([dados]), (["ENT00000004"], [self.rota.pk], []))
+        self.assertEqual(dados["removidos"]["entregas"], ["ENT00000001", "ENT00000002"])
+
+    def test_remocao_desfeita_nao_e_enviada(self):
+        cursor = self.sincronizar()["cursor"]
+        entrega = Entrega.objects.get(pk="ENT00000002")
+        entrega.motorista = self.outro
+        entrega.save()
+        entrega.motorista = self.motorista
+        entrega.save()
+
+        dados = self.sincronizar(desde=cursor.isoformat())
+
+        self.assertIn("ENT00000002", self.chaves([dados])[0])
+        self.assertEqual(dados["removidos"]["entregas"], [])
+
+    def test_administrador_recebe_tudo_paginado(self):
+        self.client.force_authenticate(self.admin)
+
+        paginas = self.todas_as_paginas(limite=3)
+
+        self.assertEqual(len(self.chaves(paginas)[0]), 3)
+        self.assertEqual(len(paginas), 2)
+
+    def test_parametros_invalidos(self):
+        posicao = Posicao(None, timezone.now(), modelo=7).codificar()
+        for params in ({"desde": "ontem"}, {"limite": "x"}, {"proximo": "nao-e-uma-posicao"}, {"proximo": posicao}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get("/entregas/sincronizar/", params).status_code, 400)
+
+        self.client.force_authenticate(self.usuario_cliente)
+        self.assertEqual(self.client.get("/entregas/sincronizar/").status_code, 403)
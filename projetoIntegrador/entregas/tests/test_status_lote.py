@@ -0,0 +1,75 @@
+from django.utils import timezone
+
+from entregas.models import Entrega, EntregaEvento, Rota
+
+from .base import EntregasTestCase
+
+
+class StatusEmLoteTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Entrega.objects.filter(rota=self.rota).update(motorista=self.motorista)
+        self.client.force_authenticate(self.usuario_motorista)
+
+    def status(self, entregas):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/entregas/status/", {"entregas": entregas}, format="json")
+
+    def test_fechamento_da_rota_pelo_motorista(self):
+        resposta = self.status([
+            {"codigo_rastreio": "ENT00000001", "status": "E"},
+            {"codigo_rastreio": "ENT00000002", "status": "C"},
+        ])
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual((resposta.data["atualizadas"], resposta.data["rotas_concluidas"]), (2, [self.rota.pk]))
+        entregue = Entrega.objects.get(pk="ENT00000001")
+        self.assertEqual((entregue.status, entregue.data_entrega_real), ("E", timezone.localdate()))
+        self.assertEqual(Rota.objects.get(pk=self.rota.pk).status_rota, Rota.Status_rota.CONCLUIDA)
+        evento = EntregaEvento.objects.filter(entrega_id="ENT00000001").latest("id")
+        self.assertEqual(
+            (evento.status_anterior, evento.status_novo, evento.usuario_id), ("P", "E", self.usuario_motorista.pk)
+        )
+
+    def test_rota_com_entregas_em_aberto_continua(self):
+        resposta = self.status([{"codigo_rastreio": "ENT00000001", "status": "E", "data_entrega_real": "2024-04-03"}])
+
+        self.assertEqual(resposta.data["rotas_concluidas"], [])
+        self.assertEqual(str(Entrega.objects.get(pk="ENT00000001").data_entrega_real), "2024-04-03")
+        self.assertNotEqual(Rota.objects.get(pk=self.rota.pk).status_rota, Rota.Status_rota.CONCLUIDA)
+
+    def test_inalteradas_e_rejeitadas(self):
+        resposta = self.status([
+            {"codigo_rastreio": "ENT00000001", "status": "P"},
+            {"codigo_rastreio": "ENT00000003", "status": "T"},
+            {"codigo_rastreio": "NAOEXISTE00", "status": "T"},
+            {"codigo_rastreio": "ENT00000002"},
+            {"codigo_rastreio": "ENT00000002", "status": ""},
+            {"codigo_rastreio": "ENT00000001", "status": "T"},
+        ])
+
+        self.assertEqual(
+            [r["resultado"] for r in resposta.data["resultados"]],
+            ["inalterada"] + ["rejeitada"] * 5,
+        )
+        erros = [r.get("erros") for r in resposta.data["resultados"][1:]]
+        self.assertEqual(erros[0], {"codigo_rastreio": "Você não tem permissão para alterar esta entrega."})
+        self.assertEqual(erros[1], {"codigo_rastreio": "Entrega não encontrada."})
+        self.assertEqual(set(erros[2]), {"status"})
+        self.assertEqual(set(erros[3]), {"status", "codigo_rastreio"})
+        self.assertEqual(erros[4], {"codigo_rastreio": "Código repetido no lote."})
+        self.assertEqual(Entrega.objects.get(pk="ENT00000003").status, "P")
+
+    def test_administrador_altera_qualquer_entrega(self):
+        self.client.force_authenticate(self.admin)
+
+        resposta = self.status([{"codigo_rastreio": "ENT00000003", "status": "T"}])
+
+        self.assertEqual(resposta.data["atualizadas"], 1)
+
+    def test_corpo_invalido_e_permissao(self):
+        self.assertEqual(self.client.post("/entregas/status/", {"entregas": []}, format="json").status_code, 400)
+
+        self.client.force_authenticate(self.usuario_cliente)
+        self.assertEqual(self.status([{"codigo_rastreio": "ENT00000001", "status": "E"}]).status_code, 403)
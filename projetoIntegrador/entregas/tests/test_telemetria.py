@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta, timezone as fuso
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from entregas import telemetria
+from entregas.models import Telemetria, Veiculo
+from entregas.telemetria import BufferTelemetria, Ponto, PontoInvalido, ler_ponto
+
+from .base import EntregasTestCase, limpar_caches
+
+INICIO = datetime(2024, 4, 1, 8, 0, tzinfo=fuso.utc)
+
+
+def ponto(placa="ABC1A11", minutos=0, km=None, latitude=-15.79, longitude=-47.88):
+    return Ponto(placa, INICIO + timedelta(minutes=minutos), latitude, longitude, km)
+
+
+class LerPontoTests(SimpleTestCase):
+
+    def test_ponto_completo(self):
+        lido = ler_ponto({
+            "placa": "ABC1A11", "latitude": "-15.8", "longitude": -47.9, "km": "12001",
+            "velocidade_kmh": 40, "registrada_em": "2024-04-01T08:00:00Z",
+        }, INICIO)
+
+        self.assertEqual(lido, Ponto("ABC1A11", INICIO, -15.8, -47.9, 12001, 40.0))
+
+    def test_sem_hora_usa_agora_e_hora_sem_fuso_ganha_o_fuso(self):
+        self.assertEqual(ler_ponto({"placa": "X", "latitude": 0, "longitude": 0}, INICIO).registrada_em, INICIO)
+        self.assertTrue(timezone.is_aware(
+            ler_ponto({"placa": "X", "latitude": 0, "longitude": 0, "registrada_em": "2024-04-01 08:00"}, INICIO)
+            .registrada_em
+        ))
+
+    def test_pontos_invalidos(self):
+        for dado in (
+            {"latitude": 0, "longitude": 0},
+            {"placa": "X", "latitude": "norte", "longitude": 0},
+            {"placa": "X", "latitude": "nan", "longitude": 0},
+            {"placa": "X", "latitude": 0, "longitude": 181},
+            {"placa": "X", "latitude": 0, "longitude": 0, "km": -1},
+            {"placa": "X", "latitude": 0, "longitude": 0, "registrada_em": "ontem"},
+        ):
+            with self.subTest(dado=dado), self.assertRaises(PontoInvalido):
+                ler_ponto(dado, INICIO)
+
+
+# ============================
+# BUFFER E GRAVAÇÃO
+# ============================
+@mock.patch.object(BufferTelemetria, "_iniciar")
+class BufferTelemetriaTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Veiculo.objects.filter(pk="ABC1A11").update(posicao_atualizada_em=INICIO)
+
+    def test_grava_pontos_km_e_posicao_em_uma_descarga(self, _):
+        buffer = BufferTelemetria(pontos_por_veiculo=10)
+        buffer.adicionar([ponto(minutos=1, km=12010), ponto(minutos=3, latitude=-15.8), ponto(minutos=2, km=12030)])
+        self.assertEqual(buffer.pendentes, 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(buffer.descarregar(), 3)
+
+        self.assertEqual(buffer.pendentes, 0)
+        self.assertEqual(Telemetria.objects.filter(veiculo=self.veiculo).count(), 3)
+        veiculo = Veiculo.objects.get(pk="ABC1A11")
+        self.assertEqual(veiculo.km_atual, 12030)
+        self.assertEqual((veiculo.latitude, veiculo.posicao_atualizada_em), (-15.8, INICIO + timedelta(minutes=3)))
+        self.assertEqual(buffer.metricas.gravacoes, 1)
+        self.assertEqual(buffer.descarregar(), 0)
+
+    def test_km_e_posicao_nao_voltam_atras(self, _):
+        buffer = BufferTelemetria()
+        buffer.adicionar([ponto(minutos=10, km=12100)])
+        buffer.descarregar()
+        buffer.adicionar([ponto(minutos=5, km=12050, latitude=-16.0)])
+        buffer.descarregar()
+
+        veiculo = Veiculo.objects.get(pk="ABC1A11")
+        self.assertEqual((veiculo.km_atual, veiculo.latitude), (12100, -15.79))
+        self.assertEqual(Telemetria.objects.count(), 2)
+
+    def test_fila_circular_descarta_os_mais_antigos(self, _):
+        buffer = BufferTelemetria(pontos_por_veiculo=2)
+        buffer.adicionar([ponto(minutos=i) for i in range(5)])
+
+        self.assertEqual((buffer.pendentes, buffer.metricas.descartados), (2, 3))
+        buffer.descarregar()
+        self.assertEqual(
+            list(Telemetria.objects.order_by("registrada_em").values_list("registrada_em", flat=True)),
+            [INICIO + timedelta(minutes=3), INICIO + timedelta(minutes=4)],
+        )
+
+    def test_veiculo_excluido_antes_da_gravacao(self, _):
+        buffer = BufferTelemetria()
+        buffer.adicionar([ponto(placa="ZZZ9Z99"), ponto()])
+
+        self.assertEqual(buffer.descarregar(), 1)
+        self.assertEqual(buffer.metricas.perdidos, 1)
+
+    def test_lote_cheio_acorda_a_thread(self, _):
+        buffer = BufferTelemetria(lote=3)
+        buffer.adicionar([ponto(minutos=1), ponto(minutos=2)])
+        self.assertFalse(buffer._acordar.is_set())
+
+        buffer.adicionar([ponto(minutos=3)])
+        self.assertTrue(buffer._acordar.is_set())
+
+    def test_falha_devolve_os_pontos_antes_dos_novos(self, _):
+        buffer = BufferTelemetria()
+        buffer.adicionar([ponto(minutos=1), ponto(minutos=2)])
+
+        with mock.patch("entregas.telemetria.gravar_pontos", side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            buffer.descarregar()
+        buffer.adicionar([ponto(minutos=3)])
+
+        self.assertEqual(buffer.metricas.falhas, 1)
+        self.assertEqual(buffer.pendentes, 3)
+        self.assertEqual([p.registrada_em.minute for p in buffer._filas["ABC1A11"]], [1, 2, 3])
+        self.assertEqual(buffer.descarregar(), 3)
+
+
+# ============================
+# ENDPOINTS
+# ============================
+@mock.patch.object(BufferTelemetria, "_iniciar")
+class TelemetriaEndpointTests(EntregasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Veiculo.objects.create(placa="XYZ9Z99", modelo="Van", capacidade_maxima=1000, km_atual=0, tipo="2")
+
+    def enviar(self, pontos):
+        return self.client.post("/veiculos/telemetria/", {"pontos": pontos}, format="json")
+
+    def test_aceita_no_buffer_e_rejeita_por_indice(self, _):
+        self.client.force_authenticate(self.admin)
+
+        resposta = self.enviar([
+            {"placa": "ABC1A11", "latitude": -15.8, "longitude": -47.9, "km": 12005},
+            {"placa": "ABC1A11", "latitude": 95, "longitude": -47.9},
+            {"placa": "NAO0A00", "latitude": -15.8, "longitude": -47.9},
+        ])
+
+        self.assertEqual(resposta.status_code, 202)
+        self.assertEqual(resposta.data["aceitos"], 1)
+        self.assertEqual(resposta.data["rejeitados"][0]["indice"], 1)
+        self.assertEqual(resposta.data["rejeitados"][1], {"placa": "NAO0A00", "erro": "Veículo não encontrado."})
+        # nada vai ao banco na requisição
+        self.assertFalse(Telemetria.objects.exists())
+
+        metricas = self.client.get("/veiculos/telemetria/metricas/").data
+        self.assertEqual((metricas["recebidos"], metricas["rejeitados"], metricas["pendentes"]), (1, 2, 1))
+
+    def test_buffer_atual_gravado_ao_sair(self, _):
+        self.client.force_authenticate(self.admin)
+        self.enviar([{"placa": "ABC1A11", "latitude": -15.8, "longitude": -47.9, "km": 12005}])
+
+        telemetria._descarregar_ao_sair()
+
+        self.assertEqual(Telemetria.objects.count(), 1)
+
+    def test_nada_gravado_ao_sair_depois_da_limpeza(self, _):
+        self.client.force_authenticate(self.admin)
+        self.enviar([{"placa": "ABC1A11", "latitude": -15.8, "longitude": -47.9, "km": 12005}])
+        buffer = telemetria.buffer_telemetria()
+
+        limpar_caches()
+        telemetria._descarregar_ao_sair()
+        buffer.descarregar()
+
+        self.assertFalse(Telemetria.objects.exists())
+        self.assertEqual(Veiculo.objects.get(pk="ABC1A11").km_atual, 12000)
+
+    def test_motorista_so_envia_o_proprio_veiculo(self, _):
+        self.client.force_authenticate(self.usuario_motorista)
+
+        resposta = self.enviar([
+            {"placa": "ABC1A11", "latitude": -15.8, "longitude": -47.9},
+            {"placa": "XYZ9Z99", "latitude": -15.8, "longitude": -47.9},
+        ])
+
+        self.assertEqual(resposta.data["aceitos"], 1)
+        self.assertEqual(resposta.data["rejeitados"], [{"placa": "XYZ9Z99", "erro": "Veículo não encontrado."}])
+        self.assertEqual(self.client.get("/veiculos/telemetria/metricas/").status_code, 403)
+
+    def test_corpo_invalido(self, _):
+        self.client.force_authenticate(self.admin)
+
+        self.assertEqual(self.client.post("/veiculos/telemetria/", {"pontos": "x"}, format="json").status_code, 400)
+        with mock.patch("entregas.views.LIMITE_LOTE_TELEMETRIA", 2):
+            self.assertEqual(self.enviar([{}] * 3).status_code, 400)
@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from entregas.importacao import TABELAS
+from entregas.models import Entrega
+from entregas.validacao_csv import validar
+
+from .base import configuracao_testes
+from .test_importacao import escrever_csv, linha_entrega
+
+PASTA_CSV = Path(settings.BASE_DIR) / "csv"
+
+
+def arquivos_de_exemplo(*nomes):
+    return [(TABELAS[nome], PASTA_CSV / nome) for nome in nomes]
+
+
+@configuracao_testes
+class ValidacaoCsvTests(TestCase):
+
+    def validar_entregas(self, linhas, *outros):
+        caminho = escrever_csv(linhas)
+        self.addCleanup(os.remove, caminho)
+        relatorio, _ = validar([*outros, (TABELAS["entregas.csv"], caminho)])
+        return relatorio
+
+    def test_arquivos_de_exemplo_sem_erros(self):
+        relatorio, _ = validar(arquivos_de_exemplo(*TABELAS))
+
+        self.assertEqual(relatorio.erros, 0)
+        self.assertEqual(relatorio.linhas["entregas.csv"], 12)
+
+    def test_chaves_procuradas_nos_proprios_arquivos(self):
+        relatorio = self.validar_entregas(
+            [linha_entrega("NOV00000001", rota_id="1")],
+            *arquivos_de_exemplo("clientes.csv", "motoristas.csv", "veiculos.csv", "rotas.csv"),
+        )
+
+        self.assertEqual(relatorio.erros, 0)
+
+    def test_erros_por_linha_e_coluna(self):
+        relatorio = self.validar_entregas([
+            linha_entrega("NOV00000001", cliente_cpf="11111111111"),
+            linha_entrega("NOV00000002", data_solicitacao="2024-02-30", valor_frete="1000.00"),
+            linha_entrega("", status="X", capacidade_necessaria="1,5"),
+        ], *arquivos_de_exemplo("clientes.csv"))
+
+        erros = {(o["linha"], o["coluna"]) for o in relatorio.ocorrencias if o["nivel"] == "erro"}
+        self.assertEqual(erros, {
+            (2, "data_solicitacao"), (2, "valor_frete"),
+            (3, "codigo_rastreio"), (3, "status"), (3, "capacidade_necessaria"),
+        })
+
+    def test_colunas_ausentes(self):
+        relatorio = self.validar_entregas([{"codigo_rastreio": "NOV00000001"}])
+
+        self.assertEqual(relatorio.ocorrencias[0]["mensagem"], "colunas ausentes no cabeçalho")
+        self.assertIn("status", relatorio.ocorrencias[0]["coluna"])
+
+    def test_campos_entre_aspas(self):
+        relatorio = self.validar_entregas(
+            [linha_entrega("NOV00000001", observacoes="frágil, não empilhar")],
+            *arquivos_de_exemplo("clientes.csv"),
+        )
+
+        self.assertEqual(relatorio.erros, 0)
+
+    def test_dry_run_nao_grava_e_salva_o_relatorio(self):
+        caminho = escrever_csv([linha_entrega("NOV00000001", cliente_cpf="99999999999")])
+        self.addCleanup(os.remove, caminho)
+        destino = tempfile.mktemp(suffix=".json")
+        self.addCleanup(lambda: os.path.exists(destino) and os.remove(destino))
+
+        with self.assertRaises(CommandError):
+            call_command(
+                "importar_csv", caminho, "--tabela", "entregas", "--dry-run", "--relatorio", destino,
+                stdout=StringIO(),
+            )
+
+        with open(destino, encoding="utf-8") as arquivo:
+            relatorio = json.load(arquivo)
+        self.assertEqual(relatorio["erros"], 1)
+        self.assertEqual(relatorio["ocorrencias"][0]["coluna"], "cliente_cpf")
+        self.assertFalse(Entrega.objects.exists())
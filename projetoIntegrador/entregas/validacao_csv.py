@@ -0,0 +1,377 @@
+"""
+Pré-validação dos CSVs de importação (usada por `importar_csv --dry-run`).
+
+Cada arquivo é carregado em colunas (arrays NumPy de strings) e as regras
+são aplicadas coluna a coluna, com operações vetorizadas, sem montar
+objetos nem gravar nada no banco. O resultado é um relatório com uma
+ocorrência por linha/coluna inválida, que pode ser salvo em JSON ou CSV.
+"""
+import csv
+import io
+import json
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from .models import Cliente, Motorista, Veiculo, Rota, Entrega
+
+
+# ============================
+# RELATÓRIO
+# ============================
+class Relatorio:
+    CAMPOS = ["arquivo", "linha", "coluna", "valor", "nivel", "mensagem"]
+
+    def __init__(self):
+        self.ocorrencias = []
+        self.linhas = {}    # arquivo -> quantidade de linhas lidas
+
+    def adicionar(self, arquivo, mascara, coluna, valores, mensagem, nivel="erro"):
+        """Registra uma ocorrência para cada posição verdadeira da máscara"""
+        for i in np.flatnonzero(mascara):
+            self.ocorrencias.append({
+                "arquivo": arquivo,
+                "linha": int(i) + 1,
+                "coluna": coluna,
+                "valor": str(valores[i]) if valores is not None else "",
+                "nivel": nivel,
+                "mensagem": mensagem,
+            })
+
+    @property
+    def erros(self):
+        return sum(1 for o in self.ocorrencias if o["nivel"] == "erro")
+
+    def resumo(self):
+        """Quantidade de ocorrências por (arquivo, nível)"""
+        return Counter((o["arquivo"], o["nivel"]) for o in self.ocorrencias)
+
+    def salvar(self, caminho):
+        """Salva em JSON ou CSV, conforme a extensão do arquivo"""
+        caminho = Path(caminho)
+        ocorrencias = sorted(self.ocorrencias, key=lambda o: (o["arquivo"], o["linha"]))
+        if caminho.suffix.lower() == ".csv":
+            with open(caminho, "w", newline="", encoding="utf-8") as saida:
+                escritor = csv.DictWriter(saida, fieldnames=self.CAMPOS)
+                escritor.writeheader()
+                escritor.writerows(ocorrencias)
+        else:
+            with open(caminho, "w", encoding="utf-8") as saida:
+                json.dump(
+                    {"linhas": self.linhas, "erros": self.erros, "ocorrencias": ocorrencias},
+                    saida, ensure_ascii=False, indent=2,
+                )
+
+
+# ============================
+# CARGA EM COLUNAS
+# ============================
+def carregar_colunas(caminho, arquivo, relatorio):
+    """Lê o CSV inteiro e devolve {coluna: array de strings}"""
+    with open(caminho, newline="", encoding="utf-8-sig") as entrada:
+        dados = entrada.read()
+
+    if '"' in dados:
+        # campos entre aspas (vírgulas/quebras de linha no valor): usa o módulo csv
+        leitor = csv.reader(io.StringIO(dados))
+        cabecalho = next(leitor, [])
+        linhas = [valores for valores in leitor if valores]
+        tamanhos = np.fromiter((len(valores) for valores in linhas), dtype=np.int64, count=len(linhas))
+    else:
+        # sem aspas cada vírgula separa um campo: divisão direta, bem mais rápida
+        texto = [linha for linha in dados.replace("\r\n", "\n").split("\n") if linha]
+        cabecalho = texto[0].split(",") if texto else []
+        texto = texto[1:]
+        tamanhos = np.char.count(np.array(texto, dtype=str), ",") + 1
+        linhas = None if (tamanhos == len(cabecalho)).all() else [linha.split(",") for linha in texto]
+
+    n = len(cabecalho)
+    relatorio.adicionar(
+        arquivo, tamanhos != n, "*", tamanhos, f"quantidade de colunas diferente do cabeçalho ({n})"
+    )
+    relatorio.linhas[arquivo] = len(tamanhos)
+
+    if linhas is None:
+        celulas = ",".join(texto).split(",") if texto else []
+    else:
+        celulas = [valor for valores in linhas for valor in (valores + [""] * n)[:n]]
+
+    return {nome: np.array(celulas[j::n], dtype=str) for j, nome in enumerate(cabecalho)}
+
+
+# ============================
+# REGRAS VETORIZADAS
+# Cada função devolve a máscara das posições inválidas
+# ============================
+def _digitos(col, minimo=1, maximo=None):
+    tamanho = np.char.str_len(col)
+    ok = np.char.isdigit(col) & (tamanho >= minimo)
+    if maximo:
+        ok &= tamanho <= maximo
+    return ok
+
+
+def _valor(col, largura):
+    """
+    Valor numérico de strings só com dígitos (até `largura` caracteres),
+    calculado pelos códigos dos caracteres em vez de int() por elemento.
+    """
+    codigos = np.asarray(col, dtype=f"U{largura}").view(np.uint32).reshape(-1, largura).astype(np.int64)
+    presente = codigos != 0
+    expoente = np.cumsum(presente[:, ::-1], axis=1)[:, ::-1] - 1
+    return (np.where(presente, codigos - 48, 0) * 10 ** np.where(presente, expoente, 0)).sum(axis=1)
+
+
+def _inteiros(col):
+    return _valor(np.where(col == "", "0", col), 18)
+
+
+def datas_invalidas(col, obrigatoria=True):
+    """Mesmo formato aceito por converter_data (strptime "%Y-%m-%d")"""
+    ano, _, resto = np.char.partition(col, "-").T
+    mes, _, dia = np.char.partition(resto, "-").T
+    ok = _digitos(ano, 4, 4) & _digitos(mes, 1, 2) & _digitos(dia, 1, 2)
+
+    a = _valor(np.where(ok, ano, "1"), 4)
+    m = _valor(np.where(ok, mes, "1"), 2)
+    d = _valor(np.where(ok, dia, "1"), 2)
+    bissexto = (a % 4 == 0) & ((a % 100 != 0) | (a % 400 == 0))
+    dias_no_mes = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(m, 1, 12) - 1]
+    dias_no_mes = dias_no_mes + ((m == 2) & bissexto)
+    ok &= (m >= 1) & (m <= 12) & (d >= 1) & (d <= dias_no_mes)
+
+    vazia = col == ""
+    return (~ok & ~vazia) | (vazia & obrigatoria)
+
+
+def tempos_invalidos(col):
+    """Mesmo formato aceito por converter_tempo (hh:mm:ss); obrigatório"""
+    h, _, resto = np.char.partition(col, ":").T
+    m, _, s = np.char.partition(resto, ":").T
+    return ~(_digitos(h) & _digitos(m) & _digitos(s))
+
+
+def inteiros_invalidos(col):
+    """Inteiro não negativo; vazio vale 0, como na importação"""
+    return ~(_digitos(col) | (col == ""))
+
+
+def decimais_invalidos(col, max_digitos, casas):
+    inteira, ponto, fracao = np.char.partition(col, ".").T
+    ok = _digitos(inteira, 1, max_digitos - casas) & (
+        (ponto == "") | _digitos(fracao, 1, casas)
+    )
+    return ~(ok | (col == ""))
+
+
+def fora_das_opcoes(col, choices):
+    return ~np.isin(col, [valor for valor, _ in choices])
+
+
+# ============================
+# ÍNDICES DE CHAVES
+# ============================
+def indice(chaves, valores=None):
+    """Ordena as chaves para busca vetorizada; em chave repetida vale a última"""
+    chaves = np.asarray(chaves, dtype=str)
+    valores = np.asarray(chaves if valores is None else valores)
+    unicas, posicoes = np.unique(chaves[::-1], return_index=True)
+    return unicas, valores[::-1][posicoes]
+
+
+def buscar(idx, consulta):
+    """Devolve (encontrada, valores) para cada chave consultada"""
+    chaves, valores = idx
+    if not len(chaves):
+        return np.zeros(len(consulta), dtype=bool), np.zeros(len(consulta), dtype=valores.dtype)
+    posicoes = np.minimum(np.searchsorted(chaves, consulta), len(chaves) - 1)
+    return chaves[posicoes] == consulta, valores[posicoes]
+
+
+def _juntar(banco, colunas, coluna_chave, coluna_valor=None):
+    """Chaves (e um atributo) do banco seguidas das do CSV, que prevalecem"""
+    chaves = [str(chave) for chave, _ in banco]
+    valores = [valor for _, valor in banco]
+    if colunas is not None:
+        chaves += list(colunas[coluna_chave])
+        if coluna_valor:
+            valores += list(colunas[coluna_valor])
+        else:
+            valores += list(colunas[coluna_chave])
+    return indice(chaves, np.array(valores, dtype=str) if valores else np.array([], dtype=str))
+
+
+# ============================
+# VALIDAÇÃO POR ARQUIVO
+# ============================
+COLUNAS = {
+    "clientes.csv": ["cpf_cliente", "nome_cliente", "endereco", "cidade", "estado", "bairro", "cep", "telefone", "email"],
+    "motoristas.csv": ["cpf", "nome_motorista", "telefone", "data_cadastro", "cnh", "status_motorista"],
+    "veiculos.csv": ["placa", "modelo", "capacidade_maxima", "km_atual", "motorista_cpf", "tipo", "status_veiculo"],
+    "rotas.csv": [
+        "id", "nome_rota", "descricao", "motorista_cpf", "veiculo_placa", "data_rota",
+        "capacidade_total_utilizada", "km_total_estimado", "tempo_estimado", "status_rota", "clientes_cpfs",
+    ],
+    "entregas.csv": [
+        "codigo_rastreio", "data_entrega_real", "capacidade_necessaria", "endereco_origem", "observacoes",
+        "endereco_destino", "valor_frete", "data_entrega_prevista", "data_solicitacao", "cliente_cpf",
+        "rota_id", "status",
+    ],
+}
+
+
+def _validar_clientes(c, idx, rel):
+    arq = "clientes.csv"
+    rel.adicionar(arq, c["cpf_cliente"] == "", "cpf_cliente", c["cpf_cliente"], "chave obrigatória")
+
+
+def _validar_motoristas(c, idx, rel):
+    arq = "motoristas.csv"
+    rel.adicionar(arq, c["cpf"] == "", "cpf", c["cpf"], "chave obrigatória")
+    rel.adicionar(arq, datas_invalidas(c["data_cadastro"]), "data_cadastro", c["data_cadastro"], "data inválida (YYYY-MM-DD)")
+    rel.adicionar(arq, fora_das_opcoes(c["cnh"], Motorista.Cnh.choices), "cnh", c["cnh"], "CNH inválida")
+    rel.adicionar(
+        arq, fora_das_opcoes(c["status_motorista"], Motorista.Status_motorista.choices),
+        "status_motorista", c["status_motorista"], "status inválido",
+    )
+
+
+def _validar_veiculos(c, idx, rel):
+    arq = "veiculos.csv"
+    rel.adicionar(arq, c["placa"] == "", "placa", c["placa"], "chave obrigatória")
+    for coluna in ("capacidade_maxima", "km_atual"):
+        rel.adicionar(arq, inteiros_invalidos(c[coluna]), coluna, c[coluna], "inteiro inválido")
+    rel.adicionar(arq, fora_das_opcoes(c["tipo"], Veiculo.Tipo.choices), "tipo", c["tipo"], "tipo inválido")
+    rel.adicionar(
+        arq, fora_das_opcoes(c["status_veiculo"], Veiculo.Status_veiculo.choices),
+        "status_veiculo", c["status_veiculo"], "status inválido",
+    )
+
+    cpf = c["motorista_cpf"]
+    encontrado, cnh = buscar(idx["motoristas"], cpf)
+    informado = cpf != ""
+    rel.adicionar(
+        arq, informado & ~encontrado, "motorista_cpf", cpf,
+        "motorista não encontrado (o veículo ficará sem motorista)", nivel="aviso",
+    )
+
+    # compatibilidade CNH x tipo (Veiculo.clean)
+    pares_validos = [tipo + cnh for tipo, cnhs in Veiculo.COMPATIBILIDADE_CNH.items() for cnh in cnhs]
+    compativel = np.isin(np.char.add(c["tipo"], cnh), pares_validos)
+    rel.adicionar(
+        arq, informado & encontrado & ~compativel, "motorista_cpf", np.char.add(np.char.add(cpf, " CNH "), cnh),
+        "CNH do motorista incompatível com o tipo do veículo",
+    )
+
+
+def _validar_rotas(c, idx, rel):
+    arq = "rotas.csv"
+    rel.adicionar(arq, ~_digitos(c["id"]), "id", c["id"], "id inválido")
+    rel.adicionar(arq, datas_invalidas(c["data_rota"]), "data_rota", c["data_rota"], "data inválida (YYYY-MM-DD)")
+    rel.adicionar(arq, tempos_invalidos(c["tempo_estimado"]), "tempo_estimado", c["tempo_estimado"], "duração inválida (hh:mm:ss)")
+    for coluna in ("capacidade_total_utilizada", "km_total_estimado"):
+        rel.adicionar(arq, inteiros_invalidos(c[coluna]), coluna, c[coluna], "inteiro inválido")
+    rel.adicionar(
+        arq, fora_das_opcoes(c["status_rota"], Rota.Status_rota.choices),
+        "status_rota", c["status_rota"], "status inválido",
+    )
+
+    motorista_ok, _ = buscar(idx["motoristas"], c["motorista_cpf"])
+    rel.adicionar(arq, ~motorista_ok, "motorista_cpf", c["motorista_cpf"], "motorista não encontrado")
+    veiculo_ok, capacidade_maxima = buscar(idx["veiculos"], c["veiculo_placa"])
+    rel.adicionar(arq, ~veiculo_ok, "veiculo_placa", c["veiculo_placa"], "veículo não encontrado")
+
+    capacidade_ok = ~inteiros_invalidos(c["capacidade_total_utilizada"])
+    utilizada = _inteiros(np.where(capacidade_ok, c["capacidade_total_utilizada"], ""))
+    maxima = _inteiros(np.where(veiculo_ok & np.char.isdigit(capacidade_maxima), capacidade_maxima, ""))
+    rel.adicionar(
+        arq, veiculo_ok & capacidade_ok & (utilizada > maxima), "capacidade_total_utilizada",
+        np.char.add(np.char.add(c["capacidade_total_utilizada"], " > "), maxima.astype(str)),
+        "capacidade utilizada excede a capacidade máxima do veículo",
+    )
+
+    # clientes_cpfs: lista separada por ";" achatada em um único array
+    listas = c["clientes_cpfs"]
+    if len(listas):
+        cpfs = np.array(";".join(listas).split(";"), dtype=str)
+        linha_do_cpf = np.repeat(np.arange(len(listas)), np.char.count(listas, ";") + 1)
+        encontrado, _ = buscar(idx["clientes"], cpfs)
+        faltando = np.zeros(len(listas), dtype=bool)
+        faltando[linha_do_cpf[~encontrado & (cpfs != "")]] = True
+        rel.adicionar(
+            arq, faltando, "clientes_cpfs", listas,
+            "cliente não encontrado (será ignorado no vínculo da rota)", nivel="aviso",
+        )
+
+
+def _validar_entregas(c, idx, rel):
+    arq = "entregas.csv"
+    rel.adicionar(arq, c["codigo_rastreio"] == "", "codigo_rastreio", c["codigo_rastreio"], "chave obrigatória")
+    rel.adicionar(
+        arq, np.char.str_len(c["codigo_rastreio"]) > Entrega._meta.get_field("codigo_rastreio").max_length,
+        "codigo_rastreio", c["codigo_rastreio"], "código de rastreio muito longo",
+    )
+    rel.adicionar(arq, datas_invalidas(c["data_entrega_real"], obrigatoria=False), "data_entrega_real", c["data_entrega_real"], "data inválida (YYYY-MM-DD)")
+    for coluna in ("data_entrega_prevista", "data_solicitacao"):
+        rel.adicionar(arq, datas_invalidas(c[coluna]), coluna, c[coluna], "data inválida (YYYY-MM-DD)")
+    rel.adicionar(arq, inteiros_invalidos(c["capacidade_necessaria"]), "capacidade_necessaria", c["capacidade_necessaria"], "inteiro inválido")
+    rel.adicionar(arq, decimais_invalidos(c["valor_frete"], 5, 2), "valor_frete", c["valor_frete"], "valor inválido (até 999.99)")
+    rel.adicionar(arq, fora_das_opcoes(c["status"], Entrega.Status_entrega.choices), "status", c["status"], "status inválido")
+
+    cliente_ok, _ = buscar(idx["clientes"], c["cliente_cpf"])
+    rel.adicionar(arq, ~cliente_ok, "cliente_cpf", c["cliente_cpf"], "cliente não encontrado")
+    rota_ok, _ = buscar(idx["rotas"], c["rota_id"])
+    rel.adicionar(arq, (c["rota_id"] != "") & ~rota_ok, "rota_id", c["rota_id"], "rota não encontrada")
+
+
+VALIDADORES = {
+    "clientes.csv": _validar_clientes,
+    "motoristas.csv": _validar_motoristas,
+    "veiculos.csv": _validar_veiculos,
+    "rotas.csv": _validar_rotas,
+    "entregas.csv": _validar_entregas,
+}
+
+
+def validar(arquivos):
+    """
+    Valida os arquivos [(tabela, caminho)] sem gravar nada. As chaves
+    estrangeiras são procuradas no banco e nos próprios arquivos informados.
+    Devolve (relatorio, segundos).
+    """
+    inicio = time.perf_counter()
+    relatorio = Relatorio()
+
+    colunas = {}
+    for tabela, caminho in arquivos:
+        lidas = carregar_colunas(caminho, tabela.arquivo, relatorio)
+        faltando = [nome for nome in COLUNAS[tabela.arquivo] if nome not in lidas]
+        if faltando:
+            relatorio.ocorrencias.append({
+                "arquivo": tabela.arquivo, "linha": 0, "coluna": ", ".join(faltando), "valor": "",
+                "nivel": "erro", "mensagem": "colunas ausentes no cabeçalho",
+            })
+            continue
+        colunas[tabela.arquivo] = lidas
+
+    idx = {
+        "clientes": _juntar(
+            Cliente.objects.values_list("cpf_cliente", "cpf_cliente"), colunas.get("clientes.csv"), "cpf_cliente",
+        ),
+        "motoristas": _juntar(
+            Motorista.objects.values_list("cpf", "cnh"), colunas.get("motoristas.csv"), "cpf", "cnh",
+        ),
+        "veiculos": _juntar(
+            Veiculo.objects.values_list("placa", "capacidade_maxima"), colunas.get("veiculos.csv"),
+            "placa", "capacidade_maxima",
+        ),
+        "rotas": _juntar(Rota.objects.values_list("id", "id"), colunas.get("rotas.csv"), "id"),
+    }
+
+    for arquivo, lidas in colunas.items():
+        if relatorio.linhas[arquivo]:
+            VALIDADORES[arquivo](lidas, idx, relatorio)
+
+    return relatorio, time.perf_counter() - inicio
@@ -1,15 +1,41 @@
+import hmac
+import json
+import math
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action, api_view
 from rest_framework.permissions import AllowAny
 from rest_framework.permissions import IsAdminUser,IsAuthenticatedOrReadOnly, IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.response import Response
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from django.db import transaction
+from django.db.models import Count, F, Max, Prefetch, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from .models import Motorista, Veiculo, Cliente, Rota, Entrega
 from .serializers import (
     MotoristaSerializer, VeiculoSerializer, ClienteSerializer,
-    RotaSerializer, EntregaSerializer, RotaDashboardSerializer
+    RotaSerializer, EntregaSerializer, RotaDashboardSerializer, RotaSincronizacaoSerializer
 )
+from .authentication import TokenAuthenticationCache, papel_do_usuario
+from .campos import CamposEsparsosMixin
+from .cache import cache_dashboard, chave_dashboard, buscar_rastreio, versao_dashboard
+from .condicional import condicional, responder_condicional, validadores
+from .espacial import veiculos_proximos, zonas_de_entregas
+from .eventos import autor_eventos, eventos_desde, linha_do_tempo
+from .geocodificacao import coordenadas_cep
+from .idempotencia import idempotente
+from .metricas import agregar, formato_texto, configuracao as configuracao_metricas
+from .lote_entregas import gravar_lote, gravar_status
+from .pagination import PaginacaoCursor
+from .planejamento import planejar
+from .roteirizacao import agendar_roteirizacao, roteirizar_rota
+from .sincronizacao import Posicao, alteracoes_desde, configuracao as configuracao_sincronizacao
+from .telemetria import PontoInvalido, buffer_telemetria, ler_ponto
+from .signals import invalidar_rotas
 from .permissions import (
     IsAdmin, IsMotorista, IsCliente, 
     IsMotoristaOrAdmin, IsClienteOrAdmin, IsAnyUser
@@ -17,8 +43,9 @@ from .permissions import (
 
 
 # ------------------- MOTORISTA ------------------------
-class MotoristaViewSet(viewsets.ModelViewSet):
-    authentication_classes = [TokenAuthentication]
+class MotoristaViewSet(CamposEsparsosMixin, viewsets.ModelViewSet):
+    authentication_classes = [TokenAuthenticationCache]
+    pagination_class = PaginacaoCursor
     permission_classes = [] #será definido no get_permissions
 
     queryset = Motorista.objects.all()
@@ -40,9 +67,10 @@ class MotoristaViewSet(viewsets.ModelViewSet):
         if user.is_staff:
             return Motorista.objects.all()
 
-        if hasattr(user, "motorista"):
+        papel = papel_do_usuario(user)
+        if papel.motorista:
             # motorista só vê ele mesmo
-            return Motorista.objects.filter(cpf=user.motorista.cpf)
+            return Motorista.objects.filter(cpf=papel.motorista_id)
 
         return Motorista.objects.none()
 
@@ -92,8 +120,9 @@ def liberar_veiculo(self, request, pk=None):
 
 
 # ------------------- VEICULO ------------------------
-class VeiculoViewSet(viewsets.ModelViewSet):
-    authentication_classes = [TokenAuthentication]
+class VeiculoViewSet(CamposEsparsosMixin, viewsets.ModelViewSet):
+    authentication_classes = [TokenAuthenticationCache]
+    pagination_class = PaginacaoCursor
     permission_classes = [IsMotoristaOrAdmin]
     
     queryset = Veiculo.objects.all()
@@ -107,8 +136,9 @@ class VeiculoViewSet(viewsets.ModelViewSet):
         if user.is_staff:
             return Veiculo.objects.all()
 
-        if hasattr(user, "motorista"):
-            return Veiculo.objects.filter(motorista_ativo=user.motorista)
+        papel = papel_do_usuario(user)
+        if papel.motorista:
+            return Veiculo.objects.filter(motorista_ativo=papel.motorista_id)
 
         return Veiculo.objects.none()  
 
@@ -118,16 +148,116 @@ class VeiculoViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["get"], url_path="disponiveis")
     def veiculos_disponiveis(self, request):
         veiculos = Veiculo.objects.filter(status_veiculo="D", motorista_ativo=None)
-        serializer = self.get_serializer(veiculos, many=True)
-        return Response(serializer.data)
+        pagina = self.paginate_queryset(veiculos)
+        serializer = self.get_serializer(pagina, many=True)
+        return self.get_paginated_response(serializer.data)
+
+# ------------------- ação: VEÍCULOS DISPONÍVEIS MAIS PRÓXIMOS ----------------------
+    @action(detail=False, methods=["get"], permission_classes=[IsAdmin])
+    def proximos(self, request):
+        """
+        Veículos disponíveis mais próximos de um ponto (?latitude=&longitude= ou ?cep=),
+        pela última posição conhecida. Filtros: k (padrão 5, até 100), tipo, cnh
+        (tipos que a CNH pode conduzir), capacidade (mínima) e raio_km.
+        """
+        params = request.query_params
+        try:
+            if params.get("cep"):
+                ponto = coordenadas_cep(params["cep"])
+                if ponto is None:
+                    return Response({"erro": "CEP não encontrado na tabela de CEPs."}, status=400)
+            else:
+                ponto = float(params["latitude"]), float(params["longitude"])
+            k = min(int(params.get("k", 5)), 100)
+            capacidade = int(params.get("capacidade", 0))
+            raio_km = float(params["raio_km"]) if params.get("raio_km") else None
+            # float() aceita "nan" e "inf": fora das faixas (ou NaN) não chegam à grade
+            if not (-90 <= ponto[0] <= 90 and -180 <= ponto[1] <= 180):
+                raise ValueError("coordenadas fora das faixas")
+            if raio_km is not None and not (math.isfinite(raio_km) and raio_km >= 0):
+                raise ValueError("raio inválido")
+        except (KeyError, ValueError):
+            return Response(
+                {"erro": (
+                    "Informe latitude (-90 a 90) e longitude (-180 a 180), ou cep; "
+                    "k, capacidade e raio_km devem ser números."
+                )},
+                status=400,
+            )
+
+        tipos = None
+        if params.get("tipo"):
+            tipos = {params["tipo"]}
+        if params.get("cnh"):
+            compativeis = {
+                tipo for tipo, cnhs in Veiculo.COMPATIBILIDADE_CNH.items() if params["cnh"] in cnhs
+            }
+            tipos = compativeis if tipos is None else tipos & compativeis
+
+        proximos = veiculos_proximos(*ponto, k=max(k, 0), tipos=tipos, capacidade_minima=capacidade, raio_km=raio_km)
+        return Response({
+            "latitude": ponto[0],
+            "longitude": ponto[1],
+            "veiculos": [
+                {"placa": placa, "distancia_km": round(distancia, 3), **dados}
+                for distancia, placa, dados in proximos
+            ],
+        })
+
+# ------------------- ação: INGESTÃO DE TELEMETRIA ----------------------
+    @action(detail=False, methods=["post"])
+    def telemetria(self, request):
+        """
+        Recebe pontos de GPS/odômetro: {"pontos": [{"placa", "latitude", "longitude",
+        "km", "velocidade_kmh", "registrada_em"}]}. Os pontos são gravados em lote
+        logo depois (telemetria.py); motoristas só enviam pontos do próprio veículo.
+        """
+        dados = request.data.get("pontos") if isinstance(request.data, dict) else None
+        if not isinstance(dados, list) or len(dados) > LIMITE_LOTE_TELEMETRIA:
+            return Response(
+                {"erro": f"Envie 'pontos' com uma lista de até {LIMITE_LOTE_TELEMETRIA} pontos."}, status=400
+            )
 
+        agora = timezone.now()
+        pontos, rejeitados = [], []
+        for i, dado in enumerate(dados):
+            try:
+                pontos.append(ler_ponto(dado, agora))
+            except PontoInvalido as e:
+                rejeitados.append({"indice": i, "erro": str(e)})
 
+        # get_queryset: todos os veículos para o admin, o próprio para o motorista
+        placas = {ponto.placa for ponto in pontos}
+        permitidas = set(self.get_queryset().filter(placa__in=placas).values_list("placa", flat=True))
+        for placa in sorted(placas - permitidas):
+            rejeitados.append({"placa": placa, "erro": "Veículo não encontrado."})
+        pontos = [ponto for ponto in pontos if ponto.placa in permitidas]
 
+        buffer = buffer_telemetria()
+        buffer.adicionar(pontos)
+        buffer.metricas.registrar_rejeitados(len(rejeitados))
+        return Response({"aceitos": len(pontos), "rejeitados": rejeitados}, status=202)
+
+# ------------------- ação: MÉTRICAS DA TELEMETRIA ----------------------
+    @action(detail=False, methods=["get"], url_path="telemetria/metricas", permission_classes=[IsAdmin])
+    def telemetria_metricas(self, request):
+        buffer = buffer_telemetria()
+        return Response(buffer.metricas.resumo(buffer.pendentes))
+
+
+
+
+
+LIMITE_LOTE_TELEMETRIA = 5000
+LIMITE_FEED_EVENTOS = 10000
+LIMITE_SINCRONIZACAO = 10000
+LIMITE_CRIACAO_LOTE = 10000
 
 
 # ------------------- CLIENTE ------------------------
-class ClienteViewSet(viewsets.ModelViewSet):
-    authentication_classes = [TokenAuthentication]
+class ClienteViewSet(CamposEsparsosMixin, viewsets.ModelViewSet):
+    authentication_classes = [TokenAuthenticationCache]
+    pagination_class = PaginacaoCursor
     filter_backends = [DjangoFilterBackend]
     queryset = Cliente.objects.all()
     serializer_class = ClienteSerializer
@@ -142,17 +272,70 @@ class ClienteViewSet(viewsets.ModelViewSet):
         if user.is_staff:
             return Cliente.objects.all()
 
-        if hasattr(user, "cliente"):
+        papel = papel_do_usuario(user)
+        if papel.cliente:
             # cliente só vê ele mesmo
-            return Cliente.objects.filter(cpf_cliente=user.cliente.cpf_cliente)
+            return Cliente.objects.filter(cpf_cliente=papel.cliente_id)
 
         return Cliente.objects.none()
     
 
 
+# ------------------- VERSÕES DA ROTA (GET CONDICIONAL) ------------------------
+# Uma consulta agregada, sem carregar nem serializar a rota: atualizado_em da
+# rota e o maior atualizado_em e a quantidade das suas entregas (uma entrega
+# que sai da rota atualiza a rota de origem, ver signals.py)
+def versao_rota(view, pk):
+    try:
+        return (
+            view.get_queryset().prefetch_related(None).filter(pk=pk)
+            .annotate(ultima_entrega=Max("entrega__atualizado_em"), quantidade=Count("entrega"))
+            .values(
+                "atualizado_em", "ultima_entrega", "quantidade",
+                "veiculo__capacidade_maxima", "veiculo__atualizado_em",
+            )
+            .first()
+        )
+    except (ValueError, TypeError):
+        return None
+
+
+def validadores_rota(view, request, pk=None, **kwargs):
+    """
+    Rota com as entregas (detalhe da rota e /rotas/{id}/entregas/). Com ?expand=
+    a resposta normal sai sem ETag: motorista e clientes não têm versão, e o
+    corpo traria os dados deles de quando a ETag foi gerada.
+    """
+    if view.campos_solicitados()[1]:
+        return None
+    versao = versao_rota(view, pk)
+    if versao is None:
+        return None
+    return validadores(
+        request, view.action, versao["atualizado_em"], versao["ultima_entrega"], versao["quantidade"],
+        modificado_em=max(filter(None, (versao["atualizado_em"], versao["ultima_entrega"]))),
+    )
+
+
+def validadores_capacidade(view, request, pk=None, **kwargs):
+    """
+    Só a capacidade do veículo entra na ETag: a telemetria atualiza o veículo a
+    todo momento. O Last-Modified, sem o valor, usa o atualizado_em do veículo.
+    """
+    versao = versao_rota(view, pk)
+    if versao is None:
+        return None
+    return validadores(
+        request, view.action, versao["atualizado_em"], versao["veiculo__capacidade_maxima"],
+        modificado_em=max(versao["atualizado_em"], versao["veiculo__atualizado_em"]),
+    )
+
+
+
 # ------------------- ROTA ------------------------
-class RotaViewSet(viewsets.ModelViewSet):
-    authentication_classes = [TokenAuthentication]
+class RotaViewSet(CamposEsparsosMixin, viewsets.ModelViewSet):
+    authentication_classes = [TokenAuthenticationCache]
+    pagination_class = PaginacaoCursor
     permission_classes = [IsAuthenticated]
     
     queryset = Rota.objects.all()
@@ -163,24 +346,39 @@ class RotaViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
 
+        # veículo junto (ações de capacidade); clientes e entregas de todas as
+        # rotas da página em uma consulta cada, só onde o RotaSerializer os exibe
+        rotas = Rota.objects.select_related("veiculo")
+        if self.action in ("list", "retrieve", "update", "partial_update"):
+            rotas = rotas.prefetch_related("clientes", "entrega_set")
+
         if user.is_staff:
-            return Rota.objects.all()
+            return rotas
 
-        if hasattr(user, "cliente"):
-            return Rota.objects.filter(clientes=user.cliente)
+        papel = papel_do_usuario(user)
+        if papel.cliente:
+            return rotas.filter(clientes=papel.cliente_id)
 
         return Rota.objects.none()
+
+    # consultada em polling: 304 se nada mudou desde a versão que o cliente tem
+    @condicional(validadores_rota)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
  # ------------------- ação: LISTAR ENTREGAS DA ROTA ---------------------- 
     @action(detail=True, methods=["get"], permission_classes=[IsAuthenticated])
+    @condicional(validadores_rota)
     def entregas(self, request, pk=None):
         rota = self.get_object()
         entregas = rota.entrega_set.all()
-        serializer = EntregaSerializer(entregas, many=True)
-        return Response(serializer.data)
+        pagina = self.paginate_queryset(entregas)
+        serializer = EntregaSerializer(pagina, many=True)
+        return self.get_paginated_response(serializer.data)
     
  # ------------------- ação: ADICIONAR ENTREGAS À ROTA ----------------------
     @action(detail=True, methods=["post"], permission_classes=[IsAdmin])
+    @idempotente
     def adicionar_entrega(self, request, pk=None):
         rota = self.get_object()
 
@@ -198,7 +396,7 @@ class RotaViewSet(viewsets.ModelViewSet):
             return Response({"erro": "entrega_id é obrigatório"}, status=400)
         
         try:
-            entrega = Entrega.objects.get(id=entrega_id)
+            entrega = Entrega.objects.get(codigo_rastreio=entrega_id)
         except Entrega.DoesNotExist:
             return Response({"erro": "Entrega não encontrada"}, status=404)
         
@@ -228,7 +426,7 @@ class RotaViewSet(viewsets.ModelViewSet):
         rota = self.get_object()
 
         try:
-            entrega = Entrega.objects.get(id=entrega_id, rota=rota)
+            entrega = Entrega.objects.get(codigo_rastreio=entrega_id, rota=rota)
         except Entrega.DoesNotExist:
             return Response({"erro": "Entrega não encontrada nesta rota"}, status=404)
         
@@ -243,8 +441,155 @@ class RotaViewSet(viewsets.ModelViewSet):
 
         return Response({"mensagem": "Entrega removida da rota"})
     
+ # ------------------- ação: ADICIONAR ENTREGAS À ROTA EM LOTE ----------------------
+    @action(detail=True, methods=["post"], url_path="adicionar-entregas", permission_classes=[IsAdmin])
+    @idempotente
+    def adicionar_entregas(self, request, pk=None):
+        """
+        Vincula várias entregas à rota em uma transação: {"entregas": ["ENT...", ...]}.
+        As entregas são aceitas na ordem enviada enquanto couberem no veículo;
+        a resposta informa as aceitas e as rejeitadas com o motivo.
+        """
+        codigos = ler_lote_entregas(request)
+        if codigos is None:
+            return Response({"erro": LOTE_INVALIDO}, status=400)
+
+        with transaction.atomic():
+            # a rota travada serializa lotes concorrentes na mesma rota
+            rota = Rota.objects.select_for_update().select_related("veiculo").get(pk=self.get_object().pk)
+
+            if rota.status_rota != "P":
+                return Response(
+                    {"erro": "Só é possível adicionar entregas em rotas planejadas"},
+                    status=400
+                )
+
+            entregas = {
+                e["codigo_rastreio"]: e
+                for e in Entrega.objects.select_for_update()
+                .filter(codigo_rastreio__in=codigos)
+                .values("codigo_rastreio", "rota_id", "capacidade_necessaria")
+            }
+            capacidade_utilizada = (
+                Entrega.objects.filter(rota=rota).aggregate(total=Sum("capacidade_necessaria"))["total"] or 0
+            )
+            disponivel = rota.veiculo.capacidade_maxima - capacidade_utilizada
+
+            aceitas, rejeitadas, total = [], [], 0
+            for codigo in codigos:
+                entrega = entregas.get(codigo)
+                if entrega is None:
+                    motivo = "Entrega não encontrada"
+                elif entrega["rota_id"] == rota.pk:
+                    motivo = "Entrega já está nesta rota"
+                elif entrega["rota_id"] is not None:
+                    motivo = "Entrega já está vinculada a uma rota"
+                elif total + entrega["capacidade_necessaria"] > disponivel:
+                    motivo = "Capacidade do veículo excedida"
+                else:
+                    aceitas.append(codigo)
+                    total += entrega["capacidade_necessaria"]
+                    continue
+                rejeitadas.append({"entrega": codigo, "motivo": motivo})
+
+            if aceitas:
+                agora = timezone.now()
+                Entrega.objects.filter(codigo_rastreio__in=aceitas, rota__isnull=True).update(
+                    rota=rota, atualizado_em=agora
+                )
+                Rota.objects.filter(pk=rota.pk).update(
+                    capacidade_total_utilizada=F("capacidade_total_utilizada") + total, atualizado_em=agora
+                )
+                # update() não dispara signals
+                invalidar_rotas(rota.pk)
+                agendar_roteirizacao(rota.pk)
+
+        return Response(resultado_lote(rota, aceitas, rejeitadas))
+
+ # ------------------- ação: REMOVER ENTREGAS DA ROTA EM LOTE ----------------------
+    @action(detail=True, methods=["post"], url_path="remover-entregas", permission_classes=[IsAdmin])
+    def remover_entregas(self, request, pk=None):
+        """
+        Desvincula várias entregas da rota em uma transação: {"entregas": ["ENT...", ...]}.
+        """
+        codigos = ler_lote_entregas(request)
+        if codigos is None:
+            return Response({"erro": LOTE_INVALIDO}, status=400)
+
+        with transaction.atomic():
+            rota = Rota.objects.select_for_update().select_related("veiculo").get(pk=self.get_object().pk)
+
+            capacidades = dict(
+                Entrega.objects.select_for_update()
+                .filter(codigo_rastreio__in=codigos, rota=rota)
+                .values_list("codigo_rastreio", "capacidade_necessaria")
+            )
+            aceitas = [codigo for codigo in codigos if codigo in capacidades]
+            rejeitadas = [
+                {"entrega": codigo, "motivo": "Entrega não encontrada nesta rota"}
+                for codigo in codigos if codigo not in capacidades
+            ]
+
+            if aceitas:
+                agora = timezone.now()
+                Entrega.objects.filter(codigo_rastreio__in=aceitas, rota=rota).update(
+                    rota=None, atualizado_em=agora
+                )
+                Rota.objects.filter(pk=rota.pk).update(
+                    capacidade_total_utilizada=Greatest(
+                        F("capacidade_total_utilizada") - sum(capacidades.values()), 0
+                    ),
+                    atualizado_em=agora,
+                )
+                invalidar_rotas(rota.pk)
+                agendar_roteirizacao(rota.pk)
+
+        return Response(resultado_lote(rota, aceitas, rejeitadas))
+    
+ # ------------------- ação: PLANEJAMENTO AUTOMÁTICO DE CARGA ----------------------
+    @action(detail=False, methods=["post"], permission_classes=[IsAdmin])
+    def planejar(self, request):
+        """
+        Distribui as entregas pendentes sem rota entre os veículos disponíveis,
+        criando rotas planejadas para a data: {"data": "AAAA-MM-DD", "simular": false}.
+        Com "simular" o plano é devolvido sem ser gravado.
+        """
+        try:
+            data = parse_date(str(request.data.get("data", "")))
+        except ValueError:
+            data = None
+        if data is None:
+            return Response({"erro": "Informe 'data' no formato AAAA-MM-DD"}, status=400)
+
+        simular = str(request.data.get("simular", "")).lower() in ("1", "true", "sim")
+        with transaction.atomic():
+            plano = planejar(data, travar=not simular)
+            if not simular:
+                plano.gravar()
+                agendar_roteirizacao(*(planejada.rota.pk for planejada in plano.rotas))
+
+        resumo = plano.resumo()
+        resumo["simulacao"] = simular
+        return Response(resumo, status=200 if simular else 201)
+    
+ # ------------------- ação: ROTEIRIZAR A ROTA ----------------------
+    @action(detail=True, methods=["post"], permission_classes=[IsAdmin])
+    def roteirizar(self, request, pk=None):
+        """
+        Recalcula a sequência de paradas, o km e o tempo estimados da rota.
+        """
+        rota = self.get_object()
+        codigos, km = roteirizar_rota(rota.pk)
+        rota.refresh_from_db(fields=["km_total_estimado", "tempo_estimado"])
+        return Response({
+            "paradas": codigos,
+            "km_total_estimado": rota.km_total_estimado,
+            "tempo_estimado": str(rota.tempo_estimado),
+        })
+    
  # ------------------- ação: CAPACIDADE DA ROTA ----------------------
     @action(detail=True, methods=["get"], permission_classes=[IsAuthenticated])
+    @condicional(validadores_capacidade)
     def capacidade(self, request, pk=None):
         rota = self.get_object()
 
@@ -258,9 +603,40 @@ class RotaViewSet(viewsets.ModelViewSet):
         
 
 
+# ------------------- LOTES DE ENTREGAS DA ROTA ------------------------
+LIMITE_LOTE_ENTREGAS = 1000
+LOTE_INVALIDO = (
+    f"Envie 'entregas' com uma lista de até {LIMITE_LOTE_ENTREGAS} códigos de rastreio."
+)
+
+
+def ler_lote_entregas(request):
+    """Códigos de rastreio do corpo da requisição, sem repetições, ou None se inválido"""
+    codigos = request.data.get("entregas")
+    if (
+        not isinstance(codigos, list) or not codigos
+        or len(codigos) > LIMITE_LOTE_ENTREGAS
+        or not all(isinstance(codigo, str) for codigo in codigos)
+    ):
+        return None
+    return list(dict.fromkeys(codigos))
+
+
+def resultado_lote(rota, aceitas, rejeitadas):
+    rota.refresh_from_db(fields=["capacidade_total_utilizada"])
+    return {
+        "aceitas": aceitas,
+        "rejeitadas": rejeitadas,
+        "capacidade_total_utilizada": rota.capacidade_total_utilizada,
+        "capacidade_disponivel": rota.veiculo.capacidade_maxima - rota.capacidade_total_utilizada,
+    }
+
+
+
 # ------------------- ENTREGA ------------------------
-class EntregaViewSet(viewsets.ModelViewSet):
-    authentication_classes = [TokenAuthentication]
+class EntregaViewSet(CamposEsparsosMixin, viewsets.ModelViewSet):
+    authentication_classes = [TokenAuthenticationCache]
+    pagination_class = PaginacaoCursor
     permission_classes = [IsAnyUser] 
     
     queryset = Entrega.objects.all()
@@ -269,7 +645,14 @@ class EntregaViewSet(viewsets.ModelViewSet):
     filterset_fields = ['codigo_rastreio']
     
     def get_permissions(self):
-        if self.request.method == "GET":
+        if self.action in ("zonas", "eventos", "lote"):
+            permission_classes = [IsAdmin]
+        elif self.action in ("sincronizar", "status_lote"):
+            permission_classes = [IsMotoristaOrAdmin]
+        elif self.action == "linha_do_tempo":
+            # o get_queryset limita às entregas do próprio cliente/motorista
+            permission_classes = [IsAuthenticated]
+        elif self.request.method == "GET":
             # Qualquer pessoa pode consultar entregas pelo código
             permission_classes = [AllowAny]
         else:
@@ -292,14 +675,20 @@ class EntregaViewSet(viewsets.ModelViewSet):
 
         if user.is_staff:
             return Entrega.objects.all()
-        if hasattr(user, "cliente"):
-            return Entrega.objects.filter(cliente=user.cliente)
-        if hasattr(user, "motorista"):
-            return Entrega.objects.filter(motorista=user.motorista)
+        papel = papel_do_usuario(user)
+        if papel.cliente:
+            return Entrega.objects.filter(cliente=papel.cliente_id)
+        if papel.motorista:
+            return Entrega.objects.filter(motorista=papel.motorista_id)
 
         return Entrega.objects.none()
     
-    
+    # repetições de POST/PUT/PATCH com a mesma Idempotency-Key não gravam de novo (idempotencia.py)
+    @idempotente
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @idempotente
     def update(self, request, *args, **kwargs):
         '''
         validar quem pode atualizar a entrega:
@@ -314,7 +703,8 @@ class EntregaViewSet(viewsets.ModelViewSet):
         if user.is_staff:
             return super().update(request, *args, **kwargs)
         
-        if hasattr(user, "motorista") and entrega.motorista == user.motorista:
+        papel = papel_do_usuario(user)
+        if papel.motorista and entrega.motorista_id == papel.motorista_id:
             return super().update(request, *args, **kwargs)
         
         return Response(
@@ -322,29 +712,218 @@ class EntregaViewSet(viewsets.ModelViewSet):
         )
     
 
+    @idempotente
     def partial_update(self, request, *args, **kwargs):
         '''
         a mesma validação do update(), porém para atualizações parcias (PATCH)
         '''
 
+        kwargs["partial"] = True
         return self.update(request, *args, **kwargs)
+
+    # mudanças de status gravadas pela API ficam no histórico com o autor (eventos.py)
+    def perform_create(self, serializer):
+        with autor_eventos(self.request.user):
+            serializer.save()
+
+    def perform_update(self, serializer):
+        with autor_eventos(self.request.user):
+            serializer.save()
+
+# ------------------- ação: LINHA DO TEMPO DA ENTREGA ----------------------
+    @action(detail=True, methods=["get"], url_path="linha-do-tempo")
+    def linha_do_tempo(self, request, pk=None):
+        """
+        Mudanças de status da entrega, em ordem, com o tempo que ela ficou em cada status.
+        """
+        entrega = self.get_object()
+        return Response({
+            "codigo_rastreio": entrega.codigo_rastreio,
+            "status": entrega.status,
+            "eventos": linha_do_tempo(entrega.codigo_rastreio),
+        })
+
+# ------------------- ação: FEED DE EVENTOS ----------------------
+    @action(detail=False, methods=["get"])
+    def eventos(self, request):
+        """
+        Eventos de status de todas as entregas com id maior que ?desde= (padrão 0), em
+        ordem, para sincronização incremental: guarde "proximo" e use-o no próximo ?desde=.
+        ?limite= (padrão 1000, até 10000); ?inicio= e ?fim= (ISO 8601) limitam o período.
+        """
+        params = request.query_params
+        try:
+            desde = int(params.get("desde", 0))
+            limite = max(1, min(int(params.get("limite", 1000)), LIMITE_FEED_EVENTOS))
+            inicio = parse_datetime(params["inicio"]) if params.get("inicio") else None
+            fim = parse_datetime(params["fim"]) if params.get("fim") else None
+        except ValueError:
+            inicio = fim = desde = None
+        if desde is None or (params.get("inicio") and inicio is None) or (params.get("fim") and fim is None):
+            return Response(
+                {"erro": "desde e limite devem ser inteiros; inicio e fim, datas no formato ISO 8601"},
+                status=400,
+            )
+
+        eventos, proximo = eventos_desde(desde, limite, inicio, fim)
+        return Response({"eventos": eventos, "proximo": proximo, "completo": len(eventos) < limite})
+
+# ------------------- ação: SINCRONIZAÇÃO INCREMENTAL ----------------------
+    @action(detail=False, methods=["get"])
+    def sincronizar(self, request):
+        """
+        Entregas, rotas e veículos do motorista gravados desde ?desde= (o "cursor"
+        da resposta anterior) e as chaves que saíram do escopo dele (excluídas ou
+        passadas a outro motorista). Sem ?desde=, ou com um cursor antigo demais,
+        devolve tudo com "reiniciar": true. O administrador recebe todos.
+        As linhas vêm em páginas de até ?limite= (padrão 1000, até 10000): enquanto
+        "completo" for false, peça ?proximo= com o "proximo" recebido; o "cursor" e
+        os "removidos" vêm na última página.
+        """
+        params = request.query_params
+        texto = params.get("desde")
+        try:
+            limite = max(1, min(int(params.get("limite", configuracao_sincronizacao()["LIMITE"])),
+                                LIMITE_SINCRONIZACAO))
+            desde = parse_datetime(texto) if texto else None
+            posicao = Posicao.decodificar(params["proximo"]) if params.get("proximo") else None
+        except ValueError:
+            limite = desde = posicao = None
+        if limite is None or (texto and desde is None):
+            return Response(
+                {"erro": "desde deve ser o cursor recebido (data no formato ISO 8601), proximo o "
+                         "recebido na página anterior e limite um inteiro"},
+                status=400,
+            )
+
+        motorista_id = None if request.user.is_staff else papel_do_usuario(request.user).motorista_id
+        alteracoes = alteracoes_desde(desde, motorista_id, limite, posicao)
+        linhas, removidos = alteracoes.linhas, alteracoes.removidos
+        return Response({
+            "cursor": alteracoes.cursor,
+            "reiniciar": alteracoes.reiniciar,
+            "completo": alteracoes.completo,
+            "proximo": alteracoes.proximo,
+            "entregas": EntregaSerializer(linhas[Entrega], many=True).data,
+            "rotas": RotaSincronizacaoSerializer(linhas[Rota], many=True).data,
+            "veiculos": VeiculoSerializer(linhas[Veiculo], many=True).data,
+            "removidos": {
+                "entregas": removidos[Entrega],
+                "rotas": removidos[Rota],
+                "veiculos": removidos[Veiculo],
+            },
+        })
+
+# ------------------- ação: CRIAÇÃO EM LOTE ----------------------
+    @action(detail=False, methods=["post"])
+    @idempotente
+    def lote(self, request):
+        """
+        Cria várias entregas de uma vez: {"entregas": [{...}, ...], "atualizar": false}.
+        A lista é validada inteira antes de gravar e cada item recebe seu resultado
+        (criada, atualizada ou rejeitada, com os erros); os aceitos são gravados
+        juntos mesmo que outros sejam rejeitados. Com "atualizar", códigos que já
+        existem são atualizados com os campos enviados em vez de rejeitados.
+        """
+        lista = request.data.get("entregas") if isinstance(request.data, dict) else None
+        if not isinstance(lista, list) or not lista:
+            return Response({"erro": "Envie 'entregas' com a lista de entregas"}, status=400)
+        if len(lista) > LIMITE_CRIACAO_LOTE:
+            return Response({"erro": f"No máximo {LIMITE_CRIACAO_LOTE} entregas por lote"}, status=400)
+
+        atualizar = str(request.data.get("atualizar", "")).lower() in ("1", "true", "sim")
+        with autor_eventos(request.user):
+            resultado = gravar_lote(lista, atualizar=atualizar)
+        return Response(resultado.resumo())
+
+# ------------------- ação: STATUS EM LOTE ----------------------
+    @action(detail=False, methods=["post"], url_path="status")
+    @idempotente
+    def status_lote(self, request):
+        """
+        Altera o status de várias entregas de uma vez:
+        {"entregas": [{"codigo_rastreio": "ENT...", "status": "E", "data_entrega_real": "AAAA-MM-DD"}]}.
+        O motorista só altera as próprias entregas; a rota em que todas as entregas
+        ficam entregues ou canceladas é concluída (rotas_concluidas na resposta).
+        """
+        lista = request.data.get("entregas") if isinstance(request.data, dict) else None
+        if not isinstance(lista, list) or not lista or len(lista) > LIMITE_LOTE_ENTREGAS:
+            return Response(
+                {"erro": f"Envie 'entregas' com uma lista de até {LIMITE_LOTE_ENTREGAS} entregas"}, status=400
+            )
+
+        motorista_id = None if request.user.is_staff else papel_do_usuario(request.user).motorista_id
+        with autor_eventos(request.user):
+            resultado = gravar_status(lista, motorista_id)
+        return Response(resultado.resumo())
+
+# ------------------- ação: ZONAS DAS ENTREGAS PENDENTES ----------------------
+    @action(detail=False, methods=["get"])
+    def zonas(self, request):
+        """
+        Agrupa as entregas pendentes sem rota em até k zonas (?k=, padrão 5, até 50)
+        pelo destino; ?data=AAAA-MM-DD limita às previstas até a data.
+        """
+        data_texto = request.query_params.get("data")
+        try:
+            k = min(int(request.query_params.get("k", 5)), 50)
+            data = parse_date(data_texto) if data_texto else None
+        except ValueError:
+            k, data = None, None
+        if k is None or k < 1 or (data_texto and data is None):
+            return Response({"erro": "Informe k (número de zonas) e data no formato AAAA-MM-DD"}, status=400)
+
+        pendentes = Entrega.objects.filter(status="P", rota__isnull=True)
+        if data:
+            pendentes = pendentes.filter(data_entrega_prevista__lte=data)
+        zonas, sem_coordenadas = zonas_de_entregas(pendentes, k)
+        return Response({"zonas": zonas, "sem_coordenadas": sem_coordenadas})
     
 
 
 @api_view(['GET'])
 def rota_dashboard(request, pk):
+    # Consultado a cada poucos segundos pelas telas de despacho: a resposta
+    # fica em cache até a próxima gravação que afete a rota (ver signals.py).
+    # A versão do cache é também a ETag: quem já tem a versão atual recebe 304
+    versao = versao_dashboard(pk)
+    chave = chave_dashboard(pk, versao)
+
+    def montar():
+        cache = cache_dashboard()
+        data = cache.get(chave)
+        if data is None:
+            data = montar_dashboard(pk)
+            if data is None:
+                return Response({"error": "Rota não encontrada"}, status=404)
+            cache.set(chave, data)
+        return Response(data)
+
+    return responder_condicional(request, validadores(request, chave, modificado_em=versao / 1e9), montar)
+
+
+def montar_dashboard(pk):
     try:
-        rota = Rota.objects.get(pk=pk)
+        rota = (
+            Rota.objects
+            .select_related('motorista', 'veiculo')
+            .prefetch_related(Prefetch(
+                'entrega_set',
+                queryset=Entrega.objects.select_related('cliente').order_by('ordem_parada', 'codigo_rastreio')
+            ))
+            .annotate(capacidade_utilizada=Coalesce(Sum('entrega__capacidade_necessaria'), 0))
+            .get(pk=pk)
+        )
     except Rota.DoesNotExist:
-        return Response({"error": "Rota não encontrada"}, status=404)
+        return None
 
     # Serializa a rota básica (motorista, veículo)
     serializer = RotaDashboardSerializer(rota)
-    data = serializer.data
+    data = dict(serializer.data)
 
-    # Calcula capacidade utilizada e disponível
-    entregas = rota.entrega_set.select_related('cliente').all()
-    capacidade_utilizada = sum(e.capacidade_necessaria for e in entregas)
+    # Capacidade utilizada vem somada do banco; entregas já carregadas pelo prefetch
+    entregas = rota.entrega_set.all()
+    capacidade_utilizada = rota.capacidade_utilizada
     capacidade_disponivel = rota.veiculo.capacidade_maxima - capacidade_utilizada
 
     # Monta lista de entregas detalhadas
@@ -352,6 +931,7 @@ def rota_dashboard(request, pk):
     for e in entregas:
         entregas_detalhadas.append({
             "codigo_rastreio": e.codigo_rastreio,
+            "ordem_parada": e.ordem_parada,
             "status": e.status,
             "capacidade_necessaria": e.capacidade_necessaria,
             "endereco_origem": e.endereco_origem,
@@ -378,7 +958,41 @@ def rota_dashboard(request, pk):
     data['capacidade_disponivel'] = capacidade_disponivel
     data['entregas'] = entregas_detalhadas
 
-    return Response(data)
+    return data
+
+
+
+# ------------------- RASTREIO PÚBLICO ------------------------
+# Consulta mais frequente da API. Fica fora do DRF (sem autenticação,
+# filtros, paginação ou serializador) e devolve só o necessário para
+# acompanhar a entrega, direto de values() e do cache em memória.
+CAMPOS_RASTREIO = ("codigo_rastreio", "status", "data_entrega_prevista", "data_entrega_real")
+
+
+def consultar_rastreio(codigo):
+    entrega = Entrega.objects.filter(codigo_rastreio=codigo).values(*CAMPOS_RASTREIO).first()
+    if entrega is None:
+        return 404, json.dumps({"erro": "Entrega não encontrada"}).encode()
+
+    entrega["status_descricao"] = Entrega.Status_entrega(entrega["status"]).label
+    return 200, json.dumps(entrega, cls=DjangoJSONEncoder).encode()
+
 
+@require_GET
+def rastreio(request, codigo):
+    status, corpo = buscar_rastreio(codigo, consultar_rastreio)
+    return HttpResponse(corpo, status=status, content_type="application/json")
 
 
+@require_GET
+def metricas(request):
+    # só para o coletor do Prometheus: com ENTREGAS_METRICAS['TOKEN'], quem envia
+    # "Authorization: Bearer <TOKEN>"; sem ele, os IPS_PERMITIDOS (a própria máquina)
+    config = configuracao_metricas()
+    if config["TOKEN"]:
+        enviado = request.META.get("HTTP_AUTHORIZATION", "")
+        if not hmac.compare_digest(enviado.encode(), f"Bearer {config['TOKEN']}".encode()):
+            return HttpResponse(status=404)
+    elif request.META.get("REMOTE_ADDR") not in config["IPS_PERMITIDOS"]:
+        return HttpResponse(status=404)
+    return HttpResponse(formato_texto(agregar()), content_type="text/plain; version=0.0.4; charset=utf-8")
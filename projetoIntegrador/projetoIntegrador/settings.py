@@ -52,6 +52,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # latência, consultas e erros por view/ação para o /metricas/ (Prometheus)
+    'entregas.metricas.MetricasMiddleware',
+    # tempo, consultas SQL e serialização por requisição (Server-Timing e log)
+    'entregas.instrumentacao.InstrumentacaoMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -136,7 +140,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     # Autenticação padrão
     'DEFAULT_AUTHENTICATION_CLASSES': [
-    'rest_framework.authentication.TokenAuthentication',
+    'entregas.authentication.TokenAuthenticationCache',
     'rest_framework.authentication.SessionAuthentication',
     ],
     # Permissão padrão
@@ -178,4 +182,126 @@ SPECTACULAR_SETTINGS = {
     },
     },
     },
-}
\ No newline at end of file
+}
+
+# Cache do dashboard das rotas (entregas/cache.py)
+# BACKEND: "memoria" (por processo), "arquivo" ou "django" (settings.CACHES).
+# O "arquivo" grava JSON em BASE_DIR/cache (ou OPCOES["diretorio"]), criado
+# só para o usuário do servidor; o diretório é recusado se for de outro
+# usuário ou se outros puderem gravar nele.
+# Os dashboards podem ficar na memória de cada processo; as versões (em
+# VERSOES) precisam de um backend visto por todos: "arquivo" vale para os
+# workers da máquina, com vários servidores use "django".
+ENTREGAS_CACHE_DASHBOARD = {
+    'BACKEND': 'memoria',
+    'OPCOES': {'tamanho_maximo': 1024, 'ttl': 300},
+    'VERSOES': {'BACKEND': 'arquivo'},
+}
+
+# Cache em memória do rastreio público (/rastreio/<codigo>/), por processo.
+# É invalidado a cada gravação da entrega; o TTL limita quanto tempo outros
+# processos podem responder com a versão anterior.
+ENTREGAS_CACHE_RASTREIO = {'tamanho_maximo': 100_000, 'ttl': 30}
+
+# Cache de tokens da autenticação (entregas/authentication.py): usuário e
+# papel de cada token. Mesmos backends de ENTREGAS_CACHE_DASHBOARD. As
+# entradas podem ficar na memória de cada processo; a versão (em VERSAO),
+# trocada quando um token é excluído ou um usuário muda, precisa ser vista
+# por todos: "arquivo" na mesma máquina, "django" com vários servidores.
+# As entradas guardam o usuário (objeto): BACKEND "memoria" ou "django".
+ENTREGAS_CACHE_TOKENS = {
+    'BACKEND': 'memoria',
+    'OPCOES': {'tamanho_maximo': 10_000, 'ttl': 60},
+    'VERSAO': {'BACKEND': 'arquivo'},
+}
+
+# Roteirização das rotas (entregas/roteirizacao.py): sequência de paradas,
+# km e tempo estimados, recalculados quando as entregas da rota mudam
+ENTREGAS_ROTEIRIZACAO = {
+    'AUTOMATICA': True,
+    'DEPOSITO': None,               # (latitude, longitude) de saída das rotas
+    'FATOR_RODOVIARIO': 1.3,
+    'VELOCIDADE_MEDIA_KMH': 30,
+    'MINUTOS_POR_PARADA': 5,
+}
+# Tabela CEP -> coordenadas (padrão: entregas/dados/ceps.csv)
+# ENTREGAS_TABELA_CEP = '/caminho/para/ceps.csv'
+# Centroides de cidades e bairros (padrão: entregas/dados/localidades.csv)
+# ENTREGAS_TABELA_LOCALIDADES = '/caminho/para/localidades.csv'
+
+# Índice espacial dos veículos (entregas/espacial.py): grade em memória de
+# cada processo, recarregada do banco após IDADE_MAXIMA segundos
+ENTREGAS_INDICE_ESPACIAL = {
+    'TAMANHO_CELULA': 0.05,         # graus
+    'IDADE_MAXIMA': 60,
+}
+
+# Telemetria dos veículos (entregas/telemetria.py): pontos acumulados em
+# memória e gravados em lote a cada LOTE pontos ou INTERVALO_MS
+ENTREGAS_TELEMETRIA = {
+    'LOTE': 2000,
+    'INTERVALO_MS': 1000,
+    'PONTOS_POR_VEICULO': 1000,     # fila circular por veículo
+}
+
+# Sincronização incremental dos aplicativos (entregas/sincronizacao.py).
+# Cada consulta relê MARGEM_SEGUNDOS antes do cursor (transações que
+# confirmam depois da leitura); remoções ficam guardadas RETENCAO_DIAS
+# (manage.py limpar_remocoes) e cursores mais antigos recebem tudo de novo.
+# As respostas vêm em páginas de LIMITE linhas (?limite= muda por requisição)
+ENTREGAS_SINCRONIZACAO = {
+    'MARGEM_SEGUNDOS': 5,
+    'RETENCAO_DIAS': 30,
+    'LIMITE': 1000,
+}
+
+# Idempotency-Key nas gravações (entregas/idempotencia.py): respostas
+# guardadas por TTL segundos para as repetições da mesma chave. Mesmos
+# backends de ENTREGAS_CACHE_DASHBOARD. "arquivo" vale para todos os workers
+# da máquina; com vários servidores use "django" (um cache compartilhado).
+# Não use "memoria" com mais de um processo: a repetição que cai em outro
+# worker não encontra a chave e grava de novo
+ENTREGAS_IDEMPOTENCIA = {
+    'BACKEND': 'arquivo',
+    'OPCOES': {'diretorio': None, 'ttl': 24 * 3600},     # padrão: BASE_DIR/cache
+    'ESPERA_SEGUNDOS': 10,          # repetições concorrentes esperam a primeira
+}
+
+# Instrumentação das requisições (entregas/instrumentacao.py): fração das
+# requisições medidas (tempo total, consultas SQL e repetidas, serialização),
+# com o cabeçalho Server-Timing e uma linha JSON no logger
+# "entregas.instrumentacao" (WARNING se lenta ou com consultas repetidas)
+ENTREGAS_INSTRUMENTACAO = {
+    'AMOSTRAGEM': 1.0 if DEBUG else 0.01,
+    'CABECALHO': True,
+    'LIMITE_REPETICOES': 3,         # mesmo SELECT n vezes: provável N+1
+    'LENTA_MS': 1000,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'entregas': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# Métricas no formato do Prometheus em /metricas/ (entregas/metricas.py).
+# Cada processo grava as suas séries em um arquivo em DIRETORIO a cada
+# INTERVALO_GRAVACAO segundos; o endpoint soma os de todos os processos,
+# então DIRETORIO deve ser o mesmo para todos os workers da máquina. Os
+# arquivos de processos encerrados há RETENCAO_HORAS vão para um acumulado.
+# O acesso é liberado pelo REMOTE_ADDR: atrás de um proxy reverso na mesma
+# máquina (nginx -> gunicorn) toda requisição chega de 127.0.0.1 e passaria.
+# Nesse caso defina TOKEN (o Prometheus envia Authorization: Bearer <TOKEN>,
+# bearer_token na configuração do scrape), que substitui a lista de IPs
+ENTREGAS_METRICAS = {
+    'DIRETORIO': None,              # padrão: <tmp>/entregas-metricas
+    'INTERVALO_GRAVACAO': 5,
+    'RETENCAO_HORAS': 24,
+    'IPS_PERMITIDOS': ('127.0.0.1', '::1'),
+    'TOKEN': None,
+}
@@ -5,7 +5,7 @@ from entregas.auth_views import CustomAuthToken
 
 from entregas.views import (
     EntregaViewSet, MotoristaViewSet, ClienteViewSet,
-    RotaViewSet, VeiculoViewSet, rota_dashboard
+    RotaViewSet, VeiculoViewSet, rota_dashboard, rastreio, metricas
 )
 
 from drf_spectacular.views import (
@@ -35,6 +35,12 @@ urlpatterns = [
     # Dashboard da rota
     path('rotas/<int:pk>/dashboard/', rota_dashboard, name='rota-dashboard'),
 
+    # Rastreio público (sem autenticação)
+    path('rastreio/<str:codigo>/', rastreio, name='rastreio'),
+
+    # Métricas no formato do Prometheus (só de IPs locais)
+    path('metricas/', metricas, name='metricas'),
+
     # Documentação da API
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),